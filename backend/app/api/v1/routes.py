@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, B
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import hashlib
 import uuid
 import json
 
@@ -9,7 +11,8 @@ from app.core.db import get_db
 from app.models.user import User
 from app.api.auth import fastapi_users, current_user
 from app.services.ai_detection import AIDetectionService
-from app.services.plagiarism import PlagiarismService
+from app.services.plagiarism import PlagiarismService, COMPARE_STRATEGIES
+from app.services.retrieval_pipeline import PipelineConfig
 
 router = APIRouter()
 ai_service = AIDetectionService()
@@ -35,6 +38,8 @@ async def analyze_content(
     library_ids: str = Form(default='[]'),
     whitelist_ids: str = Form(default='[]'),
     compare_mode: str = Form(default='library'),
+    compare_strategy: str = Form(default='chunk'),
+    pipeline: str = Form(default='{}'),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(current_user),
 ):
@@ -58,6 +63,15 @@ async def analyze_content(
     if compare_mode not in ["library", "internal", "both"]:
         compare_mode = "library"
 
+    if compare_strategy not in COMPARE_STRATEGIES:
+        compare_strategy = "chunk"
+
+    # 检索流水线的批次级覆盖配置（各阶段 limit / threshold / time_budget），非法项忽略
+    try:
+        pipeline_overrides = PipelineConfig.normalize(json.loads(pipeline)) or None
+    except Exception:
+        pipeline_overrides = None
+
     if not files and not text:
         raise HTTPException(status_code=400, detail="必须提供文件或文本")
 
@@ -82,7 +96,9 @@ async def analyze_content(
         analysis_type=analysis_type,
         ai_threshold=opts.ai_threshold,
         compare_mode=compare_mode,
+        compare_strategy=compare_strategy,
         whitelist_ids=parsed_whitelist_ids,
+        retrieval_pipeline=pipeline_overrides,
     )
     db.add(batch)
 
@@ -106,8 +122,11 @@ async def analyze_content(
             filename="input_text.txt",
             storage_path=f"{batch_id}/input_text.txt",
             text_content=text,
+            content_hash=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            text_hash=PlagiarismService.text_hash(text),
             status="queued",
         )
+        PlagiarismService.apply_simhash(doc, text)
         db.add(doc)
         docs_to_process.append(doc)
 
@@ -128,8 +147,11 @@ async def analyze_content(
             filename=file.filename,
             storage_path=storage_path,
             text_content=text_content,
+            content_hash=hashlib.sha256(content).hexdigest(),
+            text_hash=PlagiarismService.text_hash(text_content),
             status="queued",
         )
+        PlagiarismService.apply_simhash(doc, text_content)
         db.add(doc)
         docs_to_process.append(doc)
 
@@ -174,6 +196,7 @@ async def list_user_batches(
                 "status": b.status,
                 "analysis_type": b.analysis_type,
                 "compare_mode": b.compare_mode,
+                "compare_strategy": b.compare_strategy,
             }
             for b in batches
         ]
@@ -195,10 +218,11 @@ async def detect_ai_only(
 ):
     """直接对文本进行 AI 检测"""
     if not ai_service.is_available:
-        raise HTTPException(status_code=503, detail="AI 检测未启用：未配置 AI API")
+        raise HTTPException(status_code=503, detail="AI 检测不可用：未配置 AI API 或 API 熔断中")
 
     try:
-        ai_result = ai_service.detect(text, threshold=threshold)
+        # 同步 API 调用（含限流等待）放到线程中执行，不阻塞事件循环
+        ai_result = await asyncio.to_thread(ai_service.detect, text, threshold=threshold)
         return {"data": ai_result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI检测失败: {str(e)}")
@@ -283,6 +307,7 @@ async def get_batch_results(
                 "similar_document": lib_doc_name,
                 "similarity": comp.similarity,
                 "matches": comp.matches or [],
+                "passages": comp.passages or [],
                 "source_type": "library",
                 "library_name": library_name,
             })
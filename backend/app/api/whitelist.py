@@ -10,6 +10,7 @@ from app.core.db import get_db
 from app.models.user import User
 from app.models.whitelist import WhitelistCollection, WhitelistItem
 from app.api.auth import current_user, mod_or_admin_user
+from app.services.whitelist_cache import WhitelistCache
 
 
 router = APIRouter(prefix="/whitelist")
@@ -156,13 +157,16 @@ async def add_item(
     if not body.content.strip():
         raise HTTPException(status_code=400, detail="白名单内容不能为空")
 
+    content = body.content.strip()
     item = WhitelistItem(
         id=uuid.uuid4(),
         collection_id=collection_id,
-        content=body.content.strip(),
+        content=content,
         label=body.label.strip(),
+        fingerprint=WhitelistCache.fingerprint(content),
     )
     db.add(item)
+    await WhitelistCache.bump_version(db, collection_id)
     await db.commit()
     await db.refresh(item)
 
@@ -191,15 +195,19 @@ async def add_items_batch(
     for entry in body.items:
         if not entry.content.strip():
             continue
+        content = entry.content.strip()
         item = WhitelistItem(
             id=uuid.uuid4(),
             collection_id=collection_id,
-            content=entry.content.strip(),
+            content=content,
             label=entry.label.strip(),
+            fingerprint=WhitelistCache.fingerprint(content),
         )
         db.add(item)
         created.append(item)
 
+    if created:
+        await WhitelistCache.bump_version(db, collection_id)
     await db.commit()
     return {"message": f"成功添加 {len(created)} 个条目"}
 
@@ -217,5 +225,6 @@ async def delete_item(
         raise HTTPException(status_code=404, detail="白名单条目不存在")
 
     await db.delete(item)
+    await WhitelistCache.bump_version(db, collection_id)
     await db.commit()
     return {"message": "删除成功"}
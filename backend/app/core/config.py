@@ -22,6 +22,45 @@ class Settings(BaseSettings):
     AI_API_BASE_URL: Optional[str] = os.getenv("AI_API_BASE_URL")  # 留空则使用 OpenAI 官方地址
     AI_CHAT_MODEL: str = os.getenv("AI_CHAT_MODEL", "gpt-3.5-turbo")
     AI_EMBEDDING_MODEL: str = os.getenv("AI_EMBEDDING_MODEL", "text-embedding-3-small")
+    # 进程内共享的 API 客户端：连接池大小与请求超时（秒）
+    AI_MAX_CONNECTIONS: int = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+    AI_TIMEOUT: float = float(os.getenv("AI_TIMEOUT", "60"))
+    # 令牌桶限流：每秒请求数（0 表示不限）与突发容量
+    AI_RATE_LIMIT: float = float(os.getenv("AI_RATE_LIMIT", "0"))
+    AI_RATE_BURST: int = int(os.getenv("AI_RATE_BURST", "10"))
+    # 熔断：连续失败次数达到阈值后熔断，熔断期（秒）内直接降级为纯文本模式
+    AI_CIRCUIT_FAILURES: int = int(os.getenv("AI_CIRCUIT_FAILURES", "5"))
+    AI_CIRCUIT_RESET: float = float(os.getenv("AI_CIRCUIT_RESET", "30"))
+    # Embedding 后端：api（OpenAI 兼容 API）、local（本地字符 n-gram 哈希投影，离线部署可用）、
+    # auto（配置了 AI_API_KEY 时用 api，否则用 local）
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "api")
+    # 向量维度（数据库列与 hnsw 索引按此建立）：模型输出更长时截取前若干维并重新归一化（Matryoshka 截断）。
+    # 与数据库现有列的维度不同时，默认拒绝启动；设置 EMBEDDING_DIM_MIGRATE=true 才会清空旧向量并按新维度重建列，
+    # 之后文档库需重新导入
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "384"))
+    EMBEDDING_DIM_MIGRATE: bool = os.getenv("EMBEDDING_DIM_MIGRATE", "false").lower() in ("1", "true", "yes")
+    # hnsw 索引精度：full（vector）、half（halfvec 表达式索引）、bit（二值量化表达式索引）；
+    # half / bit 需要 pgvector >= 0.7，索引取回后按表中全精度向量重排
+    EMBEDDING_INDEX_PRECISION: str = os.getenv("EMBEDDING_INDEX_PRECISION", "full")
+    # 文档 chunk 向量的存储精度：float32、float16、int8（每行一个缩放系数）
+    EMBEDDING_BLOB_PRECISION: str = os.getenv("EMBEDDING_BLOB_PRECISION", "float32")
+    # chunk 向量缓存：进程内 LRU 条目数，以及 Redis 中的过期时间（秒，0 表示不过期）。
+    # EMBEDDING_CACHE_URL 应指向独立的 Redis 实例（配置 maxmemory 与 allkeys-lru 淘汰），
+    # 不要与 Celery broker 共用，否则缓存写满内存会影响任务队列；留空时只使用进程内缓存
+    EMBEDDING_CACHE_URL: str = os.getenv("EMBEDDING_CACHE_URL", "")
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_TTL: int = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))
+    # Embedding 请求：每个子批次的估计 token 数与条数上限、并发请求数、429/5xx 的最大重试次数
+    EMBEDDING_BATCH_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+    EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+    # 精确对比执行器：process（多进程，充分利用多核）或 thread；并发数为 0 时取可用 CPU 核数
+    COMPARE_EXECUTOR: str = os.getenv("COMPARE_EXECUTOR", "process")
+    COMPARE_WORKERS: int = int(os.getenv("COMPARE_WORKERS", "0"))
+    # 单次文档对比的内存上限（MB）：预计超出时改用流式对比（一侧建索引，另一侧逐块读取）；0 表示不限制
+    COMPARE_MEMORY_LIMIT_MB: int = int(os.getenv("COMPARE_MEMORY_LIMIT_MB", "256"))
 
     # Celery settings
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
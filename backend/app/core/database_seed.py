@@ -8,6 +8,8 @@ from app.core.config import settings
 from app.models.user import User
 from app.models.system_settings import SystemSettings
 from app.models.base import Base
+from app.services import filtered_ann
+from app.services.library_backfill import backfill_library_documents
 from passlib.context import CryptContext
 
 # Password hashing context
@@ -39,6 +41,17 @@ async def create_user(session: AsyncSession, email: str, password: str, role: st
     await session.refresh(user)
     return user
 
+class EmbeddingDimensionMismatch(RuntimeError):
+    """数据库向量列维度与 EMBEDDING_DIM 不一致且未允许迁移"""
+
+
+def _embedding_indexes(table: str) -> dict:
+    """各精度的 hnsw 索引名：full 沿用原索引名，half / bit 加后缀"""
+    return {
+        variant: f"idx_{table}_embedding" + ("" if variant == "full" else f"_{variant}")
+        for variant in filtered_ann.RERANK_FACTOR
+    }
+
 async def seed_database():
     """Seed the database with initial admin and sample users"""
     print("Seeding database...")
@@ -55,10 +68,33 @@ async def seed_database():
             alter_statements = [
                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS display_name VARCHAR",
                 "ALTER TABLE batches ADD COLUMN IF NOT EXISTS compare_mode VARCHAR DEFAULT 'library'",
+                "ALTER TABLE batches ADD COLUMN IF NOT EXISTS compare_strategy VARCHAR DEFAULT 'chunk'",
                 "ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS source_type VARCHAR DEFAULT 'internal'",
                 "ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS library_id UUID",
                 "ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS library_doc_id UUID",
                 "ALTER TABLE comparisons ALTER COLUMN doc_b DROP NOT NULL",
+                "ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS passages JSON",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS minhash BYTEA",
+                "ALTER TABLE whitelist_collections ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+                "ALTER TABLE whitelist_items ADD COLUMN IF NOT EXISTS fingerprint BYTEA",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS text_hash VARCHAR",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS text_hash VARCHAR",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash BIGINT",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_b0 INTEGER",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_b1 INTEGER",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_b2 INTEGER",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_b3 INTEGER",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS simhash BIGINT",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS simhash_b0 INTEGER",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS simhash_b1 INTEGER",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS simhash_b2 INTEGER",
+                "ALTER TABLE library_documents ADD COLUMN IF NOT EXISTS simhash_b3 INTEGER",
+                "ALTER TABLE batches ADD COLUMN IF NOT EXISTS retrieval_pipeline JSON",
+                "ALTER TABLE system_settings ADD COLUMN IF NOT EXISTS retrieval_pipeline JSON",
+                "ALTER TABLE library_document_chunks ADD COLUMN IF NOT EXISTS library_id UUID",
+                f"ALTER TABLE library_document_chunks ADD COLUMN IF NOT EXISTS embedding vector({settings.EMBEDDING_DIM})",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_embeddings BYTEA",
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_model VARCHAR",
             ]
             for stmt in alter_statements:
                 try:
@@ -66,14 +102,82 @@ async def seed_database():
                 except Exception:
                     pass  # 字段已存在或表不存在时忽略
 
-            # 创建 hnsw 向量索引
+            # 向量维度（EMBEDDING_DIM）变化时旧向量无法转换，只能清空后按新维度重建列（索引随后按新维度创建）。
+            # 清空不可恢复，必须显式设置 EMBEDDING_DIM_MIGRATE=true，否则拒绝启动
+            dim = settings.EMBEDDING_DIM
+            changed = {}
+            for table in ("documents", "library_documents", "library_document_chunks"):
+                result = await conn.execute(text(
+                    "SELECT atttypmod FROM pg_attribute "
+                    "WHERE attrelid = to_regclass(:table) AND attname = 'embedding' AND NOT attisdropped"
+                ), {"table": table})
+                current = result.scalar()
+                if current is None or current == dim:
+                    continue
+                result = await conn.execute(text(f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL"))
+                changed[table] = (current, result.scalar())
+                print(f"{table}.embedding 维度 {current} -> {dim}，将清空 {changed[table][1]} 行向量")
+            if changed and not settings.EMBEDDING_DIM_MIGRATE:
+                raise EmbeddingDimensionMismatch(
+                    f"EMBEDDING_DIM={dim} 与数据库向量列维度不一致（"
+                    + "，".join(f"{t}: {d}，{n} 行有向量" for t, (d, n) in changed.items())
+                    + "）。改回原维度，或设置 EMBEDDING_DIM_MIGRATE=true 清空旧向量后按新维度重建（文档库需重新导入）"
+                )
+            for table, (current, count) in changed.items():
+                for index in _embedding_indexes(table).values():
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+                await conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN embedding TYPE vector({dim}) USING NULL"))
+                print(f"{table}.embedding 维度 {current} -> {dim}，已清空 {count} 行旧向量，文档库需重新导入以生成新向量")
+
+            # hnsw 向量索引（文档级与 chunk 级），精度由 EMBEDDING_INDEX_PRECISION 决定，删除其余精度的索引。
+            # 每条语句用保存点隔离：pgvector 版本不支持 halfvec / bit 索引时只跳过该索引
+            precision = filtered_ann.index_precision(settings.EMBEDDING_INDEX_PRECISION)
+            for table in ("library_documents", "library_document_chunks"):
+                for variant, index in _embedding_indexes(table).items():
+                    if variant == precision:
+                        key, ops = filtered_ann.index_key("embedding", variant, dim)
+                        stmt = f"CREATE INDEX IF NOT EXISTS {index} ON {table} USING hnsw ({key} {ops})"
+                    else:
+                        stmt = f"DROP INDEX IF EXISTS {index}"
+                    try:
+                        async with conn.begin_nested():
+                            await conn.execute(text(stmt))
+                    except Exception as e:
+                        print(f"向量索引 {index} 处理失败: {e}")
+
+            # 历史文档补建 MinHash 签名时按主键分批扫描使用的部分索引（替换原先按文档库的版本）
             try:
+                await conn.execute(text("DROP INDEX IF EXISTS idx_library_documents_minhash_missing"))
                 await conn.execute(text(
-                    "CREATE INDEX IF NOT EXISTS idx_library_documents_embedding "
-                    "ON library_documents USING hnsw (embedding vector_cosine_ops)"
+                    "CREATE INDEX IF NOT EXISTS idx_library_documents_minhash_pending "
+                    "ON library_documents (id) WHERE minhash IS NULL"
                 ))
             except Exception:
-                pass  # 表还不存在时忽略
+                pass
+            try:
+                await conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_library_documents_simhash_pending "
+                    "ON library_documents (id) WHERE simhash IS NULL"
+                ))
+            except Exception:
+                pass
+            try:
+                await conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_library_documents_text_hash_pending "
+                    "ON library_documents (id) WHERE text_hash IS NULL"
+                ))
+            except Exception:
+                pass
+
+            # 精确重复判定（原始字节哈希、规范化文本哈希）与 SimHash 近似重复的 band 查找
+            for table in ("documents", "library_documents"):
+                for column in ("content_hash", "text_hash", "simhash_b0", "simhash_b1", "simhash_b2", "simhash_b3"):
+                    try:
+                        await conn.execute(text(
+                            f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})"
+                        ))
+                    except Exception:
+                        pass
 
         # Create session
         async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -126,8 +230,15 @@ async def seed_database():
                 print("Created default system settings")
 
             await session.commit()
+
+            # 升级前导入的文档库文档一次性补建检索签名（按主键分批提交，内存与文档库规模无关）
+            filled = await backfill_library_documents(session)
+            if filled:
+                print(f"已为 {filled} 篇文档库文档补建检索签名")
             print("Database seeding completed!")
 
+    except EmbeddingDimensionMismatch:
+        raise
     except Exception as e:
         print(f"Error during database seeding: {str(e)}")
         return
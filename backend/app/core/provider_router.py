@@ -1,13 +1,132 @@
+import asyncio
 import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 
+class CircuitOpenError(RuntimeError):
+    """熔断期内拒绝调用 API"""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """服务端不可用类错误（连接/超时、429、5xx）：可重试，且计入熔断"""
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class TokenBucket:
+    """
+    令牌桶限流，进程内所有线程与协程共享。取令牌时直接预约（令牌数可为负），
+    返回需要等待的秒数，因此等待期间不持有锁，也不依赖某个事件循环。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后熔断 reset_timeout 秒，熔断期内调用方直接降级。
+    熔断期结束后放行请求（半开）：成功则清零，再次失败立即重新熔断。
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+
+    def record_failure(self) -> None:
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if not self.is_open:
+                    logger.warning(f"AI API 连续失败 {self.failures} 次，熔断 {self.reset_timeout}s，期间降级为纯文本模式")
+                self.open_until = time.monotonic() + self.reset_timeout
+
+
+# 进程级共享状态：客户端注册表（复用连接池与 TLS 会话）、限流器与熔断器。
+# 异步客户端的连接绑定在创建它的事件循环上，因此按事件循环分别缓存（Celery 任务每次 asyncio.run 新建循环），
+# 短生命周期的事件循环结束前需调用 close_async_clients 关闭连接
+_registry_lock = threading.Lock()
+_sync_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, Optional[str]], Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+_limiter = TokenBucket(settings.AI_RATE_LIMIT, settings.AI_RATE_BURST)
+_breaker = CircuitBreaker(settings.AI_CIRCUIT_FAILURES, settings.AI_CIRCUIT_RESET)
+_local_embedder = None
+
+
+async def close_async_clients() -> None:
+    """关闭当前事件循环创建的异步客户端（Celery 任务结束、事件循环关闭前调用）"""
+    with _registry_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"关闭 AI API 异步客户端失败: {e}")
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=settings.AI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_MAX_CONNECTIONS,
+    )
+
+
 class ProviderRouter:
     """
     检查 AI API 是否已配置。
     统一使用 OpenAI 兼容格式的 API（可对接任意兼容服务）。
+    各服务各自创建的实例共享同一组长连接客户端、限流器和熔断器。
     """
 
     def __init__(self):
@@ -15,21 +134,106 @@ class ProviderRouter:
         self.base_url = settings.AI_API_BASE_URL
         self.chat_model = settings.AI_CHAT_MODEL
         self.embedding_model = settings.AI_EMBEDDING_MODEL
+        if self.use_local_embedding:
+            from app.services.local_embedding import MODEL_NAME
+            self.embedding_model = MODEL_NAME
 
     @property
-    def is_available(self) -> bool:
+    def is_configured(self) -> bool:
         return bool(self.api_key)
 
-    def get_openai_client(self):
-        """返回一个 OpenAI 兼容的客户端实例"""
-        if not self.is_available:
+    @property
+    def is_available(self) -> bool:
+        """已配置且未熔断；熔断期内调用方应直接走纯文本模式"""
+        return self.is_configured and not _breaker.is_open
+
+    @property
+    def circuit_open(self) -> bool:
+        return _breaker.is_open
+
+    @property
+    def embedding_backend(self) -> str:
+        backend = (settings.EMBEDDING_BACKEND or "api").lower()
+        if backend == "auto":
+            return "api" if self.is_configured else "local"
+        return "local" if backend == "local" else "api"
+
+    @property
+    def use_local_embedding(self) -> bool:
+        return self.embedding_backend == "local"
+
+    @property
+    def embedding_available(self) -> bool:
+        """本地后端始终可用；API 后端与 is_available 相同"""
+        return self.use_local_embedding or self.is_available
+
+    def get_local_embedder(self):
+        """本地向量编码器（进程内共享，投影矩阵只生成一次）"""
+        global _local_embedder
+        if _local_embedder is None:
+            from app.services.local_embedding import LocalEmbedder
+            _local_embedder = LocalEmbedder()
+        return _local_embedder
+
+    def _check(self) -> None:
+        if not self.is_configured:
             raise ValueError("AI API 未配置，请设置 AI_API_KEY 环境变量。")
+        if _breaker.is_open:
+            raise CircuitOpenError("AI API 熔断中，暂不发起请求")
+
+    def get_openai_client(self):
+        """返回进程内共享的 OpenAI 兼容客户端（线程安全，复用连接池）"""
+        self._check()
+        key = (self.api_key, self.base_url)
+        with _registry_lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                from openai import DefaultHttpxClient, OpenAI
+                client = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url or None,
+                    timeout=settings.AI_TIMEOUT,
+                    http_client=DefaultHttpxClient(limits=_http_limits()),
+                )
+                _sync_clients[key] = client
+        return client
+
+    def get_async_openai_client(self):
+        """返回当前事件循环内共享的 OpenAI 兼容异步客户端（重试由调用方控制；调用方不应关闭，见 close_async_clients）"""
+        self._check()
+        key = (self.api_key, self.base_url)
+        loop = asyncio.get_running_loop()
+        with _registry_lock:
+            clients = _async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+                client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url or None,
+                    timeout=settings.AI_TIMEOUT,
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(limits=_http_limits()),
+                )
+                clients[key] = client
+        return client
+
+    async def acquire(self) -> None:
+        """每次请求前取令牌（异步）；熔断期内抛出 CircuitOpenError"""
+        await _limiter.acquire()
+        self._check()
+
+    def acquire_sync(self) -> None:
+        _limiter.acquire_sync()
+        self._check()
+
+    def record_success(self) -> None:
+        _breaker.record_success()
 
-        from openai import OpenAI
-        kwargs = {"api_key": self.api_key}
-        if self.base_url:
-            kwargs["base_url"] = self.base_url
-        return OpenAI(**kwargs)
+    def record_failure(self, error: Exception) -> None:
+        """只有服务端不可用类错误计入熔断，请求参数错误等不影响"""
+        if is_transient_error(error):
+            _breaker.record_failure()
 
     def log_usage(self, operation: str, details: dict = None):
         logger.info(f"AI API 调用: {operation} | 模型: {self.chat_model} | 详情: {details or {}}")
@@ -66,9 +66,12 @@ async def startup_event():
             ))
 
     # Seed the database with initial data
+    from app.core.database_seed import EmbeddingDimensionMismatch, seed_database
     try:
-        from app.core.database_seed import seed_database
         await seed_database()
+    except EmbeddingDimensionMismatch:
+        # 向量维度不一致时拒绝启动，避免静默清空向量
+        raise
     except Exception as e:
         logging.error(f"Database seeding failed: {e}")
 
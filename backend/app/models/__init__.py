@@ -6,6 +6,8 @@ from .comparison import Comparison
 from .document import Document
 from .document_library import DocumentLibrary
 from .library_document import LibraryDocument
+from .library_document_band import LibraryDocumentBand
+from .library_document_chunk import LibraryDocumentChunk
 from .system_settings import SystemSettings
 from .user import User
 from .whitelist import WhitelistCollection, WhitelistItem
@@ -19,6 +21,8 @@ __all__ = [
     "Document",
     "DocumentLibrary",
     "LibraryDocument",
+    "LibraryDocumentBand",
+    "LibraryDocumentChunk",
     "SystemSettings",
     "User",
     "WhitelistCollection",
@@ -15,5 +15,7 @@ class Batch(Base):
     ai_provider = Column(String, default="local")  # AI detection provider
     ai_threshold = Column(Float, default=0.5)  # AI detection threshold
     compare_mode = Column(String, default="library")  # library / internal / both
+    compare_strategy = Column(String, default="chunk")  # chunk / winnowing
     whitelist_ids = Column(JSON, default=list)  # 用户选择的白名单 ID 列表
+    retrieval_pipeline = Column(JSON, nullable=True)  # 本批次的检索流水线覆盖配置（见 retrieval_pipeline.py）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
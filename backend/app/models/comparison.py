@@ -11,6 +11,7 @@ class Comparison(Base):
     doc_b = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=True)  # 跨库比较时为空
     similarity = Column(Float, nullable=False)
     matches = Column(JSON, nullable=True)
+    passages = Column(JSON, nullable=True)  # 精确公共片段（含两侧字符偏移）
     source_type = Column(String, default="internal")  # internal / library
     library_id = Column(UUID(as_uuid=True), ForeignKey("document_libraries.id"), nullable=True)
     library_doc_id = Column(UUID(as_uuid=True), ForeignKey("library_documents.id"), nullable=True)
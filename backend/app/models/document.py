@@ -1,6 +1,7 @@
 import uuid
-from sqlalchemy import Column, String, Text, DateTime, func, UUID, Float, Boolean, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, func, UUID, Float, Boolean, ForeignKey, BigInteger, Integer, LargeBinary
 from pgvector.sqlalchemy import Vector
+from app.core.config import settings
 from .base import Base
 
 class Document(Base):
@@ -9,10 +10,18 @@ class Document(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     batch_id = Column(UUID(as_uuid=True), ForeignKey("batches.id"))
     filename = Column(String, nullable=False)
-    content_hash = Column(String)
+    content_hash = Column(String)  # 原始字节 sha256
+    text_hash = Column(String)  # 规范化文本 sha256，用于精确重复判定
+    simhash = Column(BigInteger)  # 64 位 SimHash（有符号存储），用于近似重复判定
+    simhash_b0 = Column(Integer)  # SimHash 的 4 个 16 位 band，各自建索引
+    simhash_b1 = Column(Integer)
+    simhash_b2 = Column(Integer)
+    simhash_b3 = Column(Integer)
     mime_type = Column(String)
     text_content = Column(Text)
-    embedding = Column(Vector(384))  # Assuming sentence-transformers/all-MiniLM-L6-v2 embedding dim
+    embedding = Column(Vector(settings.EMBEDDING_DIM))  # 维度由 EMBEDDING_DIM 配置
+    chunk_embeddings = Column(LargeBinary)  # 全部 chunk 向量（紧凑矩阵，精度可配置，见 EmbeddingService.pack）
+    embedding_model = Column(String)  # 生成 chunk_embeddings 所用的模型，模型变化后重新生成
     storage_path = Column(String)
     uploaded_by = Column(UUID(as_uuid=True))
     status = Column(String, default="queued")  # queued, processing, completed, failed
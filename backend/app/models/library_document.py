@@ -1,6 +1,7 @@
 import uuid
-from sqlalchemy import Column, String, Text, DateTime, func, UUID, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, func, UUID, ForeignKey, LargeBinary, BigInteger, Integer
 from pgvector.sqlalchemy import Vector
+from app.core.config import settings
 from .base import Base
 
 
@@ -10,9 +11,16 @@ class LibraryDocument(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     library_id = Column(UUID(as_uuid=True), ForeignKey("document_libraries.id"), nullable=False)
     filename = Column(String, nullable=False)
-    content_hash = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)  # 原始字节 sha256
+    text_hash = Column(String, nullable=True)  # 规范化文本 sha256，用于精确重复判定
     text_content = Column(Text, nullable=True)
-    embedding = Column(Vector(384), nullable=True)
+    embedding = Column(Vector(settings.EMBEDDING_DIM), nullable=True)
+    minhash = Column(LargeBinary, nullable=True)  # MinHash 签名（uint32 数组）
+    simhash = Column(BigInteger, nullable=True)  # 64 位 SimHash（有符号存储），用于近似重复判定
+    simhash_b0 = Column(Integer, nullable=True)  # SimHash 的 4 个 16 位 band，各自建索引
+    simhash_b1 = Column(Integer, nullable=True)
+    simhash_b2 = Column(Integer, nullable=True)
+    simhash_b3 = Column(Integer, nullable=True)
     storage_path = Column(String, nullable=True)
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     status = Column(String, default="processing")  # processing / ready / failed
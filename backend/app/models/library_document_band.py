@@ -0,0 +1,19 @@
+from sqlalchemy import Column, BigInteger, SmallInteger, UUID, ForeignKey, Index
+from .base import Base
+
+
+class LibraryDocumentBand(Base):
+    """文档库文档的 MinHash LSH 分桶（入库时写入，用于亚线性候选检索）"""
+    __tablename__ = "library_document_bands"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    library_document_id = Column(
+        UUID(as_uuid=True), ForeignKey("library_documents.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    library_id = Column(UUID(as_uuid=True), ForeignKey("document_libraries.id"), nullable=False)
+    band = Column(SmallInteger, nullable=False)
+    bucket = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_library_document_bands_lookup", "band", "bucket", "library_id"),
+    )
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, BigInteger, Integer, Text, LargeBinary, UUID, ForeignKey, Index
+from pgvector.sqlalchemy import Vector
+from app.core.config import settings
+from .base import Base
+
+
+class LibraryDocumentChunk(Base):
+    """文档库文档的分块及其预计算指纹与向量（入库时写入一次，对比和向量检索时直接使用）"""
+    __tablename__ = "library_document_chunks"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    library_document_id = Column(
+        UUID(as_uuid=True), ForeignKey("library_documents.id", ondelete="CASCADE"), nullable=False
+    )
+    library_id = Column(UUID(as_uuid=True), nullable=True)  # 冗余存储，向量检索按文档库过滤时免去连接
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    fingerprint = Column(LargeBinary, nullable=False)  # 序列化后的 chunk 指纹
+    embedding = Column(Vector(settings.EMBEDDING_DIM), nullable=True)  # chunk 向量（向量后端可用时写入）
+
+    __table_args__ = (
+        Index("ix_library_document_chunks_doc", "library_document_id", "chunk_index"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, func
+from sqlalchemy import Column, String, Integer, Float, DateTime, func, JSON
 from .base import Base
 
 
@@ -14,4 +14,5 @@ class SystemSettings(Base):
     max_upload_size_mb = Column(Integer, default=50)
     max_files_per_batch = Column(Integer, default=20)
     system_name = Column(String, default="文档查重检测平台")
+    retrieval_pipeline = Column(JSON, nullable=True)  # 全局检索流水线覆盖配置，批次配置优先
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Text, DateTime, func, UUID, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, func, UUID, ForeignKey, Integer, LargeBinary
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -12,6 +12,7 @@ class WhitelistCollection(Base):
     name = Column(String, nullable=False)
     description = Column(String, nullable=False, default="")
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False, default=1)  # 条目变化时递增，用于指纹缓存失效
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     items = relationship("WhitelistItem", back_populates="collection", cascade="all, delete-orphan", lazy="selectin")
@@ -25,6 +26,7 @@ class WhitelistItem(Base):
     collection_id = Column(UUID(as_uuid=True), ForeignKey("whitelist_collections.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
     label = Column(String, nullable=False, default="")
+    fingerprint = Column(LargeBinary, nullable=True)  # 添加时预计算的 chunk 指纹
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     collection = relationship("WhitelistCollection", back_populates="items")
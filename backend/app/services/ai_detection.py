@@ -20,8 +20,10 @@ class AIDetectionService:
         通过 OpenAI 兼容 API 检测文本是否为 AI 生成。
         未配置 API 时返回不可用错误。
         """
-        if not self.is_available:
+        if not self.router.is_configured:
             return self._error_response("AI 检测未启用：未配置 AI_API_KEY")
+        if self.router.circuit_open:
+            return self._error_response("AI API 暂时不可用（熔断中），请稍后重试")
 
         try:
             self.router.log_usage("ai_detection", {"text_length": len(text)})
@@ -31,10 +33,15 @@ class AIDetectionService:
             return self._error_response(f"内部错误: {str(e)}")
 
     def health_check(self) -> Dict[str, Any]:
+        if not self.router.is_configured:
+            status = "unavailable"
+        else:
+            status = "degraded" if self.router.circuit_open else "healthy"
         return {
-            "status": "healthy" if self.is_available else "unavailable",
-            "api_configured": self.is_available,
-            "model": self.router.chat_model if self.is_available else None,
+            "status": status,
+            "api_configured": self.router.is_configured,
+            "circuit_open": self.router.circuit_open,
+            "model": self.router.chat_model if self.router.is_configured else None,
         }
 
     def _detect_via_api(self, text: str, threshold: float) -> Dict[str, Any]:
@@ -50,6 +57,7 @@ class AIDetectionService:
 {text[:4000]}"""
 
         try:
+            self.router.acquire_sync()
             response = client.chat.completions.create(
                 model=model,
                 messages=[
@@ -60,6 +68,7 @@ class AIDetectionService:
                 response_format={"type": "json_object"},
             )
 
+            self.router.record_success()
             content = response.choices[0].message.content
             result = json.loads(content)
 
@@ -80,6 +89,7 @@ class AIDetectionService:
             }
 
         except Exception as e:
+            self.router.record_failure(e)
             logger.error(f"API 调用错误: {e}")
             return self._error_response(f"API 调用失败: {str(e)}")
 
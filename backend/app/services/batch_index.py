@@ -0,0 +1,102 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from app.services.fingerprint import stack_fingerprints
+
+
+# 至少共享这么多个 3-gram（加权后）的文档对才进入精确对比
+MIN_SHARED_GRAMS = 20
+# 文档数较多时，出现在超过该比例文档中的 3-gram 视为高频 3-gram
+MAX_DOC_FREQUENCY = 0.2
+# 文档频率不超过该值的 3-gram 一律按普通 3-gram 计数（小批次直接全量生成候选）
+MIN_STOP_DF = 10
+# 高频 3-gram 既可能是常用表达，也可能是多人抄袭的同一段落，因此不丢弃，而是降权计数：
+# 每个共享的高频 3-gram 只计 STOP_GRAM_WEIGHT 个，常用表达凑不够阈值，整段抄袭（上百个 3-gram）仍能成为候选
+STOP_GRAM_WEIGHT = 0.1
+# 高频 3-gram 展开的文档对条目上限：超出时按哈希一致抽样（所有文档抽中同一批 3-gram），按抽样率放大权重
+STOP_PAIR_BUDGET = 20_000_000
+# 单次展开的文档对条目上限，限制峰值内存
+PAIR_BUFFER = 4_000_000
+
+# 抽样用的乘法哈希常数（2^64 / 黄金分割比）
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _merge_counts(keys: np.ndarray, counts: np.ndarray, pending: List[Tuple[np.ndarray, float]]):
+    """把新的文档对键（各带权重）合并进已有的 (键, 加权共享数)"""
+    if not pending:
+        return keys, counts
+    all_keys = np.concatenate([keys] + [k for k, _ in pending])
+    weights = np.concatenate([counts] + [np.full(k.size, w) for k, w in pending])
+    keys, inverse = np.unique(all_keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=weights)
+
+
+def _posting_pairs(doc_ids: np.ndarray, starts: np.ndarray, sizes: np.ndarray, weights: np.ndarray, n_docs: int):
+    """
+    展开各倒排表内的全部文档对，产出 (文档对键 i * n_docs + j, 权重) 分块。
+    长度与权重相同的倒排表合成一个矩阵一起展开，每块不超过 PAIR_BUFFER 条。
+    """
+    if not sizes.size:
+        return
+    order = np.lexsort((weights, sizes))
+    starts, sizes, weights = starts[order], sizes[order], weights[order]
+    bounds = np.flatnonzero(np.r_[True, (sizes[1:] != sizes[:-1]) | (weights[1:] != weights[:-1]), True])
+    for begin, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        size, weight = int(sizes[begin]), float(weights[begin])
+        group_starts = starts[begin:end]
+        upper_i, upper_j = np.triu_indices(size, k=1)
+        rows_per_chunk = max(PAIR_BUFFER // upper_i.size, 1)
+        for offset in range(0, group_starts.size, rows_per_chunk):
+            block = doc_ids[group_starts[offset:offset + rows_per_chunk, None] + np.arange(size)]
+            yield (block[:, upper_i] * n_docs + block[:, upper_j]).ravel(), weight
+
+
+def candidate_pairs(doc_grams: List[np.ndarray], min_shared: int = MIN_SHARED_GRAMS) -> List[Tuple[int, int]]:
+    """
+    基于批次级 3-gram 倒排索引生成候选文档对 (i, j)，i < j。
+    每个文档只需提供一次去重后的 3-gram 哈希数组，每对文档最多出现一次。
+    共享数按 i * 文档数 + j 为键稀疏累加，内存与实际共享 3-gram 的文档对数成正比，而不是文档数的平方。
+    """
+    n_docs = len(doc_grams)
+    if n_docs < 2:
+        return []
+
+    keys, doc_ids, _ = stack_fingerprints(doc_grams)
+    if not keys.size:
+        return []
+
+    order = np.argsort(keys, kind="stable")
+    keys, doc_ids = keys[order], doc_ids[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    df = np.diff(np.r_[starts, keys.size])
+
+    max_df = max(MIN_STOP_DF, int(MAX_DOC_FREQUENCY * n_docs))
+    common = (df >= 2) & (df <= max_df)
+    frequent = df > max_df
+    # 高频 3-gram 的展开量超出预算时一致抽样：哈希的高 32 位低于阈值的 3-gram 被抽中
+    frequent_pairs = float(np.sum(df[frequent] * (df[frequent] - 1) // 2))
+    rate = min(1.0, STOP_PAIR_BUDGET / frequent_pairs) if frequent_pairs else 1.0
+    if rate < 1.0:
+        with np.errstate(over="ignore"):
+            sampled = ((keys[starts] * _GOLDEN) >> np.uint64(32)) < np.uint64(int(rate * 2 ** 32))
+        frequent &= sampled
+
+    # 同一 3-gram 的倒排记录相邻，且文档 ID 升序（稳定排序，每篇文档的 3-gram 已去重）
+    selected = common | frequent
+    weights = np.where(frequent[selected], STOP_GRAM_WEIGHT / rate, 1.0)
+
+    pair_keys, pair_counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    pending, buffered = [], 0
+    for chunk_keys, weight in _posting_pairs(doc_ids, starts[selected], df[selected], weights, n_docs):
+        pending.append((chunk_keys, weight))
+        buffered += chunk_keys.size
+        if buffered >= PAIR_BUFFER:
+            pair_keys, pair_counts = _merge_counts(pair_keys, pair_counts, pending)
+            pending, buffered = [], 0
+    pair_keys, pair_counts = _merge_counts(pair_keys, pair_counts, pending)
+
+    # 加权计数有浮点误差，阈值留一点余量
+    hits = pair_keys[pair_counts >= min_shared - 1e-6]
+    return list(zip((hits // n_docs).tolist(), (hits % n_docs).tolist()))
@@ -9,6 +9,16 @@ def process_batch(batch_id: str, ai_threshold: float = 0.5, **kwargs):
 
 
 async def _process_batch_async(batch_id: str, ai_threshold: float):
+    from app.core.provider_router import close_async_clients
+
+    try:
+        await _process_batch(batch_id, ai_threshold)
+    finally:
+        # 异步 API 客户端绑定在本任务的事件循环上，循环关闭前释放其连接
+        await close_async_clients()
+
+
+async def _process_batch(batch_id: str, ai_threshold: float):
     # 延迟导入，避免循环依赖和模块级初始化问题
     from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
     from sqlalchemy.orm import sessionmaker
@@ -20,7 +30,9 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
     from app.models.batch_library import BatchLibrary
     from app.services.embedding import EmbeddingService
     from app.services.ai_detection import AIDetectionService
+    from app.models.system_settings import SystemSettings
     from app.services.plagiarism import PlagiarismService
+    from app.services.retrieval_pipeline import PipelineConfig
 
     engine = create_async_engine(settings.DATABASE_URL, echo=False)
     SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -53,24 +65,104 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
             )
             library_ids = [str(row[0]) for row in lib_result.fetchall()]
 
-        # 加载白名单指纹（whitelist_ids 现在存储的是清单 ID）
-        whitelist_fingerprints = []
+        # 加载白名单索引（whitelist_ids 现在存储的是清单 ID）；指纹在添加条目时已预计算，按清单版本号缓存
         whitelist_ids = batch.whitelist_ids or []
-        if whitelist_ids:
-            from app.models.whitelist import WhitelistItem
-            import uuid as uuid_mod
-            collection_id_list = [uuid_mod.UUID(wid) if isinstance(wid, str) else wid for wid in whitelist_ids]
-            wl_result = await session.execute(
-                select(WhitelistItem).where(WhitelistItem.collection_id.in_(collection_id_list))
-            )
-            wl_items = wl_result.scalars().all()
-            for wl in wl_items:
-                if wl.content:
-                    whitelist_fingerprints.append(PlagiarismService._precompute_chunk(wl.content))
+        from app.services.whitelist_cache import WhitelistCache
+        import uuid as uuid_mod
+        collection_id_list = [uuid_mod.UUID(wid) if isinstance(wid, str) else wid for wid in whitelist_ids]
+        whitelist_index = await WhitelistCache.load_index(session, collection_id_list)
+
+        # 检索流水线配置：系统设置 < 批次设置
+        system_settings = await session.get(SystemSettings, 1)
+        pipeline = PipelineConfig.from_layers(
+            system_settings.retrieval_pipeline if system_settings else None,
+            batch.retrieval_pipeline,
+        )
+
+        plagiarism_service = PlagiarismService(
+            session,
+            whitelist_index=whitelist_index,
+            compare_strategy=batch.compare_strategy or "chunk",
+            pipeline=pipeline,
+        )
+
+        check_plagiarism = analysis_type in ["plagiarism", "both", "mixed"]
+
+        # 批次级阶段（精确重复查找、批次内全量对比）出错时不中断整个任务：
+        # 受影响的文档记录在这里，逐篇处理时记为失败，其余文档照常处理
+        stage_errors = {}
+
+        def stage_failed(stage: str, docs, error: Exception) -> None:
+            print(f"批次 {batch_id} 的{stage}阶段出错，{len(docs)} 篇文档记为失败: {error}")
+            import traceback
+            traceback.print_exc()
+            for failed in docs:
+                stage_errors.setdefault(failed.id, error)
+
+        async def reset_session() -> None:
+            """回滚出错的事务；回滚会使会话中的对象过期（异步会话不能惰性加载），因此重新加载批次与文档"""
+            await session.rollback()
+            await session.refresh(batch)
+            await session.execute(select(Document).where(Document.batch_id == batch_id))
+
+        # 第0层：精确重复。哈希命中直接报告 100%，不再做向量与模糊对比
+        exact_library_by_doc = {}
+        exact_internal_by_doc = {}
+        duplicate_ids = set()
+        # 主文档 ID -> 批次内重复副本
+        copies_by_primary = {}
+        if check_plagiarism:
+            for doc in documents:
+                if doc.text_hash is None and doc.text_content:
+                    doc.text_hash = PlagiarismService.text_hash(doc.text_content)
+                if doc.simhash is None:
+                    PlagiarismService.apply_simhash(doc, doc.text_content)
+            await session.commit()
 
-        plagiarism_service = PlagiarismService(session, whitelist_fingerprints=whitelist_fingerprints)
+        if check_plagiarism and pipeline["hash"].enabled:
+            if compare_mode in ["library", "both"] and library_ids:
+                for doc in documents:
+                    try:
+                        # 只读查询放在保存点内，出错时只回滚这一次查询
+                        async with session.begin_nested():
+                            exact_library_by_doc[doc.id] = await plagiarism_service.find_exact_in_libraries(
+                                doc, library_ids
+                            )
+                    except Exception as e:
+                        stage_failed("精确重复查找", [doc], e)
+            if compare_mode in ["internal", "both"]:
+                exact_internal_by_doc = plagiarism_service.find_exact_in_batch(documents)
+                # 批次内重复只保留第一份（主文档）参与模糊对比，其余副本之后复用主文档的对比结果
+                documents_by_id = {str(d.id): d for d in documents}
+                for doc in documents:
+                    if str(doc.id) in duplicate_ids:
+                        continue
+                    copy_ids = [r["document_id"] for r in exact_internal_by_doc[doc.id] if r["document_id"] not in duplicate_ids]
+                    if copy_ids:
+                        duplicate_ids.update(copy_ids)
+                        copies_by_primary[doc.id] = [documents_by_id[c] for c in copy_ids]
+        primary_of = {str(c.id): primary_id for primary_id, docs in copies_by_primary.items() for c in docs}
 
+        # 批次内对比：所有文档对一次性全量计算（每对只比较一次，同时得到双向结果）
+        internal_results_by_doc = {}
+        if check_plagiarism and compare_mode in ["internal", "both"]:
+            internal_docs = [d for d in documents if str(d.id) not in duplicate_ids and d.id not in stage_errors]
+            try:
+                internal_results_by_doc = await plagiarism_service.find_similar_pairs_in_batch(internal_docs)
+                internal_results_by_doc = PlagiarismService.share_with_duplicates(
+                    internal_results_by_doc, copies_by_primary
+                )
+            except Exception as e:
+                stage_failed("批次内对比", internal_docs, e)
+                await reset_session()
+
+        # 主文档的文档库模糊对比结果，供其批次内重复副本复用
+        library_results_by_doc = {}
         for doc in documents:
+            if doc.id in stage_errors:
+                doc.status = "failed"
+                await session.commit()
+                continue
             try:
                 doc.status = "processing"
                 await session.commit()
@@ -78,7 +170,8 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
                 # AI 检测（仅在 API 已配置时可用）
                 if analysis_type in ["ai", "both", "mixed"]:
                     if doc.text_content and ai_service.is_available:
-                        ai_result = ai_service.detect(doc.text_content, threshold=ai_threshold)
+                        # 同步 API 调用（含限流等待）放到线程中执行，不阻塞事件循环
+                        ai_result = await asyncio.to_thread(ai_service.detect, doc.text_content, threshold=ai_threshold)
                         doc.ai_score = ai_result.get("score", 0.0)
                         doc.is_ai_generated = ai_result.get("is_ai", False)
                         doc.ai_confidence = ai_result.get("confidence", 0.0)
@@ -99,13 +192,45 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
                         session.add(ai_detection_record)
 
                 # 查重检测（支持纯文本模式，不强制依赖 API）
-                if analysis_type in ["plagiarism", "both", "mixed"]:
-                    if doc.text_content:
-                        # 如果 Embedding API 可用，生成向量（增强查重精度）
+                if check_plagiarism:
+                    exact_library = exact_library_by_doc.get(doc.id, [])
+                    exact_internal = exact_internal_by_doc.get(doc.id, [])
+                    # 命中文档库精确重复或是批次内的重复副本时，跳过向量生成与模糊对比
+                    skip_fuzzy = bool(exact_library) or str(doc.id) in duplicate_ids
+
+                    for res in exact_library:
+                        session.add(Comparison(
+                            doc_a=doc.id,
+                            doc_b=None,
+                            similarity=res["similarity"],
+                            matches=res["matches"],
+                            passages=res["passages"],
+                            source_type="library",
+                            library_id=res["library_id"],
+                            library_doc_id=res["library_document_id"],
+                        ))
+                    for res in exact_internal:
+                        session.add(Comparison(
+                            doc_a=doc.id,
+                            doc_b=res["document_id"],
+                            similarity=res["similarity"],
+                            matches=res["matches"],
+                            passages=res["passages"],
+                            source_type="internal",
+                        ))
+                    exact_doc_ids = {res["document_id"] for res in exact_internal}
+
+                    library_results = []
+                    if doc.text_content and not skip_fuzzy:
+                        # 如果 Embedding API 可用，取文档的 chunk 向量（批次内对比已生成的直接复用，用于 chunk 级检索），
+                        # 整篇向量由 chunk 向量在本地取平均
+                        chunk_embeddings = None
                         if embedding_service.is_available:
                             try:
-                                embedding = embedding_service.generate_text_embedding(doc.text_content)
-                                doc.embedding = embedding
+                                _, chunk_embeddings = await embedding_service.document_chunks(doc)
+                                embedding = embedding_service.mean_embedding(chunk_embeddings)
+                                if embedding.size:
+                                    doc.embedding = embedding
                             except Exception as emb_err:
                                 print(f"生成向量失败，将使用纯文本查重: {emb_err}")
 
@@ -113,34 +238,39 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
                         # 文档库对比
                         if compare_mode in ["library", "both"] and library_ids:
                             library_results = await plagiarism_service.find_similar_in_libraries(
-                                doc, library_ids
+                                doc, library_ids, chunk_embeddings=chunk_embeddings
                             )
-                            for res in library_results:
-                                comparison = Comparison(
-                                    doc_a=doc.id,
-                                    doc_b=None,
-                                    similarity=res["similarity"],
-                                    matches=res.get("matches", []),
-                                    source_type="library",
-                                    library_id=res.get("library_id"),
-                                    library_doc_id=res.get("library_document_id"),
-                                )
-                                session.add(comparison)
-
-                        # 批次内对比
-                        if compare_mode in ["internal", "both"]:
-                            internal_results = await plagiarism_service.find_similar_in_batch(
-                                doc, batch_id
+                            library_results_by_doc[doc.id] = library_results
+                    elif str(doc.id) in primary_of and not exact_library:
+                        # 批次内重复副本与主文档内容相同，直接复用主文档的文档库结果
+                        library_results = library_results_by_doc.get(primary_of[str(doc.id)], [])
+
+                    for res in library_results:
+                        comparison = Comparison(
+                            doc_a=doc.id,
+                            doc_b=None,
+                            similarity=res["similarity"],
+                            matches=res.get("matches", []),
+                            passages=res.get("passages", []),
+                            source_type="library",
+                            library_id=res.get("library_id"),
+                            library_doc_id=res.get("library_document_id"),
+                        )
+                        session.add(comparison)
+
+                    # 批次内对比（已按精确重复记录的文档对不再重复写入）
+                    if compare_mode in ["internal", "both"]:
+                        for res in internal_results_by_doc.get(doc.id, []):
+                            if res["document_id"] in exact_doc_ids:
+                                continue
+                            comparison = Comparison(
+                                doc_a=doc.id,
+                                doc_b=res["document_id"],
+                                similarity=res["similarity"],
+                                matches=res.get("matches", []),
+                                source_type="internal",
                             )
-                            for res in internal_results:
-                                comparison = Comparison(
-                                    doc_a=doc.id,
-                                    doc_b=res["document_id"],
-                                    similarity=res["similarity"],
-                                    matches=res.get("matches", []),
-                                    source_type="internal",
-                                )
-                                session.add(comparison)
+                            session.add(comparison)
 
                 doc.status = "completed"
                 await session.commit()
@@ -148,6 +278,7 @@ async def _process_batch_async(batch_id: str, ai_threshold: float):
                 print(f"处理文档 {doc.id} 时出错: {e}")
                 import traceback
                 traceback.print_exc()
+                await reset_session()
                 doc.status = "failed"
                 await session.commit()
 
@@ -0,0 +1,96 @@
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.library_document_chunk import LibraryDocumentChunk
+from app.services.fingerprint import ChunkFingerprint
+
+# 指纹序列化格式版本，格式变化时递增，旧版本记录在加载时视为缺失并重建
+FINGERPRINT_VERSION = 2
+
+
+class ChunkStore:
+    """文档库 chunk 指纹（及 chunk 向量）的持久化存储"""
+
+    @staticmethod
+    def encode(fp: ChunkFingerprint) -> bytes:
+        """将 chunk 指纹序列化为带版本号的紧凑二进制"""
+        return bytes([FINGERPRINT_VERSION]) + fp.to_bytes()
+
+    @staticmethod
+    def decode(data: bytes) -> ChunkFingerprint:
+        """反序列化 chunk 指纹，版本不匹配时抛出 ValueError"""
+        if not data or data[0] != FINGERPRINT_VERSION:
+            raise ValueError("chunk 指纹版本不匹配")
+        return ChunkFingerprint.from_bytes(data[1:])
+
+    @classmethod
+    def build_rows(
+        cls, library_document_id, chunks: List[str], fps: List[ChunkFingerprint],
+        library_id=None, embeddings=None,
+    ) -> List[LibraryDocumentChunk]:
+        """生成文档的 chunk 记录；embeddings 为与 chunks 一一对应的向量（可为 None 或含 None 的列表）"""
+        if embeddings is None or len(embeddings) != len(chunks):
+            embeddings = [None] * len(chunks)
+        return [
+            LibraryDocumentChunk(
+                library_document_id=library_document_id,
+                library_id=library_id,
+                chunk_index=idx,
+                content=chunk,
+                fingerprint=cls.encode(fp),
+                embedding=embedding,
+            )
+            for idx, (chunk, fp, embedding) in enumerate(zip(chunks, fps, embeddings))
+        ]
+
+    @classmethod
+    async def load(cls, session: AsyncSession, library_document_ids: List) -> Dict[Any, Tuple[List[str], List[ChunkFingerprint]]]:
+        """批量加载多个文档库文档的 chunk 与指纹；缺失或版本过旧的文档不出现在返回值中"""
+        if not library_document_ids:
+            return {}
+
+        result = await session.execute(
+            select(LibraryDocumentChunk)
+            .where(LibraryDocumentChunk.library_document_id.in_(library_document_ids))
+            .order_by(LibraryDocumentChunk.library_document_id, LibraryDocumentChunk.chunk_index)
+        )
+
+        loaded: Dict[Any, Tuple[List[str], List[ChunkFingerprint]]] = {}
+        stale = set()
+        for row in result.scalars().all():
+            doc_id = row.library_document_id
+            if doc_id in stale:
+                continue
+            try:
+                fp = cls.decode(row.fingerprint)
+            except ValueError:
+                stale.add(doc_id)
+                loaded.pop(doc_id, None)
+                continue
+            chunks, fps = loaded.setdefault(doc_id, ([], []))
+            chunks.append(row.content)
+            fps.append(fp)
+        return loaded
+
+    @staticmethod
+    async def delete(session: AsyncSession, library_document_id) -> None:
+        """删除文档的全部 chunk 记录（重建前调用）"""
+        await session.execute(
+            delete(LibraryDocumentChunk).where(LibraryDocumentChunk.library_document_id == library_document_id)
+        )
+
+    @classmethod
+    async def rebuild(
+        cls, session: AsyncSession, library_document_id, library_id, chunks: List[str], fps: List[ChunkFingerprint]
+    ) -> None:
+        """指纹格式过旧时重建 chunk 记录；分块方式不变，已存储的 chunk 向量按序号保留，避免重新调用 API"""
+        result = await session.execute(
+            select(LibraryDocumentChunk.chunk_index, LibraryDocumentChunk.embedding)
+            .where(LibraryDocumentChunk.library_document_id == library_document_id)
+        )
+        kept = {idx: emb for idx, emb in result.fetchall() if emb is not None}
+        embeddings = [kept.get(idx) for idx in range(len(chunks))]
+        await cls.delete(session, library_document_id)
+        session.add_all(cls.build_rows(library_document_id, chunks, fps, library_id, embeddings))
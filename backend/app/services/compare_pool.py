@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.fingerprint import ChunkFingerprint, pruned_scores
+from app.services.passage_alignment import find_common_passages
+from app.services.winnowing import WinnowFingerprint, find_passages
+
+logger = logging.getLogger(__name__)
+
+# 常驻执行器：首次使用时创建，之后在同一进程内跨文档、跨批次复用
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+# 进程池启动失败后本进程不再尝试
+_process_disabled = False
+
+
+def pool_size() -> int:
+    """执行器大小：优先使用配置值，否则取当前进程可用的 CPU 核数"""
+    if settings.COMPARE_WORKERS > 0:
+        return settings.COMPARE_WORKERS
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=pool_size())
+    return _thread_pool
+
+
+def get_executor() -> Executor:
+    """返回对比用执行器；进程池不可用（如 Celery prefork 的守护子进程）时退回线程池"""
+    global _process_pool, _process_disabled
+    if settings.COMPARE_EXECUTOR != "process" or _process_disabled:
+        return _get_thread_pool()
+    if _process_pool is None:
+        try:
+            # 以 spawn 启动工作进程：调用方进程里已有线程（线程池、HTTP 客户端、事件循环），
+            # fork 会复制其中被持有的锁，子进程可能死锁
+            _process_pool = ProcessPoolExecutor(max_workers=pool_size(), mp_context=multiprocessing.get_context("spawn"))
+        except (OSError, ValueError, AssertionError) as e:
+            logger.warning(f"无法创建进程池，退回线程池: {e}")
+            _process_disabled = True
+            return _get_thread_pool()
+    return _process_pool
+
+
+async def run(func, *args):
+    """在执行器中运行 CPU 密集的对比函数；进程池损坏或无法启动子进程时退回线程池重试"""
+    global _process_pool, _process_disabled
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except (BrokenProcessPool, AssertionError) as e:
+        if executor is _get_thread_pool():
+            raise
+        logger.warning(f"进程池不可用，退回线程池: {e}")
+        _process_pool = None
+        _process_disabled = True
+        return await loop.run_in_executor(_get_thread_pool(), func, *args)
+
+
+# ==================== 在工作进程中执行的纯计算函数（只接收紧凑指纹） ====================
+
+def best_chunk_matches(
+    fps_a: List[ChunkFingerprint], fps_b: List[ChunkFingerprint], threshold: float = 0.3, max_pairs: int = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """A 的每个 chunk 在 B 中的最优匹配下标与得分（只保证超过 threshold 的部分精确）"""
+    scores = pruned_scores(fps_a, fps_b, threshold, max_pairs=max_pairs)
+    best_indices = scores.argmax(axis=1)
+    return best_indices, scores[np.arange(scores.shape[0]), best_indices]
+
+
+def best_chunk_matches_both(
+    fps_a: List[ChunkFingerprint], fps_b: List[ChunkFingerprint], threshold: float = 0.3
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """一次打分同时得到 A→B 与 B→A 两个方向的最优匹配"""
+    scores = pruned_scores(fps_a, fps_b, threshold, both=True)
+    rows = scores.argmax(axis=1)
+    cols = scores.argmax(axis=0)
+    return (
+        rows, scores[np.arange(scores.shape[0]), rows],
+        cols, scores[cols, np.arange(scores.shape[1])],
+    )
+
+
+def winnow_passages(fp_a: WinnowFingerprint, fp_b: WinnowFingerprint):
+    return find_passages(fp_a, fp_b)
+
+
+def common_passages(tokens_a: np.ndarray, tokens_b: np.ndarray):
+    return find_common_passages(tokens_a, tokens_b)
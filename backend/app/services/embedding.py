@@ -1,11 +1,23 @@
 import hashlib
 import logging
-from typing import List, Tuple
+import struct
+from typing import Iterator, List, Tuple
 
+import numpy as np
+
+from app.core.config import settings
 from app.core.provider_router import ProviderRouter
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_client import EmbeddingClient
 
 logger = logging.getLogger(__name__)
 
+# 支持 dimensions 参数（服务端 Matryoshka 截断，响应体随之变小）的模型前缀；其余模型在本地截断
+_MATRYOSHKA_MODELS = ("text-embedding-3-",)
+# chunk 向量存储精度，编码在 pack 头部维度字段的高 8 位（0 即旧的 float32 格式）
+_PRECISIONS = {"float32": 0, "float16": 1, "int8": 2}
+_DIMS_MASK = (1 << 24) - 1
+
 
 class EmbeddingService:
     def __init__(self):
@@ -13,58 +25,166 @@ class EmbeddingService:
 
     @property
     def is_available(self) -> bool:
-        return self.router.is_available
+        return self.router.embedding_available
 
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """将文本切分为带重叠的块"""
+    @staticmethod
+    def iter_chunks(text: str, chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+        """按需产生带重叠的块，调用方可以逐块处理而不必持有全部分块"""
         if not text:
-            return []
-        chunks = []
+            return
         for i in range(0, len(text), chunk_size - overlap):
-            chunks.append(text[i : i + chunk_size])
+            yield text[i : i + chunk_size]
             if i + chunk_size >= len(text):
                 break
-        return chunks
 
-    def encode_chunks(self, text: str) -> Tuple[List[str], List[List[float]]]:
-        """通过 API 为文本的每个分块生成向量"""
-        if not self.is_available:
-            return [], []
+    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """将文本切分为带重叠的块"""
+        return list(self.iter_chunks(text, chunk_size, overlap))
+
+    async def encode_chunks(self, text: str) -> Tuple[List[str], np.ndarray]:
+        """为文本的每个分块生成向量，返回 (分块列表, float32 矩阵 [分块数 × 维度])"""
+        if not self.router.use_local_embedding and not self.router.is_configured:
+            return [], np.empty((0, 0), dtype=np.float32)
 
         chunks = self.chunk_text(text)
+        embeddings = await self.embed_chunks(chunks)
+        if not embeddings.size:
+            return [], embeddings
+        return chunks, embeddings
+
+    async def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        为给定分块生成向量，返回 float32 矩阵 [分块数 × 维度]，失败或不可用时为空矩阵。
+        API 后端按 (模型, 内容哈希) 先查缓存，只把未缓存过的文本（去重后）发给 API；本地后端直接编码。
+        """
+        empty = np.empty((0, 0), dtype=np.float32)
         if not chunks:
-            return [], []
-
-        try:
-            client = self.router.get_openai_client()
-            model = self.router.embedding_model
-
-            # OpenAI embedding API 支持批量输入
-            response = client.embeddings.create(model=model, input=chunks)
-            embeddings = [item.embedding for item in response.data]
-            return chunks, embeddings
-        except Exception as e:
-            logger.error(f"Embedding API 调用失败: {e}")
-            return [], []
-
-    def generate_text_embedding(self, text: str) -> List[float]:
-        """生成整篇文本的平均向量"""
+            return empty
+        if self.router.use_local_embedding:
+            # 本地编码比查缓存更快，不经过缓存
+            return self.router.get_local_embedder().embed(chunks)
+        if not self.router.is_configured:
+            return empty
+
+        model = self.router.embedding_model
+        dim = settings.EMBEDDING_DIM
+        # 缓存的是截断后的向量，键中带上维度
+        cache_key = f"{model}:{dim}"
+        hashes = [self.hash_content(chunk) for chunk in chunks]
+        vectors = await EmbeddingCache.get_many(cache_key, hashes)
+        pending = {h: chunk for h, chunk in zip(hashes, chunks) if h not in vectors}
+
+        if pending and self.router.circuit_open:
+            # 熔断期内不等待超时，直接降级为纯文本模式（已缓存的分块仍可使用）
+            return empty
+        if pending:
+            try:
+                # 按 token 数切分子批次并发请求，结果按输入顺序拼接；客户端为进程内共享，不在此关闭
+                client = self.router.get_async_openai_client()
+                dimensions = dim if model.startswith(_MATRYOSHKA_MODELS) else None
+                matrix = await EmbeddingClient(client, model, self.router, dimensions).embed(list(pending.values()))
+                fresh = dict(zip(pending, self.fit_dimension(matrix, dim)))
+            except Exception as e:
+                logger.error(f"Embedding API 调用失败: {e}")
+                return empty
+            await EmbeddingCache.put_many(cache_key, fresh)
+            vectors.update(fresh)
+
+        return np.stack([vectors[h] for h in hashes])
+
+    async def document_chunks(self, doc) -> Tuple[List[str], np.ndarray]:
+        """
+        文档的分块与 chunk 向量：文档上已存储且模型一致时直接解包（分块由全文确定性地重新切分），
+        否则重新生成并写回文档，随会话提交持久化。每篇文档因此只向 API 请求一次。
+        """
+        empty = np.empty((0, 0), dtype=np.float32)
+        if not doc.text_content:
+            return [], empty
+
+        model = self.router.embedding_model
+        if doc.chunk_embeddings and doc.embedding_model == model:
+            chunks = self.chunk_text(doc.text_content)
+            embeddings = self.unpack(doc.chunk_embeddings)
+            if embeddings.shape == (len(chunks), settings.EMBEDDING_DIM):
+                return chunks, embeddings
+
+        chunks, embeddings = await self.encode_chunks(doc.text_content)
+        if embeddings.size:
+            doc.chunk_embeddings = self.pack(embeddings)
+            doc.embedding_model = model
+        return chunks, embeddings
+
+    @classmethod
+    def fit_dimension(cls, embeddings: np.ndarray, dim: int) -> np.ndarray:
+        """
+        调整为 dim 维：模型输出更长时取前 dim 维并重新归一化（Matryoshka 截断），
+        更短时补零（余弦相似度不变）。
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.shape[1] > dim:
+            return cls.normalize(matrix[:, :dim])
+        if matrix.shape[1] < dim:
+            return np.pad(matrix, ((0, 0), (0, dim - matrix.shape[1])))
+        return matrix
+
+    @staticmethod
+    def pack(embeddings: np.ndarray, precision: str = None) -> bytes:
+        """
+        chunk 向量矩阵序列化为 行数、维度（uint32，维度字段高 8 位为精度）+ 数据。
+        float16 减半；int8 按行对称量化（先存每行的 float32 缩放系数），约为 float32 的 1/4。
+        """
+        precision = precision or settings.EMBEDDING_BLOB_PRECISION
+        code = _PRECISIONS.get(precision, 0)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        rows, dims = matrix.shape
+        header = struct.pack("<II", rows, dims | (code << 24))
+        if code == 1:
+            return header + np.ascontiguousarray(matrix, dtype="<f2").tobytes()
+        if code == 2:
+            scales = np.abs(matrix).max(axis=1) / 127 if rows else np.empty(0, dtype=np.float32)
+            scales = np.where(scales > 0, scales, 1.0).astype("<f4")
+            quantized = np.rint(matrix / scales[:, None]).astype(np.int8)
+            return header + scales.tobytes() + quantized.tobytes()
+        return header + np.ascontiguousarray(matrix, dtype="<f4").tobytes()
+
+    @staticmethod
+    def unpack(data: bytes) -> np.ndarray:
+        """反序列化为 float32 矩阵（兼容各精度与旧的 float32 格式）"""
+        rows, packed = struct.unpack_from("<II", data)
+        dims, code = packed & _DIMS_MASK, packed >> 24
+        if code == 1:
+            matrix = np.frombuffer(data, dtype="<f2", offset=8, count=rows * dims).astype(np.float32)
+        elif code == 2:
+            scales = np.frombuffer(data, dtype="<f4", offset=8, count=rows)
+            quantized = np.frombuffer(data, dtype=np.int8, offset=8 + 4 * rows, count=rows * dims)
+            matrix = quantized.reshape(rows, dims) * scales[:, None]
+        else:
+            matrix = np.frombuffer(data, dtype="<f4", offset=8, count=rows * dims)
+        return matrix.reshape(rows, dims)
+
+    async def generate_text_embedding(self, text: str) -> np.ndarray:
+        """生成整篇文本的平均向量（float32 数组，不可用时为空数组）"""
         if not self.is_available:
-            return []
+            return np.empty(0, dtype=np.float32)
 
-        chunks, embeddings = self.encode_chunks(text)
-        if not embeddings:
-            return []
+        chunks, embeddings = await self.encode_chunks(text)
+        return self.mean_embedding(embeddings)
 
-        # 计算所有分块向量的平均值
-        dim = len(embeddings[0])
-        avg = [0.0] * dim
-        for emb in embeddings:
-            for i in range(dim):
-                avg[i] += emb[i]
-        avg = [v / len(embeddings) for v in avg]
-        return avg
+    @staticmethod
+    def mean_embedding(embeddings: np.ndarray) -> np.ndarray:
+        """分块向量的平均值作为整篇文档向量（没有分块向量时为空数组）"""
+        if not embeddings.size:
+            return np.empty(0, dtype=np.float32)
+        return embeddings.mean(axis=0)
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """按行 L2 归一化（零向量保持为零），归一化后内积即余弦相似度"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
 
     @staticmethod
     def hash_content(content: str) -> str:
+        """chunk 内容哈希，作为向量缓存的键"""
         return hashlib.sha256(content.encode()).hexdigest()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 进程内 LRU：(模型, chunk 哈希) -> float32 向量；Redis（EMBEDDING_CACHE_URL，独立实例）作为跨进程、跨重启的持久层
+_memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+_redis = None
+_redis_retry_at = 0.0
+# Redis 连接失败后暂停使用的秒数，期间只用进程内缓存
+_REDIS_RETRY_SECONDS = 60
+_KEY_PREFIX = "embedding"
+
+
+def _client():
+    """惰性创建 Redis 客户端；未配置 EMBEDDING_CACHE_URL 或不可用时返回 None"""
+    global _redis
+    if not settings.EMBEDDING_CACHE_URL:
+        return None
+    if _redis is None and time.monotonic() >= _redis_retry_at:
+        import redis
+        _redis = redis.Redis.from_url(settings.EMBEDDING_CACHE_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _redis
+
+
+def _disable(error: Exception) -> None:
+    global _redis, _redis_retry_at
+    logger.warning(f"Embedding 缓存 Redis 不可用，{_REDIS_RETRY_SECONDS}s 内只使用进程内缓存: {error}")
+    _redis = None
+    _redis_retry_at = time.monotonic() + _REDIS_RETRY_SECONDS
+
+
+class EmbeddingCache:
+    """
+    按 (模型, chunk 内容哈希) 缓存 chunk 向量：进程内 LRU + 独立的缓存 Redis。
+    Redis 客户端是同步的（连接池线程安全，不绑定事件循环），读写放到线程中执行，不阻塞事件循环
+    """
+
+    @staticmethod
+    def _key(model: str, content_hash: str) -> str:
+        return f"{_KEY_PREFIX}:{model}:{content_hash}"
+
+    @classmethod
+    async def get_many(cls, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """批量读取，返回命中的 哈希 -> 向量；先查进程内 LRU，未命中的再一次性查 Redis"""
+        found: Dict[str, np.ndarray] = {}
+        missing = []
+        for content_hash in dict.fromkeys(hashes):
+            vector = _memory.get((model, content_hash))
+            if vector is None:
+                missing.append(content_hash)
+            else:
+                _memory.move_to_end((model, content_hash))
+                found[content_hash] = vector
+
+        client = _client() if missing else None
+        if client is not None:
+            try:
+                values = await asyncio.to_thread(client.mget, [cls._key(model, h) for h in missing])
+            except Exception as e:
+                _disable(e)
+                values = []
+            for content_hash, value in zip(missing, values):
+                if value:
+                    vector = np.frombuffer(value, dtype=np.float32)
+                    cls._remember(model, content_hash, vector)
+                    found[content_hash] = vector
+        return found
+
+    @classmethod
+    async def put_many(cls, model: str, items: Dict[str, np.ndarray]) -> None:
+        """批量写入进程内 LRU 与 Redis（带过期时间）"""
+        if not items:
+            return
+        for content_hash, vector in items.items():
+            cls._remember(model, content_hash, np.asarray(vector, dtype=np.float32))
+
+        client = _client()
+        if client is None:
+            return
+        pipe = client.pipeline(transaction=False)
+        for content_hash, vector in items.items():
+            pipe.set(
+                cls._key(model, content_hash),
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                ex=settings.EMBEDDING_CACHE_TTL or None,
+            )
+        try:
+            await asyncio.to_thread(pipe.execute)
+        except Exception as e:
+            _disable(e)
+
+    @staticmethod
+    def _remember(model: str, content_hash: str, vector: np.ndarray) -> None:
+        _memory[(model, content_hash)] = vector
+        _memory.move_to_end((model, content_hash))
+        while len(_memory) > max(settings.EMBEDDING_CACHE_SIZE, 0):
+            _memory.popitem(last=False)
+
+    @staticmethod
+    def clear_memory() -> None:
+        _memory.clear()
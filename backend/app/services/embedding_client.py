@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import random
+import re
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.provider_router import ProviderRouter, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符约 1 个 token，其余文本按约 3 个字符 1 个 token 保守估计（不依赖 tokenizer）
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')
+# 重试时的退避基数与上限（秒）
+_BACKOFF_BASE = 0.5
+_BACKOFF_MAX = 20.0
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + -(-(len(text) - cjk) // 3)
+
+
+def plan_batches(texts: List[str], max_tokens: int, max_items: int) -> List[List[int]]:
+    """按顺序把输入切成子批次：每批估计 token 数不超过 max_tokens、条数不超过 max_items（单条超限时独占一批）"""
+    batches, current, tokens = [], [], 0
+    for idx, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if current and (tokens + cost > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(idx)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """可重试的错误（429、5xx、连接/超时）返回等待秒数，其余返回 None"""
+    if not is_transient_error(error):
+        return None
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), _BACKOFF_MAX)
+    except ValueError:
+        pass
+    # 指数退避 + 抖动，避免并发请求同时重试
+    return min(_BACKOFF_BASE * (2 ** attempt), _BACKOFF_MAX) * (0.5 + random.random() / 2)
+
+
+class EmbeddingClient:
+    """
+    并发分批的异步 Embedding 客户端：按估计 token 数切分子批次，以有限并发发送，
+    429/5xx 按退避重试，结果按输入顺序重新拼接。
+    传入 router 时每次请求先经过共享限流器，失败计入熔断；熔断后其余子批次立即失败而不再重试。
+    """
+
+    def __init__(self, client, model: str, router: Optional[ProviderRouter] = None, dimensions: Optional[int] = None):
+        self.client = client
+        self.model = model
+        self.router = router
+        # 支持 Matryoshka 截断的模型由服务端直接返回 dimensions 维
+        self.extra = {"dimensions": dimensions} if dimensions else {}
+        self.max_tokens = max(settings.EMBEDDING_BATCH_TOKENS, 1)
+        self.max_items = max(settings.EMBEDDING_BATCH_SIZE, 1)
+        self.concurrency = max(settings.EMBEDDING_CONCURRENCY, 1)
+        self.max_retries = max(settings.EMBEDDING_MAX_RETRIES, 0)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """返回 float32 矩阵 [len(texts) × 维度]；任一子批次最终失败时抛出异常"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = plan_batches(texts, self.max_tokens, self.max_items)
+
+        async def run(indices: List[int]) -> List[List[float]]:
+            async with semaphore:
+                return await self._request([texts[i] for i in indices])
+
+        tasks = [asyncio.ensure_future(run(indices)) for indices in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一子批次失败即整体失败，取消其余仍在请求或退避中的子批次
+            for task in tasks:
+                task.cancel()
+            raise
+
+        rows: List[Optional[List[float]]] = [None] * len(texts)
+        for indices, vectors in zip(batches, results):
+            for idx, vector in zip(indices, vectors):
+                rows[idx] = vector
+        return np.asarray(rows, dtype=np.float32)
+
+    async def _request(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                if self.router is not None:
+                    await self.router.acquire()
+                response = await self.client.embeddings.create(model=self.model, input=batch, **self.extra)
+                if self.router is not None:
+                    self.router.record_success()
+                # 按返回的 index 排序，不依赖服务端保持输入顺序
+                data = sorted(response.data, key=lambda item: item.index)
+                if len(data) != len(batch):
+                    raise ValueError(f"Embedding API 返回 {len(data)} 条，期望 {len(batch)} 条")
+                return [item.embedding for item in data]
+            except Exception as e:
+                if self.router is not None:
+                    self.router.record_failure(e)
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Embedding 请求失败，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+                await asyncio.sleep(delay)
@@ -0,0 +1,77 @@
+import math
+from typing import Optional, Tuple
+
+
+# 限定文档库的向量检索。全局 hnsw 索引先按距离取回再按文档库过滤，
+# 选中的文档库占比越小，取回的近邻里属于它们的越少。这里按选中占比决定：
+#   - 占比足够大：索引过量取回 top_k / 占比 × 余量，不足 top_k 时按倍数扩大后重试；
+#   - 占比很小或选中的文档很少：直接按文档库过滤做精确扫描（代价与选中规模成正比，且结果一定完整）。
+# 过量取回超过 MAX_FETCH（hnsw.ef_search 上限）仍不足时同样改用精确扫描，保证返回 min(top_k, 可用数) 条。
+
+# 选中文档数不超过该值时直接精确扫描（文档级 / chunk 级，chunk 级每篇文档约有数十个 chunk）
+EXACT_SCAN_DOCS = 5000
+EXACT_SCAN_CHUNK_DOCS = 200
+# 选中占比低于该值时过量取回的代价过高，直接精确扫描
+MIN_INDEX_FRACTION = 0.01
+# 过量取回的余量与每轮扩大倍数
+OVERFETCH_MARGIN = 2.0
+FETCH_GROWTH = 4
+# pgvector 的 hnsw.ef_search 上限，也是单次取回的上限
+MAX_FETCH = 1000
+
+
+def initial_fetch(top_k: int, selected: int, total: int, exact_docs: int = EXACT_SCAN_DOCS) -> Optional[int]:
+    """首轮索引取回数量；返回 None 表示应直接精确扫描"""
+    if selected <= 0 or total <= 0:
+        return None
+    fraction = min(selected / total, 1.0)
+    if fraction >= 1.0:
+        return top_k
+    if selected <= exact_docs or fraction < MIN_INDEX_FRACTION:
+        return None
+    fetch = math.ceil(top_k / fraction * OVERFETCH_MARGIN)
+    return fetch if fetch <= MAX_FETCH else None
+
+
+def next_fetch(fetch: int) -> Optional[int]:
+    """上一轮取回不足时的下一轮数量；已达上限时返回 None（改用精确扫描）"""
+    if fetch >= MAX_FETCH:
+        return None
+    return min(fetch * FETCH_GROWTH, MAX_FETCH)
+
+
+def ef_search(fetch: int) -> int:
+    """取回 fetch 条时使用的 hnsw.ef_search（不小于 pgvector 默认值 40）"""
+    return max(40, min(fetch, MAX_FETCH))
+
+
+# 降精度索引：half = halfvec 表达式索引（内存减半，误差可忽略），bit = 二值量化表达式索引（内存约 1/32，
+# 只用于粗取回）。两者都按倍数多取回，再用表中的全精度向量重排
+RERANK_FACTOR = {"full": 1, "half": 2, "bit": 8}
+
+
+def index_precision(value: str) -> str:
+    return value if value in RERANK_FACTOR else "full"
+
+
+def rerank_fetch(fetch: int, precision: str) -> int:
+    """降精度索引实际取回的数量（不超过 MAX_FETCH）"""
+    return min(fetch * RERANK_FACTOR[precision], MAX_FETCH)
+
+
+def index_key(column: str, precision: str, dim: int) -> Tuple[str, str]:
+    """hnsw 索引的键表达式与操作符类；查询排序必须使用同一表达式，规划器才会走索引"""
+    if precision == "half":
+        return f"({column}::halfvec({dim}))", "halfvec_cosine_ops"
+    if precision == "bit":
+        return f"(binary_quantize({column})::bit({dim}))", "bit_hamming_ops"
+    return column, "vector_cosine_ops"
+
+
+def approx_distance(column: str, query: str, precision: str, dim: int) -> str:
+    """索引排序用的距离表达式，query 为 vector 类型的 SQL 表达式"""
+    if precision == "half":
+        return f"{column}::halfvec({dim}) <=> ({query})::halfvec({dim})"
+    if precision == "bit":
+        return f"binary_quantize({column})::bit({dim}) <~> binary_quantize({query})::bit({dim})"
+    return f"{column} <=> {query}"
@@ -0,0 +1,448 @@
+import zlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+
+_EMPTY = np.empty(0, dtype=np.uint64)
+_EMPTY_COUNTS = np.empty(0, dtype=np.uint32)
+
+# 3-gram 哈希混合常数（64 位奇数，乘法溢出回绕）
+_MIX_1 = np.uint64(0x9E3779B97F4A7C15)
+_MIX_2 = np.uint64(0xC2B2AE3D27D4EB4F)
+# 不足 n 个 token 时整体作为一个 gram，用标记位与正常 n-gram 区分
+_SHORT_TAG = np.uint64(0xFFFFFFFF)
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    """稳定的 32 位 token 哈希（带缓存，中文单字复用率极高）"""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def hash_tokens(tokens: List[str]) -> np.ndarray:
+    return np.fromiter((_token_hash(t) for t in tokens), dtype=np.uint64, count=len(tokens))
+
+
+def bigram_hashes(token_hashes: np.ndarray) -> np.ndarray:
+    """2-gram 哈希：两个 32 位 token 哈希直接拼接为 64 位，不引入额外碰撞"""
+    if token_hashes.size < 2:
+        return (token_hashes << np.uint64(32)) | _SHORT_TAG
+    return (token_hashes[:-1] << np.uint64(32)) | token_hashes[1:]
+
+
+def trigram_hashes(token_hashes: np.ndarray) -> np.ndarray:
+    """3-gram 哈希：对三个 token 哈希做乘法混合"""
+    with np.errstate(over="ignore"):
+        if token_hashes.size < 3:
+            h = _SHORT_TAG
+            for t in token_hashes:
+                h = h * _MIX_1 + t
+            return np.array([h], dtype=np.uint64) if token_hashes.size else _EMPTY
+        return (token_hashes[:-2] * _MIX_1 + token_hashes[1:-1]) * _MIX_2 + token_hashes[2:]
+
+
+class ChunkFingerprint:
+    """chunk 指纹：排序后的 n-gram 哈希数组（2-gram 集合 + 3-gram 计数）"""
+
+    __slots__ = ("bigrams", "trigrams", "trigram_counts", "trigram_norm")
+
+    def __init__(self, bigrams: np.ndarray, trigrams: np.ndarray, trigram_counts: np.ndarray):
+        self.bigrams = bigrams
+        self.trigrams = trigrams
+        self.trigram_counts = trigram_counts
+        counts = trigram_counts.astype(np.float64)
+        self.trigram_norm = float(np.sqrt(np.dot(counts, counts)))
+
+    @classmethod
+    def from_tokens(cls, tokens: List[str]) -> "ChunkFingerprint":
+        if not tokens:
+            return cls.empty()
+        token_hashes = hash_tokens(tokens)
+        bigrams = np.unique(bigram_hashes(token_hashes))
+        trigrams, counts = np.unique(trigram_hashes(token_hashes), return_counts=True)
+        return cls(bigrams, trigrams, counts.astype(np.uint32))
+
+    @classmethod
+    def empty(cls) -> "ChunkFingerprint":
+        return cls(_EMPTY, _EMPTY, _EMPTY_COUNTS)
+
+    def __bool__(self) -> bool:
+        return self.bigrams.size > 0
+
+    def __getstate__(self):
+        return (self.bigrams, self.trigrams, self.trigram_counts, self.trigram_norm)
+
+    def __setstate__(self, state):
+        self.bigrams, self.trigrams, self.trigram_counts, self.trigram_norm = state
+
+    def to_bytes(self) -> bytes:
+        """紧凑二进制：[2-gram 数, 3-gram 数] + 2-gram 数组 + 3-gram 数组 + 计数数组"""
+        header = np.array([self.bigrams.size, self.trigrams.size], dtype=np.uint32).tobytes()
+        return (
+            header
+            + self.bigrams.astype(np.uint64).tobytes()
+            + self.trigrams.astype(np.uint64).tobytes()
+            + self.trigram_counts.astype(np.uint32).tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ChunkFingerprint":
+        n_bi, n_tri = np.frombuffer(data, dtype=np.uint32, count=2)
+        offset = 8
+        bigrams = np.frombuffer(data, dtype=np.uint64, count=int(n_bi), offset=offset)
+        offset += int(n_bi) * 8
+        trigrams = np.frombuffer(data, dtype=np.uint64, count=int(n_tri), offset=offset)
+        offset += int(n_tri) * 8
+        counts = np.frombuffer(data, dtype=np.uint32, count=int(n_tri), offset=offset)
+        return cls(bigrams, trigrams, counts)
+
+    def similarity(self, other: "ChunkFingerprint") -> float:
+        """0.4 × Jaccard(2-gram) + 0.6 × Cosine(3-gram)，基于排序数组求交"""
+        if not self.bigrams.size or not other.bigrams.size:
+            return 0.0
+
+        intersection = np.intersect1d(self.bigrams, other.bigrams, assume_unique=True).size
+        union = self.bigrams.size + other.bigrams.size - intersection
+        jaccard = intersection / union if union else 0.0
+
+        if self.trigram_norm == 0 or other.trigram_norm == 0:
+            return round(0.4 * jaccard, 4)
+
+        _, idx_a, idx_b = np.intersect1d(
+            self.trigrams, other.trigrams, assume_unique=True, return_indices=True
+        )
+        dot = float(np.dot(
+            self.trigram_counts[idx_a].astype(np.int64),
+            other.trigram_counts[idx_b].astype(np.int64),
+        ))
+        cosine = dot / (self.trigram_norm * other.trigram_norm)
+
+        return round(0.4 * jaccard + 0.6 * cosine, 4)
+
+
+# ==================== 批量打分：n-gram 稀疏矩阵乘积 ====================
+
+# 单次等值连接展开的 (chunk_a, chunk_b) 条目上限，超过则按行分块，控制峰值内存
+MAX_JOIN_PAIRS = 4_000_000
+
+
+def stack_fingerprints(arrays: List[np.ndarray]):
+    """将每个 chunk 的哈希数组拼接为 CSR 风格的 (keys, row_ids, row_ptr)"""
+    sizes = np.fromiter((a.size for a in arrays), dtype=np.int64, count=len(arrays))
+    keys = np.concatenate(arrays) if arrays else _EMPTY
+    rows = np.repeat(np.arange(len(arrays), dtype=np.int64), sizes)
+    ptr = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=ptr[1:])
+    return keys, rows, ptr
+
+
+def sparse_product(a_arrays: List[np.ndarray], b_arrays: List[np.ndarray],
+                   a_values: List[np.ndarray] = None, b_values: List[np.ndarray] = None,
+                   max_pairs: int = None) -> np.ndarray:
+    """
+    计算稀疏矩阵乘积 A·Bᵀ（行 = chunk，列 = n-gram 哈希）。
+    不传 values 时为 0/1 矩阵，结果即共享 n-gram 数；传入时为计数矩阵的内积。
+    实现为按哈希排序后的等值连接 + bincount 累加，仅依赖 NumPy。
+    max_pairs 为单次展开的条目上限（默认 MAX_JOIN_PAIRS），决定峰值内存。
+    """
+    n_a, n_b = len(a_arrays), len(b_arrays)
+    out = np.zeros((n_a, n_b), dtype=np.float64)
+    if not n_a or not n_b:
+        return out
+
+    keys_a, rows_a, ptr_a = stack_fingerprints(a_arrays)
+    keys_b, rows_b, _ = stack_fingerprints(b_arrays)
+    if not keys_a.size or not keys_b.size:
+        return out
+
+    order = np.argsort(keys_b, kind="stable")
+    keys_b, rows_b = keys_b[order], rows_b[order]
+    vals_a = np.concatenate(a_values).astype(np.float64) if a_values is not None else None
+    vals_b = np.concatenate(b_values).astype(np.float64)[order] if b_values is not None else None
+
+    left = np.searchsorted(keys_b, keys_a, side="left")
+    counts = np.searchsorted(keys_b, keys_a, side="right") - left
+
+    # 按 A 的行分块，保证每块展开条目数不超过上限
+    row_pairs = np.bincount(rows_a, weights=counts, minlength=n_a).astype(np.int64)
+    max_pairs = max_pairs or MAX_JOIN_PAIRS
+    start = 0
+    while start < n_a:
+        end, acc = start, 0
+        while end < n_a and (end == start or acc + row_pairs[end] <= max_pairs):
+            acc += row_pairs[end]
+            end += 1
+        if acc:
+            lo, hi = ptr_a[start], ptr_a[end]
+            block_counts = counts[lo:hi]
+            a_idx = np.repeat(np.arange(lo, hi), block_counts)
+            offsets = np.arange(acc) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            b_idx = np.repeat(left[lo:hi], block_counts) + offsets
+            flat = (rows_a[a_idx] - start) * n_b + rows_b[b_idx]
+            weights = vals_a[a_idx] * vals_b[b_idx] if vals_a is not None else None
+            block = np.bincount(flat, weights=weights, minlength=(end - start) * n_b)
+            out[start:end] = block.reshape(end - start, n_b)
+        start = end
+    return out
+
+
+def _combine(shared, dot, size_a, size_b, norm_a, norm_b, min_shared: int) -> np.ndarray:
+    """由共享 2-gram 数与 3-gram 计数内积合成 0.4 × Jaccard + 0.6 × Cosine（逐元素，可广播）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        union = size_a + size_b - shared
+        jaccard = np.where(union > 0, shared / union, 0.0)
+        norms = norm_a * norm_b
+        cosine = np.where(norms > 0, dot / norms, 0.0)
+
+    scores = np.round(0.4 * jaccard + 0.6 * cosine, 4)
+    scores[shared < min_shared] = 0.0
+    return scores
+
+
+def pairwise_scores(fps_a: List[ChunkFingerprint], fps_b: List[ChunkFingerprint], min_shared: int = 3) -> np.ndarray:
+    """
+    一次性计算所有 chunk 对的 0.4 × Jaccard + 0.6 × Cosine 得分矩阵。
+    共享 2-gram 少于 min_shared 的 chunk 对视为非候选，得分为 0。
+    """
+    n_a, n_b = len(fps_a), len(fps_b)
+    if not n_a or not n_b:
+        return np.zeros((n_a, n_b), dtype=np.float64)
+
+    shared = sparse_product([fp.bigrams for fp in fps_a], [fp.bigrams for fp in fps_b])
+    dot = sparse_product(
+        [fp.trigrams for fp in fps_a], [fp.trigrams for fp in fps_b],
+        [fp.trigram_counts for fp in fps_a], [fp.trigram_counts for fp in fps_b],
+    )
+    size_a = np.array([fp.bigrams.size for fp in fps_a], dtype=np.float64)
+    size_b = np.array([fp.bigrams.size for fp in fps_b], dtype=np.float64)
+    norm_a = np.array([fp.trigram_norm for fp in fps_a], dtype=np.float64)
+    norm_b = np.array([fp.trigram_norm for fp in fps_b], dtype=np.float64)
+    return _combine(shared, dot, size_a[:, None], size_b[None, :], norm_a[:, None], norm_b[None, :], min_shared)
+
+
+# ==================== 相似连接剪枝：长度过滤 + 前缀过滤 + 得分上界 ====================
+
+# 浮点误差余量；以及"不可能成为最优"判定的余量（得分保留 4 位小数，留出一个舍入单位避免并列）
+_EPS = 1e-9
+_ROUND_MARGIN = 1e-4
+# 前缀总长至少缩短该比例时才单独做前缀连接，否则直接验证全部候选
+PREFIX_MIN_SAVING = 0.3
+# 候选 chunk 对不超过 (行数 + 列数) × 该值时逐对求交，否则在涉及的行列子集上做等值连接
+PAIR_JOIN_LIMIT = 4
+
+
+class _ChunkStats:
+    """计算得分上界所需的每个 chunk 的统计量"""
+
+    __slots__ = ("size", "norm", "l1", "max_count", "square_mass")
+
+    def __init__(self, fps: List[ChunkFingerprint]):
+        n = len(fps)
+        self.size = np.fromiter((fp.bigrams.size for fp in fps), dtype=np.float64, count=n)
+        self.norm = np.fromiter((fp.trigram_norm for fp in fps), dtype=np.float64, count=n)
+        self.l1 = np.fromiter((int(fp.trigram_counts.sum()) for fp in fps), dtype=np.int64, count=n)
+        self.max_count = np.fromiter(
+            (int(fp.trigram_counts.max()) if fp.trigram_counts.size else 0 for fp in fps), dtype=np.float64, count=n
+        )
+        # square_mass[i, p]：计数总和不超过 p 的 3-gram 子集的最大计数平方和（分数背包：按计数从大到小贪心）。
+        # p 为整数时每多 1 单位预算增加当前计数 c，即把降序的计数各重复 c 次后做前缀和
+        width = int(self.l1.max()) + 1 if n else 1
+        counts = np.concatenate([fp.trigram_counts for fp in fps]).astype(np.int64) if n else _EMPTY.astype(np.int64)
+        rows = np.repeat(np.arange(n), [fp.trigram_counts.size for fp in fps])
+        order = np.lexsort((-counts, rows))
+        counts, rows = counts[order], rows[order]
+        steps = np.repeat(counts, counts).astype(np.float64)
+        step_rows = np.repeat(rows, counts)
+        starts = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(self.l1, out=starts[1:])
+        offsets = np.arange(steps.size) - starts[step_rows]
+        table = np.zeros((n, width), dtype=np.float64)
+        table[step_rows, offsets + 1] = steps
+        self.square_mass = np.cumsum(table, axis=1)
+
+
+def score_upper_bound(shared, stats_a: _ChunkStats, ia, stats_b: _ChunkStats, ib) -> np.ndarray:
+    """
+    已知共享 2-gram 数时 chunk 对 (ia, ib) 得分的上界（下标可广播），随 shared 单调不减。
+    Jaccard 由 shared 精确给出。对 Cosine：共享 3-gram 的首个 2-gram 必然也是共享 2-gram，
+    其余 size - shared 个不同 2-gram 各至少占一个位置（最后一个 2-gram 不是 3-gram 起点，故 +1），
+    于是共享 3-gram 在 A 中至多占 p_a = l1 - size + shared + 1 个位置；
+    内积 ≤ min(max_b × p_a, max_a × p_b, √(square_mass_a(p_a) × square_mass_b(p_b)))。
+    """
+    size_a, size_b = stats_a.size[ia], stats_b.size[ib]
+    l1_a, l1_b = stats_a.l1[ia], stats_b.l1[ib]
+    shared = np.asarray(shared)
+    pos_a = np.minimum(l1_a, l1_a - size_a.astype(np.int64) + shared.astype(np.int64) + 1)
+    pos_b = np.minimum(l1_b, l1_b - size_b.astype(np.int64) + shared.astype(np.int64) + 1)
+
+    dot = np.minimum(stats_b.max_count[ib] * pos_a, stats_a.max_count[ia] * pos_b)
+    dot = np.minimum(dot, np.sqrt(stats_a.square_mass[ia, pos_a] * stats_b.square_mass[ib, pos_b]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        union = size_a + size_b - shared
+        jaccard = np.where(union > 0, shared / union, 0.0)
+        norms = stats_a.norm[ia] * stats_b.norm[ib]
+        cosine = np.where(norms > 0, dot / norms, 0.0)
+    return 0.4 * jaccard + 0.6 * np.minimum(cosine, 1.0)
+
+
+def _min_overlap(stats: _ChunkStats, threshold: float, min_shared: int) -> np.ndarray:
+    """
+    每个 chunk 与任意对象的得分可能达到阈值所需的最少共享 2-gram 数（不可能时为 size + 1）。
+    与对方无关的上界：Jaccard ≤ shared / size，Cosine ≤ √square_mass(p) / norm。
+    """
+    n = stats.size.size
+    width = int(stats.size.max()) + 1 if n else 1
+    shared = np.arange(width, dtype=np.int64)[None, :]
+    size = stats.size.astype(np.int64)[:, None]
+    pos = np.clip(stats.l1[:, None] - size + shared + 1, 0, stats.l1[:, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaccard = np.where(size > 0, shared / size, 0.0)
+        cosine = np.where(stats.norm[:, None] > 0,
+                          np.sqrt(np.take_along_axis(stats.square_mass, pos, axis=1)) / stats.norm[:, None], 0.0)
+    ok = (0.4 * np.minimum(jaccard, 1.0) + 0.6 * np.minimum(cosine, 1.0) >= threshold - _EPS) & (shared >= min_shared)
+    ok &= shared <= size
+    return np.where(ok.any(axis=1), ok.argmax(axis=1), stats.size.astype(np.int64) + 1)
+
+
+def _prefixes(arrays: List[np.ndarray], ranks: np.ndarray, overlap: np.ndarray) -> List[np.ndarray]:
+    """按全局 2-gram 顺序（稀有优先）取每个 chunk 的前缀：长度 size - overlap + 1；ranks 为拼接后各 2-gram 的全局序"""
+    prefixes = []
+    offset = 0
+    for grams, o in zip(arrays, overlap):
+        length = grams.size - int(o) + 1
+        if length <= 0:
+            prefixes.append(_EMPTY)
+        elif length >= grams.size:
+            prefixes.append(grams)
+        else:
+            prefixes.append(grams[np.argpartition(ranks[offset:offset + grams.size], length - 1)[:length]])
+        offset += grams.size
+    return prefixes
+
+
+def _pair_product(a_arrays, b_arrays, ia: np.ndarray, ib: np.ndarray, a_values=None, b_values=None) -> np.ndarray:
+    """只计算指定 chunk 对 (ia[k], ib[k]) 的交集大小（或计数内积）：以 (对序号, 哈希) 为键排序后求相邻相等项"""
+    if not ia.size:
+        return np.zeros(0, dtype=np.float64)
+    ia, ib = ia.tolist(), ib.tolist()
+    parts = [a_arrays[i] for i in ia] + [b_arrays[j] for j in ib]
+    keys = np.concatenate(parts)
+    sizes = np.fromiter((p.size for p in parts), dtype=np.int64, count=len(parts))
+    pair = np.repeat(np.tile(np.arange(len(ia)), 2), sizes)
+
+    order = np.lexsort((keys, pair))
+    keys, pair = keys[order], pair[order]
+    # 单个 chunk 内哈希互不相同，相邻相等必为一侧一个
+    same = (pair[1:] == pair[:-1]) & (keys[1:] == keys[:-1])
+    weights = None
+    if a_values is not None:
+        values = np.concatenate([a_values[i] for i in ia] + [b_values[j] for j in ib]).astype(np.float64)[order]
+        weights = values[:-1][same] * values[1:][same]
+    return np.bincount(pair[:-1][same], weights=weights, minlength=len(ia)).astype(np.float64)
+
+
+def _restricted_product(a_arrays, b_arrays, ia: np.ndarray, ib: np.ndarray, a_values=None, b_values=None,
+                        max_pairs: int = None) -> np.ndarray:
+    """只求 chunk 对 (ia[k], ib[k]) 的乘积：候选稀疏时逐对求交，否则在涉及的行、列子集上做等值连接"""
+    if ia.size <= PAIR_JOIN_LIMIT * (len(a_arrays) + len(b_arrays)):
+        return _pair_product(a_arrays, b_arrays, ia, ib, a_values, b_values)
+
+    rows, row_pos = np.unique(ia, return_inverse=True)
+    cols, col_pos = np.unique(ib, return_inverse=True)
+    product = sparse_product(
+        [a_arrays[i] for i in rows], [b_arrays[j] for j in cols],
+        [a_values[i] for i in rows] if a_values is not None else None,
+        [b_values[j] for j in cols] if b_values is not None else None,
+        max_pairs,
+    )
+    return product[row_pos, col_pos]
+
+
+def _best_per_line(line: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """每行（或列）上界最大的候选在坐标数组中的位置"""
+    order = np.lexsort((-upper, line))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = line[order][1:] != line[order][:-1]
+    return order[first]
+
+
+def pruned_scores(fps_a: List[ChunkFingerprint], fps_b: List[ChunkFingerprint], threshold: float,
+                  min_shared: int = 3, both: bool = False, max_pairs: int = None) -> np.ndarray:
+    """
+    带剪枝的得分矩阵：每行（both=True 时也包括每列）超过 threshold 的最优匹配（含 argmax 的并列次序）
+    与 pairwise_scores 完全一致；不可能超过阈值、也不可能成为最优的 chunk 对不打分，记为 0。
+    候选阶段依次做长度过滤、基于全局 2-gram 顺序的前缀过滤，再用得分上界剔除其余不可能的 chunk 对。
+    max_pairs 透传给等值连接，用于限制峰值内存。
+    """
+    n_a, n_b = len(fps_a), len(fps_b)
+    out = np.zeros((n_a, n_b), dtype=np.float64)
+    if not n_a or not n_b:
+        return out
+
+    stats_a, stats_b = _ChunkStats(fps_a), _ChunkStats(fps_b)
+    bigrams_a, bigrams_b = [fp.bigrams for fp in fps_a], [fp.bigrams for fp in fps_b]
+    trigrams_a, trigrams_b = [fp.trigrams for fp in fps_a], [fp.trigrams for fp in fps_b]
+    counts_a, counts_b = [fp.trigram_counts for fp in fps_a], [fp.trigram_counts for fp in fps_b]
+
+    # 1. 长度过滤：即使与最有利的对象相比也达不到阈值的 chunk 整行（列）剔除
+    overlap_a = _min_overlap(stats_a, threshold, min_shared)
+    overlap_b = _min_overlap(stats_b, threshold, min_shared)
+    live_a, live_b = overlap_a <= stats_a.size, overlap_b <= stats_b.size
+    if not live_a.any() or not live_b.any():
+        return out
+
+    # 2. 前缀过滤：共享数 ≥ o 的两个集合，在同一全局顺序下各自长度为 size - o + 1 的前缀必有交集。
+    #    全局顺序按出现频次升序，前缀中不含最常见的 2-gram，等值连接的展开量随之大幅下降
+    if (overlap_a - 1).sum() + (overlap_b - 1).sum() >= PREFIX_MIN_SAVING * (stats_a.size.sum() + stats_b.size.sum()):
+        keys, inverse, freq = np.unique(np.concatenate(bigrams_a + bigrams_b), return_inverse=True, return_counts=True)
+        rank = np.empty(keys.size, dtype=np.int64)
+        rank[np.lexsort((keys, freq))] = np.arange(keys.size)
+        ranks = rank[inverse]
+        split = int(stats_a.size.sum())
+        candidates = sparse_product(
+            _prefixes(bigrams_a, ranks[:split], overlap_a), _prefixes(bigrams_b, ranks[split:], overlap_b),
+            max_pairs=max_pairs,
+        ) > 0
+    else:
+        candidates = np.ones((n_a, n_b), dtype=bool)
+    candidates &= live_a[:, None] & live_b[None, :]
+
+    # 3. 候选验证：精确共享数 → 精确 Jaccard 与逐对得分上界，达不到阈值的直接剔除
+    ia, ib = np.nonzero(candidates)
+    if ia.size <= PAIR_JOIN_LIMIT * (n_a + n_b):
+        shared = _pair_product(bigrams_a, bigrams_b, ia, ib)
+    else:
+        rows, cols = np.flatnonzero(live_a), np.flatnonzero(live_b)
+        dense = np.zeros((n_a, n_b), dtype=np.float64)
+        dense[np.ix_(rows, cols)] = sparse_product(
+            [bigrams_a[i] for i in rows], [bigrams_b[j] for j in cols], max_pairs=max_pairs
+        )
+        ia, ib = np.nonzero(candidates & (dense >= min_shared))
+        shared = dense[ia, ib]
+    upper = score_upper_bound(shared, stats_a, ia, stats_b, ib)
+    keep = (shared >= min_shared) & (upper >= threshold - _EPS)
+    ia, ib, shared, upper = ia[keep], ib[keep], shared[keep], upper[keep]
+    if not ia.size:
+        return out
+
+    # 4. 最优剪枝：先精确计算每行（及每列）上界最大的候选作为最优得分的下界，
+    #    上界低于该下界（留出舍入余量）的 chunk 对不可能成为 argmax
+    lines = [(ia, n_a)] + ([(ib, n_b)] if both else [])
+    hopeless = np.ones(ia.size, dtype=bool)
+    for line, n_lines in lines:
+        pick = _best_per_line(line, upper)
+        dot = _pair_product(trigrams_a, trigrams_b, ia[pick], ib[pick], counts_a, counts_b)
+        lower = np.full(n_lines, -np.inf)
+        lower[line[pick]] = _combine(
+            shared[pick], dot, stats_a.size[ia[pick]], stats_b.size[ib[pick]],
+            stats_a.norm[ia[pick]], stats_b.norm[ib[pick]], min_shared,
+        )
+        hopeless &= upper < lower[line] - _ROUND_MARGIN
+    ia, ib, shared = ia[~hopeless], ib[~hopeless], shared[~hopeless]
+
+    # 5. 只对幸存的 chunk 对计算 3-gram 内积
+    dot = _restricted_product(trigrams_a, trigrams_b, ia, ib, counts_a, counts_b, max_pairs)
+    out[ia, ib] = _combine(shared, dot, stats_a.size[ia], stats_b.size[ib], stats_a.norm[ia], stats_b.norm[ib], min_shared)
+    return out
@@ -0,0 +1,66 @@
+import logging
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+
+from app.models.library_document import LibraryDocument
+from app.services.minhash import MinHashLSH
+
+logger = logging.getLogger(__name__)
+
+# 每批处理的文档数：内存中同时只持有这么多篇全文
+BACKFILL_BATCH_SIZE = 200
+
+
+async def backfill_library_documents(session: AsyncSession, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    为升级前导入的文档库文档补建检索签名（规范化文本哈希、MinHash 签名与 LSH 分桶、SimHash），
+    在数据库初始化时一次性执行。
+    按主键 keyset 分批读取，每批提交一次；中断后重新执行会从尚未补建的文档继续。返回补建的文档数。
+    """
+    from app.services.plagiarism import PlagiarismService
+
+    missing = [
+        LibraryDocument.text_hash.is_(None),
+        LibraryDocument.minhash.is_(None),
+        LibraryDocument.simhash.is_(None),
+    ]
+    total, last_id = 0, None
+    while True:
+        query = (
+            select(LibraryDocument)
+            .options(load_only(LibraryDocument.id, LibraryDocument.library_id, LibraryDocument.text_content,
+                               LibraryDocument.text_hash, LibraryDocument.minhash, LibraryDocument.simhash))
+            .where(
+                LibraryDocument.status == "ready",
+                LibraryDocument.text_content.isnot(None),
+                LibraryDocument.text_content != "",
+                or_(*missing),
+            )
+            .order_by(LibraryDocument.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(LibraryDocument.id > last_id)
+        lib_docs = (await session.execute(query)).scalars().all()
+        if not lib_docs:
+            break
+
+        for lib_doc in lib_docs:
+            if lib_doc.text_hash is None:
+                lib_doc.text_hash = PlagiarismService.text_hash(lib_doc.text_content)
+            if lib_doc.minhash is None:
+                signature = PlagiarismService.minhash_signature(lib_doc.text_content)
+                lib_doc.minhash = MinHashLSH.to_bytes(signature)
+                session.add_all(PlagiarismService.build_band_rows(lib_doc, signature))
+            if lib_doc.simhash is None:
+                PlagiarismService.apply_simhash(lib_doc, lib_doc.text_content)
+
+        last_id = lib_docs[-1].id
+        total += len(lib_docs)
+        await session.commit()
+        # 释放本批全文，内存只与批大小有关
+        session.expunge_all()
+        logger.info(f"文档库签名补建：已处理 {total} 篇")
+    return total
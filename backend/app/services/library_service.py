@@ -4,7 +4,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.document_library import DocumentLibrary
 from app.models.library_document import LibraryDocument
+from app.services.chunk_store import ChunkStore
 from app.services.embedding import EmbeddingService
+from app.services.minhash import MinHashLSH
+from app.services.plagiarism import PlagiarismService
 from app.services.storage import StorageService
 from app.services.parsing import extract_text_from_file
 import hashlib
@@ -69,6 +72,7 @@ class LibraryService:
             library_id=library_id,
             filename=filename,
             content_hash=content_hash,
+            text_hash=PlagiarismService.text_hash(text_content),
             text_content=text_content,
             storage_path=storage_path,
             uploaded_by=uploaded_by,
@@ -78,21 +82,30 @@ class LibraryService:
         await self.db.commit()
         await self.db.refresh(lib_doc)
 
-        # 生成向量
+        # 计算 MinHash 签名并写入 LSH 分桶，供纯文本模式亚线性检索
+        chunks, fps, embeddings = [], [], None
+        if text_content:
+            signature = PlagiarismService.minhash_signature(text_content)
+            lib_doc.minhash = MinHashLSH.to_bytes(signature)
+            PlagiarismService.apply_simhash(lib_doc, text_content)
+            self.db.add_all(PlagiarismService.build_band_rows(lib_doc, signature))
+            chunks, fps = PlagiarismService.prepare_chunks(text_content)
+
+        # 生成 chunk 向量（一次 API 调用），整篇向量取其平均值
         try:
-            if text_content and self.embedding_service.is_available:
-                embedding = self.embedding_service.generate_text_embedding(text_content)
-                if embedding:
-                    lib_doc.embedding = embedding
-                    lib_doc.status = "ready"
-                else:
-                    lib_doc.status = "ready"  # 没有embedding也标记为ready
-            else:
-                lib_doc.status = "ready"
+            if chunks and self.embedding_service.is_available:
+                embeddings = await self.embedding_service.embed_chunks(chunks)
+                if embeddings.size:
+                    lib_doc.embedding = self.embedding_service.mean_embedding(embeddings)
+            lib_doc.status = "ready"  # 没有embedding也标记为ready
         except Exception as e:
             logger.error(f"生成文档库文档向量失败: {e}")
             lib_doc.status = "failed"
 
+        # 分块指纹与向量只在入库时计算一次，对比和检索时直接加载
+        if chunks:
+            self.db.add_all(ChunkStore.build_rows(lib_doc.id, chunks, fps, library_id, embeddings))
+
         # 更新文档库计数
         library = await self.db.get(DocumentLibrary, library_id)
         if library:
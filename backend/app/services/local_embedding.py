@@ -0,0 +1,99 @@
+import threading
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+
+# 本地向量：字符 2/3-gram 做带符号的特征哈希（2^14 个桶），再乘以固定的 ±1 随机投影矩阵降到 DIM 维并归一化。
+# 投影矩阵由整数哈希确定性生成（与 NumPy 版本、进程、机器无关），同一文本在任何部署上得到相同向量；
+# 无需网络和模型文件，单个 500 字分块的编码不到 1 毫秒。语义能力弱于 Embedding 模型，但足以召回字面相近的候选
+DIM = settings.EMBEDDING_DIM
+MODEL_NAME = f"local-char-ngram-{DIM}"
+NGRAM_SIZES = (2, 3)
+
+_BUCKET_BITS = 14
+_BUCKETS = 1 << _BUCKET_BITS
+_SEED = np.uint64(0x5EED_C0DE_2024_0001)
+
+# splitmix64 终结函数常数（与 SimHash 相同）
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+# 组合 n-gram 内各字符码位的乘数（大奇数）
+_PRIMES = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+_projection: Optional[np.ndarray] = None
+_projection_lock = threading.Lock()
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        z = values ^ (values >> np.uint64(30))
+        z = z * _MIX_1
+        z = (z ^ (z >> np.uint64(27))) * _MIX_2
+        return z ^ (z >> np.uint64(31))
+
+
+def _projection_matrix() -> np.ndarray:
+    """[桶数 × DIM] 的 ±1 矩阵（int8，约 6MB），首次使用时按块生成"""
+    global _projection
+    if _projection is None:
+        with _projection_lock:
+            if _projection is None:
+                matrix = np.empty((_BUCKETS, DIM), dtype=np.int8)
+                cells = np.arange(DIM, dtype=np.uint64)
+                for start in range(0, _BUCKETS, 1024):
+                    rows = np.arange(start, start + 1024, dtype=np.uint64)[:, None]
+                    with np.errstate(over="ignore"):
+                        bits = _mix((rows * np.uint64(DIM) + cells) ^ _SEED) >> np.uint64(63)
+                    matrix[start:start + 1024] = 1 - 2 * bits.astype(np.int8)
+                _projection = matrix
+    return _projection
+
+
+def _normalize_text(text: str) -> str:
+    """全角转半角、统一小写并压缩空白，使格式差异不影响向量"""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def ngram_features(text: str) -> np.ndarray:
+    """文本的带符号哈希特征（float32，长度为桶数）：同一 n-gram 累加，次数取平方根抑制高频字"""
+    codes = np.frombuffer(_normalize_text(text).encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+    hashes = []
+    for size in NGRAM_SIZES:
+        if codes.size < size:
+            continue
+        with np.errstate(over="ignore"):
+            combined = np.full(codes.size - size + 1, np.uint64(size), dtype=np.uint64)
+            for offset in range(size):
+                combined = combined * _PRIMES[offset] + codes[offset:codes.size - size + 1 + offset]
+        hashes.append(_mix(combined ^ _SEED))
+    if not hashes:
+        return np.zeros(_BUCKETS, dtype=np.float32)
+
+    hashes = np.concatenate(hashes)
+    buckets = (hashes & np.uint64(_BUCKETS - 1)).astype(np.intp)
+    signs = 1.0 - 2.0 * (hashes >> np.uint64(63)).astype(np.float32)
+    counts = np.bincount(buckets, weights=signs, minlength=_BUCKETS)
+    return (np.sign(counts) * np.sqrt(np.abs(counts))).astype(np.float32)
+
+
+class LocalEmbedder:
+    """离线部署使用的本地向量编码器：纯 NumPy、确定性、无网络"""
+
+    model = MODEL_NAME
+    dim = DIM
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """返回 L2 归一化的 float32 矩阵 [len(texts) × DIM]（空文本为零向量）"""
+        projection = _projection_matrix()
+        rows = np.zeros((len(texts), DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            features = ngram_features(text)
+            active = np.flatnonzero(features)
+            if active.size:
+                rows[i] = features[active] @ projection[active].astype(np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        return np.divide(rows, norms, out=rows, where=norms > 0)
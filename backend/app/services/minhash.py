@@ -0,0 +1,71 @@
+import zlib
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+
+# MinHash 参数：128 个置换，切分为 64 个 band（每个 band 2 行）
+# LSH 阈值约为 (1/64)^(1/2) ≈ 0.125，对部分抄袭（整体 Jaccard 偏低）也较敏感
+NUM_PERM = 128
+NUM_BANDS = 64
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_BLOCK_SIZE = 4096
+
+# 固定随机种子，保证不同进程/不同时间生成的签名可比
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+class MinHashLSH:
+    """MinHash 签名与 LSH 分桶（签名入库存储，分桶写入 library_document_bands）"""
+
+    @staticmethod
+    def hash_shingle(shingle: str) -> int:
+        """稳定的 32 位 shingle 哈希（不受 PYTHONHASHSEED 影响）"""
+        return zlib.crc32(shingle.encode("utf-8"))
+
+    @classmethod
+    def signature(cls, shingles: Iterable[str]) -> np.ndarray:
+        """根据 shingle 集合计算 MinHash 签名（uint32 数组）"""
+        hashes = np.fromiter(
+            {cls.hash_shingle(s) for s in shingles}, dtype=np.uint64
+        )
+        return cls.signature_from_hashes(hashes)
+
+    @staticmethod
+    def signature_from_hashes(hashes: np.ndarray) -> np.ndarray:
+        """根据已哈希的 shingle 数组计算签名，分块计算以限制内存"""
+        sig = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+        if hashes.size == 0:
+            return sig.astype(np.uint32)
+
+        hashes = hashes.astype(np.uint64)
+        for start in range(0, hashes.size, _BLOCK_SIZE):
+            block = hashes[start:start + _BLOCK_SIZE, np.newaxis]
+            # uint64 溢出回绕是预期行为，与常见 MinHash 实现一致
+            with np.errstate(over="ignore"):
+                values = np.bitwise_and((block * _PERM_A + _PERM_B) % _MERSENNE_PRIME, _MAX_HASH)
+            sig = np.minimum(sig, values.min(axis=0))
+        return sig.astype(np.uint32)
+
+    @staticmethod
+    def band_keys(signature: np.ndarray) -> List[Tuple[int, int]]:
+        """将签名切分为 band，返回 (band 序号, 桶哈希) 列表"""
+        sig = np.asarray(signature, dtype=np.uint32)
+        keys = []
+        for band in range(NUM_BANDS):
+            rows = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+            keys.append((band, zlib.crc32(rows.tobytes())))
+        return keys
+
+    @staticmethod
+    def to_bytes(signature: np.ndarray) -> bytes:
+        return np.asarray(signature, dtype=np.uint32).tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.uint32)
@@ -0,0 +1,98 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+# 报告的公共片段最少包含的 token 数（中文约等于字数）
+MIN_PASSAGE_TOKENS = 20
+# 每对文档最多报告的片段数（按长度取前 N 个）
+MAX_PASSAGES = 50
+
+
+def _suffix_array(seq: np.ndarray) -> np.ndarray:
+    """
+    前缀倍增构建后缀数组。每轮把 (前半 rank, 后半 rank) 合成一个整数键做一次 argsort（比较排序，O(n log n)），
+    至多 log n 轮，总计 O(n log² n)；只保留当前一轮的 rank 数组。
+    """
+    n = seq.size
+    rank = np.unique(seq, return_inverse=True)[1].astype(np.int64)
+    k = 1
+    while True:
+        # 后半越界记为 0，其余为 rank + 1；键值小于 (n + 1)^2，不会溢出
+        second = np.zeros(n, dtype=np.int64)
+        if k < n:
+            second[:n - k] = rank[k:] + 1
+        key = rank * (n + 1) + second
+        sa = np.argsort(key)
+        sorted_key = key[sa]
+        changed = np.empty(n, dtype=np.int64)
+        changed[0] = 0
+        changed[1:] = sorted_key[1:] != sorted_key[:-1]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.cumsum(changed)
+        if rank[sa[-1]] == n - 1 or k >= n:
+            return sa
+        k *= 2
+
+
+def _adjacent_lcp(seq: np.ndarray, sa: np.ndarray) -> np.ndarray:
+    """
+    Kasai 算法计算后缀数组相邻项的 LCP：按原文顺序遍历后缀，LCP 每步至多减 1，总比较次数 O(n)。
+    逐 token 比较无法向量化，这里是纯 Python 循环，常数明显大于 NumPy 部分。
+    """
+    n = sa.size
+    tokens, order = seq.tolist(), sa.tolist()
+    rank = [0] * n
+    for r, pos in enumerate(order):
+        rank[pos] = r
+    lcp = [0] * max(n - 1, 0)
+    h = 0
+    for i in range(n):
+        r = rank[i]
+        if r == 0:
+            h = 0
+            continue
+        j = order[r - 1]
+        while i + h < n and j + h < n and tokens[i + h] == tokens[j + h]:
+            h += 1
+        lcp[r - 1] = h
+        if h:
+            h -= 1
+    return np.array(lcp, dtype=np.int64)
+
+
+def find_common_passages(
+    tokens_a: np.ndarray, tokens_b: np.ndarray, min_length: int = MIN_PASSAGE_TOKENS
+) -> List[Tuple[int, int, int]]:
+    """
+    在拼接后的 token 序列上用后缀数组 + LCP 找出两文档间的极大公共片段。
+    返回 (A 起始 token, B 起始 token, token 长度) 列表，按长度降序。
+    """
+    n_a, n_b = tokens_a.size, tokens_b.size
+    if n_a < min_length or n_b < min_length:
+        return []
+
+    # 映射为稠密 id，两个文档之后各接一个唯一分隔符，保证公共前缀不跨越文档
+    ids = np.unique(np.concatenate([tokens_a, tokens_b]), return_inverse=True)[1].astype(np.int64)
+    sep = int(ids.max()) + 1
+    seq = np.concatenate([ids[:n_a], [sep], ids[n_a:], [sep + 1]])
+
+    sa = _suffix_array(seq)
+    lcp = _adjacent_lcp(seq, sa)
+
+    # 相邻后缀分别来自 A、B 且 LCP 足够长
+    left, right = sa[:-1], sa[1:]
+    in_a_left, in_a_right = left < n_a, right < n_a
+    cross = (in_a_left != in_a_right) & (lcp >= min_length)
+    pos_a = np.where(in_a_left, left, right)[cross]
+    pos_b = np.where(in_a_left, right, left)[cross] - (n_a + 1)
+    lengths = lcp[cross]
+
+    # 左极大：向左再扩展一个 token 就不再相同
+    left_max = (pos_a == 0) | (pos_b == 0)
+    inner = ~left_max
+    left_max[inner] = seq[pos_a[inner] - 1] != seq[pos_b[inner] + n_a]
+    pos_a, pos_b, lengths = pos_a[left_max], pos_b[left_max], lengths[left_max]
+
+    order = np.argsort(-lengths, kind="stable")[:MAX_PASSAGES]
+    return [(int(pos_a[k]), int(pos_b[k]), int(lengths[k])) for k in order]
@@ -1,37 +1,165 @@
 import asyncio
-import math
+import hashlib
+import itertools
 import re
-from collections import Counter, defaultdict
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Any, Tuple
+import unicodedata
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, Tuple, Union
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
+from sqlalchemy import select, text, func, tuple_, or_
+from app.core.config import settings
 from app.models import Document
 from app.models.library_document import LibraryDocument
+from app.models.library_document_band import LibraryDocumentBand
 from app.models.document_library import DocumentLibrary
 from app.models.batch_library import BatchLibrary
 from app.services.embedding import EmbeddingService
-
-
-# 用于并行精确对比的线程池
-_executor = ThreadPoolExecutor(max_workers=4)
+from app.services.minhash import MinHashLSH
+from app.services.simhash import SimHash, MAX_DISTANCE
+from app.services.chunk_store import ChunkStore
+from app.services.fingerprint import ChunkFingerprint, pruned_scores, hash_tokens
+from app.services.winnowing import WinnowFingerprint, winnowing_compare
+from app.services import compare_pool, filtered_ann, stream_compare
+from app.services.passage_alignment import MAX_PASSAGES, find_common_passages
+from app.services.retrieval_pipeline import PipelineConfig, reciprocal_rank_fusion, run_stage, wait_within
+from app.services.whitelist_index import WhitelistIndex
+from app.services.batch_index import candidate_pairs
+
+# 可选的纯文本对比策略：chunk = 固定分块 Jaccard/余弦混合，winnowing = MOSS 风格指纹片段匹配
+COMPARE_STRATEGIES = ("chunk", "winnowing")
+
+# 分词正则：中文按字符，英文/数字按单词
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fff]|[a-zA-Z0-9]+')
+# 规范化哈希前去掉的空白字符
+_SPACE_RE = re.compile(r'\s+')
+
+# LSH 粗筛返回的候选数量上限（默认值，流水线 signature 阶段的 limit 可覆盖）
+LSH_CANDIDATE_LIMIT = 50
+
+# 批次内对比每次并发的文档对数
+PAIR_COMPARE_CHUNK = 256
+
+# chunk 级向量检索：单条 SQL 的查询 chunk 数（超长文档分多条查询，所有 chunk 都参与），以及每个查询 chunk 取回的最近 chunk 数
+VECTOR_QUERY_CHUNKS = 128
+CHUNK_HITS_PER_QUERY = 10
+
+# 向量索引精度与维度（见 EMBEDDING_INDEX_PRECISION / EMBEDDING_DIM），决定索引排序使用的距离表达式
+_INDEX_PRECISION = filtered_ann.index_precision(settings.EMBEDDING_INDEX_PRECISION)
+_DOC_APPROX = filtered_ann.approx_distance(
+    "embedding", "CAST(:embedding AS vector)", _INDEX_PRECISION, settings.EMBEDDING_DIM
+)
+_CHUNK_APPROX = filtered_ann.approx_distance("c.embedding", "q.v", _INDEX_PRECISION, settings.EMBEDDING_DIM)
+
+# 文档级近邻检索：INDEX 用 hnsw 索引过量取回 :fetch 个近邻后按文档库过滤，并按全精度向量重排；
+# EXACT 先按文档库过滤再精确排序（距离表达式加 0，使排序不匹配索引，规划器不会走 hnsw）
+_DOC_ANN_INDEX = text(f"""
+    SELECT ld.id, ld.library_id, ld.filename, dl.name AS library_name,
+           ld.embedding <=> CAST(:embedding AS vector) AS distance
+    FROM (
+        SELECT id
+        FROM library_documents
+        WHERE embedding IS NOT NULL
+        ORDER BY {_DOC_APPROX}
+        LIMIT :fetch
+    ) near
+    JOIN library_documents ld ON ld.id = near.id
+    JOIN document_libraries dl ON dl.id = ld.library_id
+    WHERE ld.library_id = ANY(:library_ids)
+      AND ld.status = 'ready'
+    ORDER BY distance
+    LIMIT :top_k
+""")
+_DOC_ANN_EXACT = text("""
+    SELECT ld.id, ld.library_id, ld.filename, dl.name AS library_name,
+           ld.embedding <=> CAST(:embedding AS vector) AS distance
+    FROM library_documents ld
+    JOIN document_libraries dl ON dl.id = ld.library_id
+    WHERE ld.library_id = ANY(:library_ids)
+      AND ld.status = 'ready'
+      AND ld.embedding IS NOT NULL
+    ORDER BY (ld.embedding <=> CAST(:embedding AS vector)) + 0
+    LIMIT :top_k
+""")
+
+# chunk 级近邻检索：每个查询 chunk 取 :per_chunk 个所选文档库中的近邻 chunk，再按文档聚合，
+# 返回最相似 chunk 的余弦相似度（best）与命中的查询 chunk 数（covered），按两者之积排序
+_CHUNK_ANN = """
+    WITH q AS (
+        SELECT ord, CAST(v AS vector) AS v
+        FROM unnest(CAST(:vectors AS text[])) WITH ORDINALITY AS t(v, ord)
+    )
+    SELECT hit.library_document_id, ld.library_id, ld.filename, dl.name AS library_name,
+           max(1 - hit.distance) AS best, count(DISTINCT q.ord) AS covered
+    FROM q
+    CROSS JOIN LATERAL ({hits}) hit
+    JOIN library_documents ld ON ld.id = hit.library_document_id
+    JOIN document_libraries dl ON dl.id = ld.library_id
+    WHERE ld.status = 'ready'
+    GROUP BY hit.library_document_id, ld.library_id, ld.filename, dl.name
+    ORDER BY max(1 - hit.distance) * count(DISTINCT q.ord) DESC
+    LIMIT :top_k
+"""
+_CHUNK_HITS_INDEX = f"""
+        SELECT near.library_document_id, near.embedding <=> q.v AS distance
+        FROM (
+            SELECT c.library_document_id, c.library_id, c.embedding
+            FROM library_document_chunks c
+            WHERE c.embedding IS NOT NULL
+            ORDER BY {_CHUNK_APPROX}
+            LIMIT :fetch
+        ) near
+        WHERE near.library_id = ANY(:library_ids)
+        ORDER BY distance
+        LIMIT :per_chunk
+"""
+_CHUNK_HITS_EXACT = """
+        SELECT c.library_document_id, c.embedding <=> q.v AS distance
+        FROM library_document_chunks c
+        WHERE c.library_id = ANY(:library_ids)
+          AND c.embedding IS NOT NULL
+        ORDER BY (c.embedding <=> q.v) + 0
+        LIMIT :per_chunk
+"""
+
+# 各文档库中可参与向量检索的文档数：就绪且有整篇向量的文档 / 有 chunk 向量的文档
+_VECTOR_DOC_COUNTS = text("""
+    SELECT library_id, count(*)
+    FROM library_documents
+    WHERE status = 'ready' AND embedding IS NOT NULL
+    GROUP BY library_id
+""")
+_VECTOR_CHUNK_DOC_COUNTS = text("""
+    SELECT library_id, count(DISTINCT library_document_id)
+    FROM library_document_chunks
+    WHERE embedding IS NOT NULL AND library_id IS NOT NULL
+    GROUP BY library_id
+""")
 
 
 class PlagiarismService:
-    def __init__(self, db_session: AsyncSession = None, whitelist_fingerprints: List[Dict] = None):
+    def __init__(
+        self,
+        db_session: AsyncSession = None,
+        whitelist_fingerprints: List[ChunkFingerprint] = None,
+        compare_strategy: str = "chunk",
+        whitelist_index: WhitelistIndex = None,
+        pipeline: PipelineConfig = None,
+    ):
         self.db_session = db_session
         self.embedding_service = EmbeddingService()
-        self.whitelist_fps = whitelist_fingerprints or []
-
-    def _is_whitelisted(self, chunk_text: str, threshold: float = 0.75) -> bool:
-        """检查文本片段是否匹配白名单"""
-        if not self.whitelist_fps:
+        self.whitelist_index = whitelist_index or WhitelistIndex(whitelist_fingerprints or [])
+        self.compare_strategy = compare_strategy if compare_strategy in COMPARE_STRATEGIES else "chunk"
+        self.pipeline = pipeline or PipelineConfig.from_layers()
+        # 向量检索的各文档库可检索文档数，每个服务实例（一个批次）只统计一次
+        self._vector_counts: Dict[Any, Dict[Any, int]] = {}
+
+    def _is_whitelisted(self, chunk: Union[str, ChunkFingerprint], threshold: float = 0.75) -> bool:
+        """检查文本片段是否匹配白名单（可直接传入已计算好的 chunk 指纹）"""
+        if not len(self.whitelist_index):
             return False
-        fp = self._precompute_chunk(chunk_text)
-        for wl_fp in self.whitelist_fps:
-            if self._similarity_from_fingerprints(fp, wl_fp) >= threshold:
-                return True
-        return False
+        fp = self._precompute_chunk(chunk) if isinstance(chunk, str) else chunk
+        return self.whitelist_index.match(fp, threshold)
 
     # ==================== 纯文本相似度算法（不依赖 API）====================
 
@@ -42,10 +170,21 @@ class PlagiarismService:
             return []
         tokens = []
         # 分割中英文混合文本
-        for segment in re.findall(r'[\u4e00-\u9fff]|[a-zA-Z0-9]+', text.lower()):
+        for segment in _TOKEN_RE.findall(text.lower()):
             tokens.append(segment)
         return tokens
 
+    @staticmethod
+    def tokenize_with_spans(text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """分词并保留每个 token 在原文中的字符区间"""
+        if not text:
+            return [], []
+        tokens, spans = [], []
+        for m in _TOKEN_RE.finditer(text.lower()):
+            tokens.append(m.group())
+            spans.append(m.span())
+        return tokens, spans
+
     @staticmethod
     def ngrams(tokens: List[str], n: int = 3) -> List[str]:
         """生成 n-gram"""
@@ -56,60 +195,19 @@ class PlagiarismService:
     # ==================== 第1层：预计算指纹 ====================
 
     @classmethod
-    def _precompute_chunk(cls, chunk_text: str) -> Dict[str, Any]:
-        """对单个 chunk 一次性预计算所有需要的指纹数据"""
-        tokens = cls.tokenize(chunk_text)
-        if not tokens:
-            return {
-                "tokens": [],
-                "bigram_set": frozenset(),
-                "trigram_counter": Counter(),
-                "trigram_norm": 0.0,
-            }
-
-        bigrams = cls.ngrams(tokens, 2)
-        trigrams = cls.ngrams(tokens, 3)
-        trigram_counter = Counter(trigrams)
-        trigram_norm = math.sqrt(sum(v * v for v in trigram_counter.values()))
-
-        return {
-            "tokens": tokens,
-            "bigram_set": frozenset(bigrams),
-            "trigram_counter": trigram_counter,
-            "trigram_norm": trigram_norm,
-        }
+    def _precompute_chunk(cls, chunk_text: str) -> ChunkFingerprint:
+        """对单个 chunk 一次性预计算所有需要的指纹数据（哈希后的 n-gram 数组）"""
+        return ChunkFingerprint.from_tokens(cls.tokenize(chunk_text))
 
     @staticmethod
-    def _similarity_from_fingerprints(fp_a: Dict, fp_b: Dict) -> float:
+    def _similarity_from_fingerprints(fp_a: ChunkFingerprint, fp_b: ChunkFingerprint) -> float:
         """基于预计算指纹直接计算相似度，无需重新分词"""
-        bigram_set_a = fp_a["bigram_set"]
-        bigram_set_b = fp_b["bigram_set"]
-
-        if not bigram_set_a or not bigram_set_b:
-            return 0.0
+        return fp_a.similarity(fp_b)
 
-        # Jaccard (2-gram)
-        intersection = len(bigram_set_a & bigram_set_b)
-        union = len(bigram_set_a | bigram_set_b)
-        jaccard = intersection / union if union else 0.0
-
-        # Cosine (3-gram) - 优化：只遍历较小的 Counter
-        counter_a = fp_a["trigram_counter"]
-        counter_b = fp_b["trigram_counter"]
-        norm_a = fp_a["trigram_norm"]
-        norm_b = fp_b["trigram_norm"]
-
-        if norm_a == 0 or norm_b == 0:
-            return round(0.4 * jaccard, 4)
-
-        # 遍历较小的 counter 做 dot product
-        if len(counter_a) > len(counter_b):
-            counter_a, counter_b = counter_b, counter_a
-
-        dot = sum(count * counter_b[gram] for gram, count in counter_a.items() if gram in counter_b)
-        cosine = dot / (norm_a * norm_b)
-
-        return round(0.4 * jaccard + 0.6 * cosine, 4)
+    @classmethod
+    def minhash_signature(cls, text: str):
+        """基于全文 3-gram shingle 计算 MinHash 签名"""
+        return MinHashLSH.signature(cls.ngrams(cls.tokenize(text), 3))
 
     @classmethod
     def text_similarity(cls, text_a: str, text_b: str) -> float:
@@ -121,327 +219,1059 @@ class PlagiarismService:
         fp_b = cls._precompute_chunk(text_b)
         return cls._similarity_from_fingerprints(fp_a, fp_b)
 
+    # ==================== 第0层：精确重复（哈希）====================
+
+    @staticmethod
+    def normalize_for_hash(text: str) -> str:
+        """精确重复判定用的规范化：NFKC（全角转半角等）、小写、去掉全部空白"""
+        return _SPACE_RE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+    @classmethod
+    def text_hash(cls, text: str) -> Optional[str]:
+        """规范化文本的 sha256；空文本返回 None，避免所有空文档互相命中"""
+        normalized = cls.normalize_for_hash(text) if text else ""
+        if not normalized:
+            return None
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def exact_passages(cls, text_a: str, length_b: int) -> List[Dict[str, Any]]:
+        """精确重复时整篇即一个公共片段"""
+        return [{
+            "source_start": 0,
+            "source_end": len(text_a),
+            "target_start": 0,
+            "target_end": length_b,
+            "length": len(cls.tokenize(text_a)),
+            "text": text_a[:200],
+        }]
+
+    @staticmethod
+    def exact_keys(document) -> List[Tuple[str, str]]:
+        """文档的精确重复键：规范化文本哈希与原始字节哈希，任一相同即视为重复"""
+        keys = []
+        if document.text_hash:
+            keys.append(("text", document.text_hash))
+        if document.content_hash:
+            keys.append(("raw", document.content_hash))
+        return keys
+
+    # ==================== 第1层：近似重复（SimHash）====================
+
+    @classmethod
+    def simhash_signature(cls, text: str) -> int:
+        """基于全文 3-gram 计数权重计算 64 位 SimHash"""
+        return SimHash.from_fingerprint(cls._precompute_chunk(text))
+
+    @classmethod
+    def apply_simhash(cls, doc: Union[Document, LibraryDocument], text: str) -> None:
+        """计算并写入文档的 SimHash 签名与 band 列（Document / LibraryDocument 通用）"""
+        if not text:
+            return
+        signature = cls.simhash_signature(text)
+        doc.simhash = SimHash.to_db(signature)
+        doc.simhash_b0, doc.simhash_b1, doc.simhash_b2, doc.simhash_b3 = SimHash.bands(signature)
+
     # ==================== 第2层：倒排索引加速分块匹配 ====================
 
+    @staticmethod
+    def iter_chunk_spans(text: str, chunk_size: int = 500, overlap: int = 50) -> Iterator[Tuple[int, str]]:
+        """逐个产生带重叠的块及其起始字符位置（跳过空白块；全部为空白时产生原文）"""
+        produced = False
+        for i in range(0, len(text), chunk_size - overlap):
+            chunk = text[i:i + chunk_size]
+            if chunk.strip():
+                produced = True
+                yield i, chunk
+            if i + chunk_size >= len(text):
+                break
+        if not produced:
+            yield 0, text
+
+    @classmethod
+    def iter_chunks(cls, text: str, chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+        """按需切分文本的生成器，流式对比时不必一次性持有全部分块"""
+        return (chunk for _, chunk in cls.iter_chunk_spans(text, chunk_size, overlap))
+
+    @classmethod
+    def split_chunks(cls, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """将文本切分为带重叠的块（跳过空白块）"""
+        return list(cls.iter_chunks(text, chunk_size, overlap))
+
+    @classmethod
+    def prepare_chunks(cls, text: str) -> Tuple[List[str], List[ChunkFingerprint]]:
+        """分块并预计算每个 chunk 的指纹"""
+        chunks = cls.split_chunks(text)
+        return chunks, [cls._precompute_chunk(c) for c in chunks]
+
     def text_chunk_compare(self, text_a: str, text_b: str, chunk_size: int = 500, overlap: int = 50) -> Dict[str, Any]:
         """纯文本分块对比，使用倒排索引加速匹配"""
         if not text_a or not text_b:
             return {"score": 0.0, "matches": []}
 
-        # 分块
-        def chunk_text(t):
-            chunks = []
-            for i in range(0, len(t), chunk_size - overlap):
-                chunk = t[i:i + chunk_size]
-                if chunk.strip():
-                    chunks.append(chunk)
-                if i + chunk_size >= len(t):
-                    break
-            return chunks if chunks else [t]
-
-        chunks_a = chunk_text(text_a)
-        chunks_b = chunk_text(text_b)
-
-        # 第1层：预计算所有 chunk 的指纹（chunks_b 只算一次）
-        fps_a = [self._precompute_chunk(c) for c in chunks_a]
+        # 第1层：预计算 chunk 指纹（chunks_b 只算一次，作为索引一侧）
+        chunks_b = self.split_chunks(text_b, chunk_size, overlap)
         fps_b = [self._precompute_chunk(c) for c in chunks_b]
 
-        # 第2层：构建倒排索引 bigram -> [chunk_b 索引列表]
-        inverted_index = defaultdict(set)
-        for j, fp_b in enumerate(fps_b):
-            for bigram in fp_b["bigram_set"]:
-                inverted_index[bigram].add(j)
+        # 预计超出内存上限时，A 一侧逐块生成、逐块打分
+        if stream_compare.needs_streaming(len(text_a), len(text_b)):
+            return self.stream_chunk_compare(self.iter_chunks(text_a, chunk_size, overlap), chunks_b, fps_b)
 
-        matches = []
-        total_similarity = 0.0
+        chunks_a = self.split_chunks(text_a, chunk_size, overlap)
+        fps_a = [self._precompute_chunk(c) for c in chunks_a]
+        return self.compare_chunk_fingerprints(chunks_a, fps_a, chunks_b, fps_b)
 
-        for i, fp_a in enumerate(fps_a):
-            best_score = 0.0
-            best_idx = -1
+    def _stream_blocks(self, chunks_a: Iterable[str], n_index: int) -> Iterator[Tuple[int, List[str], List[ChunkFingerprint]]]:
+        """流式一侧：按内存上限切块，每块现算指纹，用完即弃"""
+        for offset, block in stream_compare.blocks(chunks_a, stream_compare.block_rows(n_index)):
+            yield offset, block, [self._precompute_chunk(c) for c in block]
 
-            # 通过倒排索引找共享 bigram 的候选 chunk_b
-            candidate_counts = Counter()
-            for bigram in fp_a["bigram_set"]:
-                if bigram in inverted_index:
-                    for j in inverted_index[bigram]:
-                        candidate_counts[j] += 1
+    def stream_chunk_compare(
+        self, chunks_a: Iterable[str], chunks_b: List[str], fps_b: List[ChunkFingerprint]
+    ) -> Dict[str, Any]:
+        """
+        流式分块对比：B 一侧的指纹常驻作为索引，A 一侧从生成器逐块读取并打分，
+        峰值内存由 COMPARE_MEMORY_LIMIT_MB 控制，与 A 的长度无关。结果与整体对比一致。
+        """
+        if not chunks_b:
+            return {"score": 0.0, "matches": []}
+        matches, total, count = [], 0.0, 0
+        check_b = self._whitelist_checker(chunks_b, fps_b)
+        for offset, block, fps in self._stream_blocks(chunks_a, len(fps_b)):
+            best_indices, best_scores = compare_pool.best_chunk_matches(fps, fps_b, 0.3, stream_compare.join_pairs())
+            total = self._match_rows(best_indices, best_scores, block, chunks_b, 0.3,
+                                     self._whitelist_checker(block, fps), check_b, matches, offset, total)
+            count += len(block)
+        if not count:
+            return {"score": 0.0, "matches": []}
+        return {"score": round(total / count, 4), "matches": matches}
 
-            # 只对共享 bigram >= 3 的候选做精确计算
-            candidates_j = [j for j, cnt in candidate_counts.items() if cnt >= 3]
+    def compare_chunk_fingerprints(
+        self, chunks_a: List[str], fps_a: List[ChunkFingerprint], chunks_b: List[str], fps_b: List[ChunkFingerprint]
+    ) -> Dict[str, Any]:
+        """基于已预计算的 chunk 指纹做分块对比（文档库一侧可直接使用存储的指纹）"""
+        if not chunks_a or not chunks_b:
+            return {"score": 0.0, "matches": []}
 
-            # 如果没有候选（文档差异很大），跳过
-            if not candidates_j:
-                continue
+        # 第2层：稀疏矩阵乘积打分，按行取最优匹配；候选阶段剪掉不可能超过阈值或成为最优的 chunk 对
+        scores = pruned_scores(fps_a, fps_b, 0.3)
+        return self._collect_matches(
+            scores, chunks_a, chunks_b, 0.3,
+            self._whitelist_checker(chunks_a, fps_a), self._whitelist_checker(chunks_b, fps_b),
+        )
 
-            for j in candidates_j:
-                score = self._similarity_from_fingerprints(fp_a, fps_b[j])
-                if score > best_score:
-                    best_score = score
-                    best_idx = j
+    def _whitelist_checker(self, chunks: List[str], fps: List[ChunkFingerprint] = None):
+        """按 chunk 下标检查白名单并缓存结果（有指纹时直接复用指纹）"""
+        cache = {}
 
-            if best_score > 0.3:
-                # 白名单过滤：检查 source_chunk 或 target_chunk 是否匹配白名单
-                if self._is_whitelisted(chunks_a[i]) or self._is_whitelisted(chunks_b[best_idx]):
-                    continue
-                matches.append({
-                    "source_chunk": chunks_a[i][:200],
-                    "target_chunk": chunks_b[best_idx][:200],
-                    "score": round(best_score, 4),
-                    "source_index": i,
-                    "target_index": best_idx,
-                })
-                total_similarity += best_score
+        def check(idx: int) -> bool:
+            if idx not in cache:
+                cache[idx] = self._is_whitelisted(fps[idx] if fps is not None else chunks[idx])
+            return cache[idx]
+        return check
 
-        overall_score = total_similarity / len(chunks_a) if chunks_a else 0.0
+    @staticmethod
+    def _collect_matches(scores: np.ndarray, chunks_a: List[str], chunks_b: List[str], threshold: float,
+                         whitelisted_a, whitelisted_b) -> Dict[str, Any]:
+        """从 chunk 得分矩阵中按行取最优匹配，过滤白名单后汇总为对比结果"""
+        if not chunks_a or not chunks_b:
+            return {"score": 0.0, "matches": []}
+
+        best_indices = scores.argmax(axis=1)
+        best_scores = scores[np.arange(scores.shape[0]), best_indices]
+        return PlagiarismService._assemble_matches(
+            best_indices, best_scores, chunks_a, chunks_b, threshold, whitelisted_a, whitelisted_b
+        )
+
+    @staticmethod
+    def _assemble_matches(best_indices: np.ndarray, best_scores: np.ndarray, chunks_a: List[str], chunks_b: List[str],
+                          threshold: float, whitelisted_a, whitelisted_b) -> Dict[str, Any]:
+        """根据每个 chunk 的最优匹配下标与得分生成对比结果（打分可在工作进程中完成）"""
+        if not chunks_a or not chunks_b:
+            return {"score": 0.0, "matches": []}
+
+        matches = []
+        total_similarity = PlagiarismService._match_rows(
+            best_indices, best_scores, chunks_a, chunks_b, threshold, whitelisted_a, whitelisted_b, matches
+        )
+        overall_score = total_similarity / len(chunks_a)
 
         return {
             "score": round(overall_score, 4),
             "matches": matches,
         }
 
-    # ==================== 向量相似度算法 ====================
-
     @staticmethod
-    def calculate_similarity(embedding_a, embedding_b) -> float:
-        """计算两个向量的余弦相似度"""
-        if not embedding_a or not embedding_b:
-            return 0.0
+    def _match_rows(best_indices: np.ndarray, best_scores: np.ndarray, chunks_a: List[str], chunks_b: List[str],
+                    threshold: float, whitelisted_a, whitelisted_b, matches: List[Dict[str, Any]],
+                    offset: int = 0, total_similarity: float = 0.0) -> float:
+        """把超过阈值的最优匹配追加到 matches，返回累加后的相似度总和（流式对比时 offset 为块的起始序号）"""
+        for i in np.flatnonzero(best_scores > threshold).tolist():
+            best_idx = int(best_indices[i])
+            best_score = float(best_scores[i])
+
+            # 白名单过滤：检查 source_chunk 或 target_chunk 是否匹配白名单
+            if whitelisted_b(best_idx) or whitelisted_a(i):
+                continue
+            matches.append({
+                "source_chunk": chunks_a[i][:200],
+                "target_chunk": chunks_b[best_idx][:200],
+                "score": round(best_score, 4),
+                "source_index": offset + i,
+                "target_index": best_idx,
+            })
+            total_similarity += best_score
+        return total_similarity
+
+    # ==================== Winnowing 指纹片段匹配 ====================
 
-        dot = sum(a * b for a, b in zip(embedding_a, embedding_b))
-        norm_a = math.sqrt(sum(a * a for a in embedding_a))
-        norm_b = math.sqrt(sum(b * b for b in embedding_b))
+    @classmethod
+    def winnow(cls, text: str) -> WinnowFingerprint:
+        """计算文本的 winnowing 指纹"""
+        return WinnowFingerprint.from_tokens(*cls.tokenize_with_spans(text))
+
+    def winnowing_compare(
+        self, text_a: str, text_b: str, fp_a: WinnowFingerprint = None,
+        fp_b: WinnowFingerprint = None, passages: List[Dict[str, int]] = None,
+    ) -> Dict[str, Any]:
+        """基于 winnowing 指纹的片段对比，不受分块边界影响（可传入工作进程已算好的片段）"""
+        if not text_a or not text_b:
+            return {"score": 0.0, "matches": []}
+        fp_a = fp_a or self.winnow(text_a)
+        fp_b = fp_b or self.winnow(text_b)
+        return winnowing_compare(fp_a, fp_b, text_a, text_b, self._is_whitelisted, passages=passages)
 
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
+    # ==================== 后缀数组精确片段定位 ====================
 
-        return dot / (norm_a * norm_b)
+    @classmethod
+    def token_stream(cls, text: str) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """文本的 token 哈希序列及对应字符区间"""
+        tokens, spans = cls.tokenize_with_spans(text)
+        return hash_tokens(tokens), spans
 
-    # ==================== 文档对比（自动选择策略）====================
+    def align_passages(
+        self, text_a: str, text_b: str, stream_a: Tuple[np.ndarray, List[Tuple[int, int]]] = None
+    ) -> List[Dict[str, Any]]:
+        """用后缀数组找出两文档间的极大公共片段，返回两侧的字符偏移"""
+        if not text_a or not text_b:
+            return []
+        tokens_a, spans_a = stream_a or self.token_stream(text_a)
+        tokens_b, spans_b = self.token_stream(text_b)
+        return self.passages_from_alignment(
+            find_common_passages(tokens_a, tokens_b), text_a, spans_a, spans_b
+        )
 
-    async def compare_documents(self, doc_a_text: str, doc_b_text: str) -> Dict[str, Any]:
+    def passages_from_alignment(
+        self, common: List[Tuple[int, int, int]], text_a: str,
+        spans_a: List[Tuple[int, int]], spans_b: List[Tuple[int, int]],
+    ) -> List[Dict[str, Any]]:
+        """将 token 级公共片段换算为字符偏移，并过滤白名单"""
+        passages = []
+        for pos_a, pos_b, length in common:
+            source_start, source_end = spans_a[pos_a][0], spans_a[pos_a + length - 1][1]
+            target_start, target_end = spans_b[pos_b][0], spans_b[pos_b + length - 1][1]
+            if self._is_whitelisted(text_a[source_start:source_end]):
+                continue
+            passages.append({
+                "source_start": source_start,
+                "source_end": source_end,
+                "target_start": target_start,
+                "target_end": target_end,
+                "length": length,
+                "text": text_a[source_start:source_end][:200],
+            })
+        passages.sort(key=lambda p: p["source_start"])
+        return passages
+
+    # ==================== 批次内查重 ====================
+
+    def find_exact_in_batch(self, documents: List[Document]) -> Dict[Any, List[Dict[str, Any]]]:
+        """批次内精确重复：按哈希分组，同组文档互为 100% 相同。返回 文档 ID -> 重复文档列表"""
+        groups: Dict[Tuple[str, str], List[Document]] = {}
+        for doc in documents:
+            for key in self.exact_keys(doc):
+                groups.setdefault(key, []).append(doc)
+
+        results: Dict[Any, List[Dict[str, Any]]] = {d.id: [] for d in documents}
+        for doc in documents:
+            seen = {doc.id}
+            for key in self.exact_keys(doc):
+                for other in groups[key]:
+                    if other.id in seen:
+                        continue
+                    seen.add(other.id)
+                    results[doc.id].append({
+                        "document_id": str(other.id),
+                        "filename": other.filename,
+                        "similarity": 1.0,
+                        "matches": [],
+                        "passages": self.exact_passages(doc.text_content or "", len(other.text_content or "")),
+                        "source_type": "internal",
+                        "exact": True,
+                    })
+        return results
+
+    @staticmethod
+    def share_with_duplicates(
+        results_by_doc: Dict[Any, List[Dict[str, Any]]], copies: Dict[Any, List[Document]]
+    ) -> Dict[Any, List[Dict[str, Any]]]:
         """
-        比较两个文档的相似度。
-        优先使用向量对比（API 可用时），否则回退到纯文本对比。
+        批次内重复副本不参与模糊对比，由第一份（主文档）的批次内结果补齐：
+        其他文档对主文档的结果为每个副本各复制一份，副本得到主文档对其他文档的全部结果。
+        copies 为 主文档 ID -> 副本文档列表。
         """
-        if not doc_a_text or not doc_b_text:
-            return {"score": 0.0, "matches": []}
+        shared = {doc_id: list(results) for doc_id, results in results_by_doc.items()}
+        primary_ids = {str(primary_id): primary_id for primary_id in copies}
+        for results in shared.values():
+            for res in list(results):
+                primary_id = primary_ids.get(res["document_id"])
+                if primary_id is None:
+                    continue
+                for copy in copies[primary_id]:
+                    results.append({**res, "document_id": str(copy.id), "filename": copy.filename})
+        for primary_id, copy_docs in copies.items():
+            for copy in copy_docs:
+                shared[copy.id] = [dict(res) for res in shared.get(primary_id, [])]
+        return shared
+
+    async def find_similar_pairs_in_batch(self, documents: List[Document]) -> Dict[Any, List[Dict[str, Any]]]:
+        """
+        批次级全量对比：每个文档只分块/算指纹（或向量）一次，通过倒排索引只枚举候选文档对
+        （有 chunk 向量的文档两两对比，不做词法剪枝），每对文档只对比一次并同时得到两个方向的结果。
+        返回 文档 ID -> 相似文档列表。
+        """
+        docs = [d for d in documents if d.text_content]
+        results: Dict[Any, List[Dict[str, Any]]] = {d.id: [] for d in documents}
+        if len(docs) < 2:
+            return results
+
+        # 每个文档只预处理一次
+        use_vector = self.compare_strategy == "chunk" and self.embedding_service.is_available
+        prepared = []
+        for doc in docs:
+            chunks, fps = self.prepare_chunks(doc.text_content)
+            entry = {"chunks": chunks, "fps": fps}
+            if self.compare_strategy == "winnowing":
+                entry["winnow"] = self.winnow(doc.text_content)
+            elif use_vector:
+                entry["emb_chunks"], entry["embeddings"] = await self.embedding_service.document_chunks(doc)
+            prepared.append(entry)
+
+        doc_grams = [
+            np.unique(np.concatenate([fp.trigrams for fp in p["fps"]])) if p["fps"] else np.empty(0, dtype=np.uint64)
+            for p in prepared
+        ]
+
+        pairs = candidate_pairs(doc_grams)
+        if use_vector:
+            # 改写类抄袭共享的 3-gram 很少，会被词法剪枝漏掉；向量对比只是一次小矩阵乘法，
+            # 因此两篇都有 chunk 向量的文档对全部对比，词法剪枝只用于缺少向量的文档
+            embedded = [k for k, p in enumerate(prepared) if p["embeddings"].size]
+            pairs = sorted(set(pairs).union(itertools.combinations(embedded, 2)))
+        # 分块并发：同一时刻只有 PAIR_COMPARE_CHUNK 个文档对的对比在进行，协程数与内存不随文档对数增长
+        compared = []
+        for start in range(0, len(pairs), PAIR_COMPARE_CHUNK):
+            compared.extend(await asyncio.gather(*(
+                self._compare_batch_pair(docs[i], docs[j], prepared[i], prepared[j], use_vector)
+                for i, j in pairs[start:start + PAIR_COMPARE_CHUNK]
+            )))
+
+        for (i, j), (forward, backward) in zip(pairs, compared):
+            for source, target, comparison in ((docs[i], docs[j], forward), (docs[j], docs[i], backward)):
+                if comparison["score"] > 0.1:
+                    results[source.id].append({
+                        "document_id": str(target.id),
+                        "filename": target.filename,
+                        "similarity": comparison["score"],
+                        "matches": comparison["matches"],
+                        "source_type": "internal",
+                    })
 
-        # 策略1：如果 Embedding API 可用，使用向量对比
-        if self.embedding_service.is_available:
-            chunks_a, embeddings_a = self.embedding_service.encode_chunks(doc_a_text)
-            chunks_b, embeddings_b = self.embedding_service.encode_chunks(doc_b_text)
+        for doc_results in results.values():
+            doc_results.sort(key=lambda x: x["similarity"], reverse=True)
+        return results
 
-            if embeddings_a and embeddings_b:
-                matches = []
-                total_similarity = 0.0
-
-                for i, emb_a in enumerate(embeddings_a):
-                    best_match_score = 0.0
-                    best_match_idx = -1
-
-                    for j, emb_b in enumerate(embeddings_b):
-                        score = self.calculate_similarity(emb_a, emb_b)
-                        if score > best_match_score:
-                            best_match_score = score
-                            best_match_idx = j
-
-                    if best_match_score > 0.75:
-                        # 白名单过滤
-                        if self._is_whitelisted(chunks_a[i]) or self._is_whitelisted(chunks_b[best_match_idx]):
-                            continue
-                        matches.append({
-                            "source_chunk": chunks_a[i][:200],
-                            "target_chunk": chunks_b[best_match_idx][:200],
-                            "score": round(best_match_score, 4),
-                            "source_index": i,
-                            "target_index": best_match_idx,
-                        })
-                        total_similarity += best_match_score
-
-                overall_score = total_similarity / len(chunks_a) if chunks_a else 0.0
-                return {"score": round(overall_score, 4), "matches": matches}
-
-        # 策略2：回退到纯文本对比
-        return self.text_chunk_compare(doc_a_text, doc_b_text)
+    async def _compare_batch_pair(
+        self, doc_a: Document, doc_b: Document, a: Dict[str, Any], b: Dict[str, Any], use_vector: bool
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """对比批次内一对文档，返回 (A→B, B→A) 两个方向的结果"""
+        if self.compare_strategy == "winnowing":
+            forward_passages, backward_passages = await asyncio.gather(
+                compare_pool.run(compare_pool.winnow_passages, a["winnow"], b["winnow"]),
+                compare_pool.run(compare_pool.winnow_passages, b["winnow"], a["winnow"]),
+            )
+            forward = winnowing_compare(a["winnow"], b["winnow"], doc_a.text_content, doc_b.text_content,
+                                        self._is_whitelisted, passages=forward_passages)
+            backward = winnowing_compare(b["winnow"], a["winnow"], doc_b.text_content, doc_a.text_content,
+                                         self._is_whitelisted, passages=backward_passages)
+            return forward, backward
+
+        if use_vector and a["embeddings"].size and b["embeddings"].size:
+            # 向量分块对比只是一次小矩阵乘法，直接在本进程计算
+            chunks_a, chunks_b = a["emb_chunks"], b["emb_chunks"]
+            scores = EmbeddingService.normalize(a["embeddings"]) @ EmbeddingService.normalize(b["embeddings"]).T
+            check_a, check_b = self._whitelist_checker(chunks_a), self._whitelist_checker(chunks_b)
+            # 得分矩阵对称：行方向是 A→B，列方向即 B→A
+            return (
+                self._collect_matches(scores, chunks_a, chunks_b, 0.75, check_a, check_b),
+                self._collect_matches(scores.T, chunks_b, chunks_a, 0.75, check_b, check_a),
+            )
 
-    # ==================== 批次内查重 ====================
+        chunks_a, chunks_b = a["chunks"], b["chunks"]
+        check_a, check_b = self._whitelist_checker(chunks_a, a["fps"]), self._whitelist_checker(chunks_b, b["fps"])
+        if not chunks_a or not chunks_b:
+            empty = {"score": 0.0, "matches": []}
+            return empty, empty
+        rows, row_scores, cols, col_scores = await compare_pool.run(
+            compare_pool.best_chunk_matches_both, a["fps"], b["fps"]
+        )
+        return (
+            self._assemble_matches(rows, row_scores, chunks_a, chunks_b, 0.3, check_a, check_b),
+            self._assemble_matches(cols, col_scores, chunks_b, chunks_a, 0.3, check_b, check_a),
+        )
+
+    # ==================== 文档库查重 ====================
 
-    async def find_similar_in_batch(self, document: Document, batch_id: str) -> List[Dict[str, Any]]:
-        """在同一批次中查找相似文档"""
+    async def find_exact_in_libraries(self, document: Document, library_ids: List[str]) -> List[Dict[str, Any]]:
+        """按哈希在文档库中查找精确重复（走 content_hash / text_hash 索引），命中即 100% 相同"""
         if not self.db_session:
-            raise ValueError("需要数据库会话才能进行批次搜索")
+            raise ValueError("需要数据库会话才能进行文档库搜索")
+
+        conditions = []
+        if document.text_hash:
+            conditions.append(LibraryDocument.text_hash == document.text_hash)
+        if document.content_hash:
+            conditions.append(LibraryDocument.content_hash == document.content_hash)
+        if not library_ids or not conditions:
+            return []
 
-        query = select(Document).where(
-            Document.batch_id == batch_id,
-            Document.id != document.id,
+        import uuid as uuid_mod
+        lib_id_list = [uuid_mod.UUID(lid) if isinstance(lid, str) else lid for lid in library_ids]
+        result = await self.db_session.execute(
+            select(
+                LibraryDocument.id, LibraryDocument.library_id, LibraryDocument.filename,
+                DocumentLibrary.name, func.length(LibraryDocument.text_content),
+            )
+            .join(DocumentLibrary, DocumentLibrary.id == LibraryDocument.library_id)
+            .where(
+                LibraryDocument.library_id.in_(lib_id_list),
+                LibraryDocument.status == "ready",
+                or_(*conditions),
+            )
+            .limit(self.pipeline["hash"].limit)
         )
-        result = await self.db_session.execute(query)
-        other_docs = result.scalars().all()
 
         results = []
-        for other_doc in other_docs:
-            if not other_doc.text_content:
-                continue
-            comparison = await self.compare_documents(document.text_content, other_doc.text_content)
-            if comparison["score"] > 0.1:
-                results.append({
-                    "document_id": str(other_doc.id),
-                    "filename": other_doc.filename,
-                    "similarity": comparison["score"],
-                    "matches": comparison["matches"],
-                    "source_type": "internal",
-                })
-
-        results.sort(key=lambda x: x["similarity"], reverse=True)
+        for lib_doc_id, library_id, filename, library_name, length in result.fetchall():
+            candidate = (lib_doc_id, library_id, filename, None, library_name, 1.0)
+            results.append(self._library_result(candidate, 1.0, []))
+            results[-1]["passages"] = self.exact_passages(document.text_content or "", length or 0)
+            results[-1]["exact"] = True
         return results
 
-    # ==================== 文档库查重 ====================
+    async def find_near_duplicates_in_libraries(
+        self, document: Document, library_ids: List[str], max_distance: int = MAX_DISTANCE,
+        session: AsyncSession = None,
+    ) -> List[Tuple]:
+        """
+        SimHash 近似重复查找：按 4 个 band 列做索引等值查找（任一 band 相同即为候选），
+        再按汉明距离过滤。不依赖 Embedding API 与 pgvector，返回与检索阶段相同格式的候选。
+        """
+        if document.simhash is None or not library_ids:
+            return []
+        session = session or self.db_session
+
+        import uuid as uuid_mod
+        lib_id_list = [uuid_mod.UUID(lid) if isinstance(lid, str) else lid for lid in library_ids]
+
+        signature = SimHash.from_db(document.simhash)
+        b0, b1, b2, b3 = SimHash.bands(signature)
+        result = await session.execute(
+            select(
+                LibraryDocument.id, LibraryDocument.library_id, LibraryDocument.filename,
+                DocumentLibrary.name, LibraryDocument.simhash,
+            )
+            .join(DocumentLibrary, DocumentLibrary.id == LibraryDocument.library_id)
+            .where(
+                LibraryDocument.library_id.in_(lib_id_list),
+                LibraryDocument.status == "ready",
+                or_(
+                    LibraryDocument.simhash_b0 == b0,
+                    LibraryDocument.simhash_b1 == b1,
+                    LibraryDocument.simhash_b2 == b2,
+                    LibraryDocument.simhash_b3 == b3,
+                ),
+            )
+        )
+
+        candidates = []
+        for lib_doc_id, library_id, filename, library_name, lib_simhash in result.fetchall():
+            distance = SimHash.hamming(signature, SimHash.from_db(lib_simhash))
+            if distance <= max_distance:
+                candidates.append((
+                    lib_doc_id, library_id, filename, None, library_name, SimHash.estimate_cosine(distance)
+                ))
+        candidates.sort(key=lambda x: x[5], reverse=True)
+        return candidates
 
     async def find_similar_in_libraries(
-        self, document: Document, library_ids: List[str], top_k: int = 10
+        self, document: Document, library_ids: List[str], top_k: int = None, chunk_embeddings: np.ndarray = None
     ) -> List[Dict[str, Any]]:
-        """在指定文档库中查找相似文档。支持向量检索和纯文本对比两种模式。"""
+        """
+        在指定文档库中查找相似文档，按检索流水线逐阶段执行：签名（SimHash / MinHash LSH）与向量检索并发产生候选，
+        精确对比与片段定位只处理短名单。各阶段的数量上限、得分阈值与时间预算见 self.pipeline。
+        chunk_embeddings 为待测文档的 chunk 向量（已生成时传入），用于 chunk 级向量检索。
+        """
         if not self.db_session:
             raise ValueError("需要数据库会话才能进行文档库搜索")
 
         if not library_ids:
             return []
 
-        results = []
+        signature, vector, fine = self.pipeline["signature"], self.pipeline["vector"], self.pipeline["fine"]
+        top_k = top_k or fine.limit
         use_vector = (
-            document.embedding
+            vector.enabled
+            and document.embedding is not None
+            and len(document.embedding) > 0
             and self.embedding_service.is_available
         )
 
-        if use_vector:
-            # 向量模式：使用 pgvector 做粗筛
-            candidates = await self._vector_search(document, library_ids, top_k)
-        else:
-            # 纯文本模式：直接查询所有文档库文档
-            candidates = await self._text_search(document, library_ids)
-
-        # 第3层：并行精确对比候选文档
-        valid_candidates = [c for c in candidates if c[5] >= 0.05]
-        if valid_candidates:
-            loop = asyncio.get_event_loop()
-            compare_tasks = []
-            for candidate in valid_candidates:
-                lib_doc_id, library_id, filename, lib_text, library_name, coarse_score = candidate
-                if document.text_content and lib_text:
-                    # 纯文本对比放到线程池并行执行
-                    compare_tasks.append((
-                        candidate,
-                        loop.run_in_executor(
-                            _executor,
-                            self.text_chunk_compare,
-                            document.text_content,
-                            lib_text,
-                        )
-                    ))
-                else:
-                    compare_tasks.append((candidate, None))
+        # 向量检索与词法检索（MinHash LSH）并发执行，结果按倒数排名融合。
+        # 带时间预算的检索阶段超时会被取消，因此各自使用独立的只读会话，取消不会影响批次主会话
+        async def vector_candidates() -> List[Tuple]:
+            if not use_vector:
+                return []
+            async with self._side_session() as session:
+                found = await self._vector_search(
+                    document, library_ids, vector.limit,
+                    session=session, fallback=False, chunk_embeddings=chunk_embeddings,
+                )
+            return [c for c in found if c[5] >= vector.threshold]
+
+        async def lexical_candidates() -> List[Tuple]:
+            if not signature.enabled:
+                return []
+            async with self._side_session() as session:
+                found = await self._text_search(document, library_ids, signature.limit, session=session)
+            return [c for c in found if c[5] >= signature.threshold]
+
+        async def near_duplicate_candidates() -> List[Tuple]:
+            async with self._side_session() as session:
+                return await self.find_near_duplicates_in_libraries(document, library_ids, session=session)
+
+        vector_hits, lexical_hits = await asyncio.gather(
+            run_stage(vector, vector_candidates(), []),
+            run_stage(signature, lexical_candidates(), []),
+        )
+        candidates = reciprocal_rank_fusion([vector_hits, lexical_hits])
 
-            for candidate, task in compare_tasks:
-                lib_doc_id, library_id, filename, lib_text, library_name, coarse_score = candidate
+        if signature.enabled:
+            # SimHash 近似重复命中的文档排在最前，一定进入精确对比
+            near_duplicates = await run_stage(signature, near_duplicate_candidates(), [])
+            known = {c[0] for c in near_duplicates}
+            candidates = near_duplicates + [c for c in candidates if c[0] not in known]
 
-                if task is not None:
-                    detailed = await task
-                    final_similarity = detailed["score"] if detailed["score"] > 0 else coarse_score
-                    matches = detailed["matches"]
-                else:
-                    final_similarity = coarse_score
-                    matches = []
-
-                if final_similarity > 0.05:
-                    results.append({
-                        "library_document_id": str(lib_doc_id),
-                        "library_id": str(library_id),
-                        "library_name": library_name,
-                        "filename": filename,
-                        "similarity": final_similarity,
-                        "matches": matches,
-                        "source_type": "library",
-                    })
+        # 第3层：按融合排名取短名单做精确对比。检索阶段不携带全文，这里按需加载
+        shortlist = candidates[:fine.limit]
+        results = []
+        if shortlist and not fine.enabled:
+            results = [self._library_result(c, c[5], []) for c in shortlist if c[5] > fine.threshold]
+        elif shortlist:
+            ids = [c[0] for c in shortlist]
+            lengths = await self._library_text_lengths(ids)
+            doc_length = len(document.text_content or "")
+            if stream_compare.needs_streaming(doc_length, sum(lengths.values())):
+                results = await self._compare_candidates_streaming(document, shortlist)
+            else:
+                texts = await self._load_library_texts(ids)
+                results = await self._compare_candidates(
+                    document, [c[:3] + (texts.get(c[0]),) + c[4:] for c in shortlist]
+                )
 
         results.sort(key=lambda x: x["similarity"], reverse=True)
         return results[:top_k]
 
+    @staticmethod
+    def _library_result(candidate: Tuple, similarity: float, matches: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lib_doc_id, library_id, filename, _, library_name, _ = candidate
+        return {
+            "library_document_id": str(lib_doc_id),
+            "library_id": str(library_id),
+            "library_name": library_name,
+            "filename": filename,
+            "similarity": similarity,
+            "matches": matches,
+            "passages": [],
+            "source_type": "library",
+        }
+
+    async def _compare_candidates(self, document: Document, candidates: List[Tuple]) -> List[Dict[str, Any]]:
+        """整体模式：所有候选（已带全文）并行对比；超出时间预算的候选按粗筛得分报告"""
+        fine, passage = self.pipeline["fine"], self.pipeline["passage"]
+        if self.compare_strategy == "winnowing":
+            compare_tasks = self._winnowing_tasks(document, candidates)
+        else:
+            compare_tasks = await self._chunk_compare_tasks(document, candidates)
+        done = await wait_within(fine, (task for _, task in compare_tasks))
+
+        results = []
+        for candidate, task in compare_tasks:
+            coarse_score = candidate[5]
+
+            if task is not None and task in done:
+                detailed = task.result()
+                final_similarity = detailed["score"] if detailed["score"] > 0 else coarse_score
+                matches = detailed["matches"]
+            else:
+                final_similarity = coarse_score
+                matches = []
+
+            if final_similarity > fine.threshold:
+                results.append((candidate, self._library_result(candidate, final_similarity, matches)))
+
+        # 对得分最高的若干结果做精确片段定位（与分块对比一样交给对比执行器）
+        if passage.enabled and document.text_content:
+            doc_stream = self.token_stream(document.text_content)
+            ranked = sorted(results, key=lambda r: r[1]["similarity"], reverse=True)
+            passage_tasks = [
+                (result, asyncio.ensure_future(self._align_passages_task(document.text_content, candidate[3], doc_stream)))
+                for candidate, result in ranked[:passage.limit]
+                if candidate[3] and result["similarity"] >= passage.threshold
+            ]
+            done = await wait_within(passage, (task for _, task in passage_tasks))
+            for result, task in passage_tasks:
+                if task in done:
+                    result["passages"] = task.result()
+        return [result for _, result in results]
+
+    async def _compare_candidates_streaming(self, document: Document, candidates: List[Tuple]) -> List[Dict[str, Any]]:
+        """流式模式：逐个候选加载全文并逐块对比，任一时刻只持有一篇文档库全文；超出时间预算后按粗筛得分报告"""
+        fine, passage = self.pipeline["fine"], self.pipeline["passage"]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + fine.timeout if fine.timeout else None
+
+        results = []
+        for rank, candidate in enumerate(candidates):
+            if deadline is not None and loop.time() > deadline:
+                if candidate[5] > fine.threshold:
+                    results.append(self._library_result(candidate, candidate[5], []))
+                continue
+            result = await self._compare_candidate_streaming(
+                document, candidate, align=passage.enabled and rank < passage.limit
+            )
+            if result is not None:
+                results.append(result)
+        return results
+
+    async def _compare_candidate_streaming(
+        self, document: Document, candidate: Tuple, align: bool = True
+    ) -> Union[Dict[str, Any], None]:
+        """流式模式：单个候选的对比。文档库一侧的指纹作为索引，待测文档逐块读取；片段定位只在命中的窗口内进行"""
+        fine, passage = self.pipeline["fine"], self.pipeline["passage"]
+        lib_doc_id, coarse_score = candidate[0], candidate[5]
+        lib_text = (await self._load_library_texts([lib_doc_id])).get(lib_doc_id)
+        candidate = candidate[:3] + (lib_text,) + candidate[4:]
+        text = document.text_content
+
+        detailed = None
+        if text and lib_text:
+            if self.compare_strategy == "winnowing":
+                detailed = await self._winnowing_task(text, self.winnow(text), lib_text)
+            else:
+                lib_chunks, lib_fps = (await self._load_chunk_fingerprints([candidate]))[lib_doc_id]
+                detailed = await self._stream_chunk_compare_task(text, lib_chunks, lib_fps)
+
+        if detailed is not None:
+            final_similarity = detailed["score"] if detailed["score"] > 0 else coarse_score
+            matches = detailed["matches"]
+        else:
+            final_similarity, matches = coarse_score, []
+        if final_similarity <= fine.threshold:
+            return None
+
+        result = self._library_result(candidate, final_similarity, matches)
+        if align and text and lib_text and matches and final_similarity >= passage.threshold:
+            # 流式模式逐个候选定位片段，时间预算按单个候选计
+            result["passages"] = await run_stage(passage, self._windowed_passages_task(text, lib_text, matches), [])
+        return result
+
+    async def _stream_chunk_compare_task(
+        self, text_a: str, chunks_b: List[str], fps_b: List[ChunkFingerprint]
+    ) -> Dict[str, Any]:
+        """stream_chunk_compare 的异步版本：每块的打分交给对比执行器"""
+        if not chunks_b:
+            return {"score": 0.0, "matches": []}
+        matches, total, count = [], 0.0, 0
+        check_b = self._whitelist_checker(chunks_b, fps_b)
+        for offset, block, fps in self._stream_blocks(self.iter_chunks(text_a), len(fps_b)):
+            best_indices, best_scores = await compare_pool.run(
+                compare_pool.best_chunk_matches, fps, fps_b, 0.3, stream_compare.join_pairs()
+            )
+            total = self._match_rows(best_indices, best_scores, block, chunks_b, 0.3,
+                                     self._whitelist_checker(block, fps), check_b, matches, offset, total)
+            count += len(block)
+        if not count:
+            return {"score": 0.0, "matches": []}
+        return {"score": round(total / count, 4), "matches": matches}
+
+    async def _windowed_passages_task(
+        self, text_a: str, text_b: str, matches: List[Dict[str, Any]], chunk_size: int = 500
+    ) -> List[Dict[str, Any]]:
+        """
+        只在命中的 chunk 窗口内做后缀数组片段定位，内存与文档长度无关。
+        跨越窗口边界的长片段会被截断为窗口内的部分。
+        """
+        starts_a = starts_b = None
+        windows = set()
+        for match in matches:
+            if "source_start" in match:
+                windows.add((match["source_start"], match["source_end"], match["target_start"], match["target_end"]))
+                continue
+            if starts_a is None:
+                starts_a = [start for start, _ in self.iter_chunk_spans(text_a, chunk_size)]
+                starts_b = [start for start, _ in self.iter_chunk_spans(text_b, chunk_size)]
+            a, b = starts_a[match["source_index"]], starts_b[match["target_index"]]
+            windows.add((a, a + chunk_size, b, b + chunk_size))
+
+        found = []
+        for a_start, a_end, b_start, b_end in sorted(windows):
+            window_a, window_b = text_a[a_start:a_end], text_b[b_start:b_end]
+            for passage in await self._align_passages_task(window_a, window_b, self.token_stream(window_a)):
+                found.append((passage["source_start"] + a_start, passage["source_end"] + a_start,
+                              passage["target_start"] + b_start, passage["target_end"] + b_start))
+
+        # 相邻窗口互相重叠：同一对角线上重叠的片段合并为一个
+        found.sort(key=lambda p: (p[2] - p[0], p[0]))
+        merged = []
+        for source_start, source_end, target_start, target_end in found:
+            last = merged[-1] if merged else None
+            if last and last[2] - last[0] == target_start - source_start and source_start <= last[1]:
+                last[1], last[3] = max(last[1], source_end), max(last[3], target_end)
+            else:
+                merged.append([source_start, source_end, target_start, target_end])
+
+        passages = []
+        for source_start, source_end, target_start, target_end in merged:
+            passages.append({
+                "source_start": source_start,
+                "source_end": source_end,
+                "target_start": target_start,
+                "target_end": target_end,
+                "length": len(self.tokenize(text_a[source_start:source_end])),
+                "text": text_a[source_start:source_end][:200],
+            })
+        passages = sorted(passages, key=lambda p: p["length"], reverse=True)[:MAX_PASSAGES]
+        passages.sort(key=lambda p: p["source_start"])
+        return passages
+
+    async def _library_text_lengths(self, lib_doc_ids: List) -> Dict[Any, int]:
+        result = await self.db_session.execute(
+            select(LibraryDocument.id, func.length(LibraryDocument.text_content))
+            .where(LibraryDocument.id.in_(lib_doc_ids))
+        )
+        return {row[0]: row[1] or 0 for row in result.fetchall()}
+
+    async def _load_library_texts(self, lib_doc_ids: List) -> Dict[Any, str]:
+        """按需加载文档库文档全文（检索阶段不携带全文）"""
+        result = await self.db_session.execute(
+            select(LibraryDocument.id, LibraryDocument.text_content)
+            .where(LibraryDocument.id.in_(lib_doc_ids))
+        )
+        return {row[0]: row[1] for row in result.fetchall()}
+
+    async def _align_passages_task(
+        self, text_a: str, text_b: str, stream_a: Tuple[np.ndarray, List[Tuple[int, int]]]
+    ) -> List[Dict[str, Any]]:
+        """工作进程只接收两侧的 token 哈希序列，字符偏移换算与白名单过滤在本进程完成"""
+        tokens_a, spans_a = stream_a
+        tokens_b, spans_b = self.token_stream(text_b)
+        common = await compare_pool.run(compare_pool.common_passages, tokens_a, tokens_b)
+        return self.passages_from_alignment(common, text_a, spans_a, spans_b)
+
+    async def _chunk_compare_task(
+        self, chunks_a: List[str], fps_a: List[ChunkFingerprint], chunks_b: List[str], fps_b: List[ChunkFingerprint]
+    ) -> Dict[str, Any]:
+        """工作进程只接收 chunk 指纹并返回每行最优匹配，chunk 文本与白名单留在本进程"""
+        if not chunks_a or not chunks_b:
+            return {"score": 0.0, "matches": []}
+        best_indices, best_scores = await compare_pool.run(compare_pool.best_chunk_matches, fps_a, fps_b)
+        return self._assemble_matches(
+            best_indices, best_scores, chunks_a, chunks_b, 0.3,
+            self._whitelist_checker(chunks_a, fps_a), self._whitelist_checker(chunks_b, fps_b),
+        )
+
+    async def _winnowing_task(self, text_a: str, fp_a: WinnowFingerprint, text_b: str) -> Dict[str, Any]:
+        """工作进程只接收两侧的 winnowing 指纹并返回 token 级片段"""
+        fp_b = self.winnow(text_b)
+        passages = await compare_pool.run(compare_pool.winnow_passages, fp_a, fp_b)
+        return self.winnowing_compare(text_a, text_b, fp_a, fp_b, passages)
+
+    async def _chunk_compare_tasks(self, document: Document, candidates: List[Tuple]) -> List[Tuple]:
+        """分块策略：待测文档只分块、算指纹一次；文档库一侧直接加载入库时存储的指纹"""
+        doc_chunks, doc_fps = self.prepare_chunks(document.text_content) if document.text_content else ([], [])
+        stored = await self._load_chunk_fingerprints(candidates)
+
+        compare_tasks = []
+        for candidate in candidates:
+            lib_doc_id = candidate[0]
+            if doc_chunks and lib_doc_id in stored:
+                lib_chunks, lib_fps = stored[lib_doc_id]
+                # 纯文本对比交给对比执行器并行执行
+                compare_tasks.append((
+                    candidate,
+                    asyncio.ensure_future(self._chunk_compare_task(doc_chunks, doc_fps, lib_chunks, lib_fps)),
+                ))
+            else:
+                compare_tasks.append((candidate, None))
+        return compare_tasks
+
+    def _winnowing_tasks(self, document: Document, candidates: List[Tuple]) -> List[Tuple]:
+        """winnowing 策略：待测文档指纹只算一次，逐个候选做片段匹配"""
+        doc_winnow = self.winnow(document.text_content) if document.text_content else None
+
+        compare_tasks = []
+        for candidate in candidates:
+            lib_text = candidate[3]
+            if doc_winnow is not None and lib_text:
+                compare_tasks.append((
+                    candidate,
+                    asyncio.ensure_future(self._winnowing_task(document.text_content, doc_winnow, lib_text)),
+                ))
+            else:
+                compare_tasks.append((candidate, None))
+        return compare_tasks
+
+    async def _load_chunk_fingerprints(self, candidates: List[Tuple]) -> Dict[Any, Tuple[List[str], List[ChunkFingerprint]]]:
+        """加载候选文档的 chunk 指纹；尚未存储（或格式过旧）的文档现场计算并写回"""
+        stored = await ChunkStore.load(self.db_session, [c[0] for c in candidates])
+
+        for lib_doc_id, library_id, _, lib_text, _, _ in candidates:
+            if lib_doc_id in stored or not lib_text:
+                continue
+            chunks, fps = self.prepare_chunks(lib_text)
+            await ChunkStore.rebuild(self.db_session, lib_doc_id, library_id, chunks, fps)
+            stored[lib_doc_id] = (chunks, fps)
+
+        await self.db_session.flush()
+        return stored
+
+    @asynccontextmanager
+    async def _side_session(self) -> AsyncIterator[AsyncSession]:
+        """与主会话共用引擎的独立会话，供与主会话并发执行的只读查询使用"""
+        async with AsyncSession(self.db_session.bind, expire_on_commit=False) as session:
+            yield session
+
     async def _vector_search(
-        self, document: Document, library_ids: List[str], top_k: int
+        self, document: Document, library_ids: List[str], top_k: int,
+        session: AsyncSession = None, fallback: bool = True, chunk_embeddings: np.ndarray = None,
     ) -> List[Tuple]:
-        """使用 pgvector 进行向量相似度搜索"""
+        """
+        使用 pgvector 进行向量相似度搜索；fallback 为 True 时失败回退到文本检索。
+        传入待测文档的 chunk 向量时同时做 chunk 级检索与整篇平均向量检索，两路结果按倒数排名融合：
+        尚无 chunk 向量的文档库文档仍能由整篇向量召回，两路都命中的文档取两者中较高的得分。
+        两种检索都只返回所选文档库中的文档，且数量不因过滤而不足（见 filtered_ann）。
+        """
+        session = session or self.db_session
+        import uuid as uuid_mod
+        lib_id_list = [uuid_mod.UUID(lid) if isinstance(lid, str) else lid for lid in library_ids]
+
         try:
+            chunk_candidates = []
+            if chunk_embeddings is not None and len(chunk_embeddings):
+                chunk_candidates = await self._chunk_vector_search(session, chunk_embeddings, lib_id_list, top_k)
+
             embedding_str = "[" + ",".join(str(x) for x in document.embedding) + "]"
-            query = text("""
-                SELECT ld.id, ld.library_id, ld.filename, ld.text_content,
-                       dl.name as library_name,
-                       (ld.embedding <=> :embedding::vector) as distance
-                FROM library_documents ld
-                JOIN document_libraries dl ON dl.id = ld.library_id
-                WHERE ld.library_id = ANY(:library_ids)
-                  AND ld.status = 'ready'
-                  AND ld.embedding IS NOT NULL
-                ORDER BY distance ASC
-                LIMIT :top_k
-            """)
-
-            import uuid as uuid_mod
-            lib_id_list = [uuid_mod.UUID(lid) if isinstance(lid, str) else lid for lid in library_ids]
-
-            result = await self.db_session.execute(
-                query,
-                {
-                    "embedding": embedding_str,
-                    "library_ids": lib_id_list,
-                    "top_k": top_k,
-                }
+
+            async def run(fetch: Optional[int]) -> List:
+                params = {"embedding": embedding_str, "library_ids": lib_id_list, "top_k": top_k}
+                if fetch is None:
+                    result = await session.execute(_DOC_ANN_EXACT, params)
+                else:
+                    result = await session.execute(_DOC_ANN_INDEX, {**params, "fetch": fetch})
+                return result.fetchall()
+
+            rows = await self._filtered_ann(
+                session, lib_id_list, top_k, top_k, filtered_ann.EXACT_SCAN_DOCS, _VECTOR_DOC_COUNTS, run
             )
-            rows = result.fetchall()
-            # 转换 distance 为 similarity
-            return [(r[0], r[1], r[2], r[3], r[4], 1.0 - r[5]) for r in rows]
+            # 转换 distance 为 similarity；全文在精确对比阶段按需加载
+            doc_candidates = [(r[0], r[1], r[2], None, r[3], 1.0 - r[4]) for r in rows]
+            if not chunk_candidates:
+                return doc_candidates
+            # 融合只决定顺序；两路都命中的文档取较高的得分，供阈值过滤与粗筛得分使用
+            doc_scores = {c[0]: c[5] for c in doc_candidates}
+            return [
+                c[:5] + (max(c[5], doc_scores.get(c[0], 0.0)),)
+                for c in reciprocal_rank_fusion([chunk_candidates, doc_candidates])[:top_k]
+            ]
         except Exception as e:
+            if not fallback:
+                print(f"向量检索失败: {e}")
+                return []
             print(f"向量检索失败，回退到文本检索: {e}")
             return await self._text_search(document, library_ids)
 
+    async def _chunk_vector_search(
+        self, session: AsyncSession, chunk_embeddings: np.ndarray, lib_id_list: List, top_k: int
+    ) -> List[Tuple]:
+        """
+        chunk 级向量检索：待测文档的每个 chunk 向量各取最近的若干文档库 chunk（hnsw 索引），再按文档聚合。
+        候选得分为最相似 chunk 的余弦相似度（长文档只抄了一段时也不被稀释），
+        排序按 最相似余弦 × 命中的查询 chunk 数，大面积相近的文档排在前面。
+        超长文档按 VECTOR_QUERY_CHUNKS 分批查询后合并，不抽样跳过 chunk。
+        """
+        queries = np.asarray(chunk_embeddings, dtype=np.float32)
+        vectors = ["[" + ",".join(str(float(x)) for x in row) + "]" for row in queries]
+
+        # 文档库文档 ID -> [文档库 ID, 文件名, 文档库名, 最相似余弦, 命中的查询 chunk 数]
+        hits: Dict[Any, List] = {}
+        for start in range(0, len(vectors), VECTOR_QUERY_CHUNKS):
+            params = {
+                "vectors": vectors[start:start + VECTOR_QUERY_CHUNKS],
+                "library_ids": lib_id_list,
+                "per_chunk": CHUNK_HITS_PER_QUERY,
+                "top_k": top_k,
+            }
+
+            async def run(fetch: Optional[int], params=params) -> List:
+                if fetch is None:
+                    result = await session.execute(text(_CHUNK_ANN.format(hits=_CHUNK_HITS_EXACT)), params)
+                else:
+                    result = await session.execute(
+                        text(_CHUNK_ANN.format(hits=_CHUNK_HITS_INDEX)), {**params, "fetch": fetch}
+                    )
+                return result.fetchall()
+
+            rows = await self._filtered_ann(
+                session, lib_id_list, CHUNK_HITS_PER_QUERY, top_k, filtered_ann.EXACT_SCAN_CHUNK_DOCS,
+                _VECTOR_CHUNK_DOC_COUNTS, run,
+            )
+            for lib_doc_id, library_id, filename, library_name, best, covered in rows:
+                entry = hits.setdefault(lib_doc_id, [library_id, filename, library_name, 0.0, 0])
+                entry[3] = max(entry[3], float(best))
+                entry[4] += int(covered)
+
+        ranked = sorted(hits.items(), key=lambda item: item[1][3] * item[1][4], reverse=True)[:top_k]
+        return [
+            (lib_doc_id, library_id, filename, None, library_name, best)
+            for lib_doc_id, (library_id, filename, library_name, best, _) in ranked
+        ]
+
+    async def _filtered_ann(
+        self, session: AsyncSession, lib_id_list: List, per_query: int, top_k: int, exact_docs: int,
+        count_query, run: Callable[[Optional[int]], Awaitable[List]],
+    ) -> List:
+        """
+        限定文档库的近邻检索：run(fetch) 用索引取回 fetch 个近邻后按文档库过滤，run(None) 按文档库过滤精确扫描。
+        按所选文档库中可检索文档（count_query 统计）的占比确定首轮取回量，
+        结果不足 min(top_k, 可检索文档数) 时扩大取回量重试，最终回退到精确扫描。
+        """
+        sizes = self._vector_counts.get(count_query)
+        if sizes is None:
+            result = await session.execute(count_query)
+            sizes = self._vector_counts[count_query] = {lib_id: count for lib_id, count in result.fetchall()}
+        selected = sum(sizes.get(lib_id, 0) for lib_id in lib_id_list)
+        target = min(top_k, selected)
+        if target == 0:
+            return []
+
+        fetch = filtered_ann.initial_fetch(per_query, selected, sum(sizes.values()), exact_docs)
+        while fetch is not None:
+            # 降精度索引多取回一些，供全精度重排
+            limit = filtered_ann.rerank_fetch(fetch, _INDEX_PRECISION)
+            # hnsw 单次最多返回 ef_search 个近邻，取回量超过默认值时需要同步调大（仅对当前事务生效）
+            await session.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": str(filtered_ann.ef_search(limit))}
+            )
+            rows = await run(limit)
+            if len(rows) >= target:
+                return rows
+            # 重排放大后已达取回上限时，再扩大也不会得到更多结果
+            fetch = filtered_ann.next_fetch(fetch) if limit < filtered_ann.MAX_FETCH else None
+        return await run(None)
+
     async def _text_search(
-        self, document: Document, library_ids: List[str]
+        self, document: Document, library_ids: List[str], limit: int = LSH_CANDIDATE_LIMIT,
+        session: AsyncSession = None,
     ) -> List[Tuple]:
-        """纯文本相似度搜索（不依赖向量/API），使用预计算指纹加速粗筛"""
+        """纯文本相似度搜索（不依赖向量/API），通过 MinHash LSH 分桶获取候选，再用预计算指纹粗筛（只读）"""
+        session = session or self.db_session
         import uuid as uuid_mod
         lib_id_list = [uuid_mod.UUID(lid) if isinstance(lid, str) else lid for lid in library_ids]
 
-        query = select(LibraryDocument).where(
-            LibraryDocument.library_id.in_(lib_id_list),
-            LibraryDocument.status == "ready",
+        if not document.text_content:
+            return []
+
+        # 历史文档的签名与分桶由 library_backfill 在数据库初始化时一次性补建，不在检索路径上执行
+        # 查询共享 LSH 桶的文档，按命中 band 数排序
+        band_keys = MinHashLSH.band_keys(self.minhash_signature(document.text_content))
+        hits = func.count(LibraryDocumentBand.id).label("hits")
+        bucket_query = (
+            select(LibraryDocumentBand.library_document_id, hits)
+            .where(
+                LibraryDocumentBand.library_id.in_(lib_id_list),
+                tuple_(LibraryDocumentBand.band, LibraryDocumentBand.bucket).in_(band_keys),
+            )
+            .group_by(LibraryDocumentBand.library_document_id)
+            .order_by(hits.desc())
+            .limit(limit)
+        )
+        result = await session.execute(bucket_query)
+        candidate_ids = [row[0] for row in result.fetchall()]
+        if not candidate_ids:
+            return []
+
+        # 粗筛只需要开头 2000 字，不加载全文
+        result = await session.execute(
+            select(
+                LibraryDocument.id, LibraryDocument.library_id, LibraryDocument.filename,
+                func.substr(LibraryDocument.text_content, 1, 2000).label("head"),
+            ).where(
+                LibraryDocument.id.in_(candidate_ids),
+                LibraryDocument.status == "ready",
+            )
         )
-        result = await self.db_session.execute(query)
-        all_lib_docs = result.scalars().all()
+        lib_docs = result.fetchall()
 
         # 第3层优化：预计算待测文档指纹（只算一次）
-        doc_fp = self._precompute_chunk(document.text_content[:2000]) if document.text_content else None
+        doc_fp = self._precompute_chunk(document.text_content[:2000])
 
         candidates = []
         # 批量获取库名，避免 N+1 查询
         library_names = {}
-        for lib_doc in all_lib_docs:
+        for lib_doc in lib_docs:
             if lib_doc.library_id not in library_names:
-                lib = await self.db_session.get(DocumentLibrary, lib_doc.library_id)
+                lib = await session.get(DocumentLibrary, lib_doc.library_id)
                 library_names[lib_doc.library_id] = lib.name if lib else "未知文档库"
 
-        for lib_doc in all_lib_docs:
-            if not lib_doc.text_content or not doc_fp:
+        for lib_doc in lib_docs:
+            if not lib_doc.head:
                 continue
 
-            # 粗筛：使用预计算指纹快速对比
-            lib_fp = self._precompute_chunk(lib_doc.text_content[:2000])
+            # 粗筛：仅对 LSH 候选计算指纹相似度
+            lib_fp = self._precompute_chunk(lib_doc.head)
             coarse_score = self._similarity_from_fingerprints(doc_fp, lib_fp)
 
             lib_name = library_names[lib_doc.library_id]
 
+            # 全文在精确对比阶段按需加载
             candidates.append((
                 lib_doc.id, lib_doc.library_id, lib_doc.filename,
-                lib_doc.text_content, lib_name, coarse_score
+                None, lib_name, coarse_score
             ))
 
         candidates.sort(key=lambda x: x[5], reverse=True)
-        return candidates[:10]
+        return candidates
+
+    @staticmethod
+    def build_band_rows(lib_doc: LibraryDocument, signature) -> List[LibraryDocumentBand]:
+        """根据签名生成文档的 LSH 分桶记录"""
+        return [
+            LibraryDocumentBand(
+                library_document_id=lib_doc.id,
+                library_id=lib_doc.library_id,
+                band=band,
+                bucket=bucket,
+            )
+            for band, bucket in MinHashLSH.band_keys(signature)
+        ]
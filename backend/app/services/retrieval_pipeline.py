@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 文档库检索的各阶段，按执行顺序：
+# hash = 哈希精确重复，signature = SimHash / MinHash LSH 签名检索，vector = pgvector 向量检索，
+# fine = 候选的分块/winnowing 精确对比，passage = 后缀数组公共片段定位
+STAGES = ("hash", "signature", "vector", "fine", "passage")
+
+# 各阶段默认参数：limit = 候选/结果数量上限，threshold = 得分下限，time_budget = 秒（0 表示不限）。
+# hash 阶段只使用 enabled 与 limit；fine 阶段的 limit 同时是最终返回的结果数
+DEFAULT_STAGES: Dict[str, Dict[str, Any]] = {
+    "hash": {"enabled": True, "limit": 50, "threshold": 1.0, "time_budget": 0},
+    "signature": {"enabled": True, "limit": 50, "threshold": 0.05, "time_budget": 0},
+    "vector": {"enabled": True, "limit": 10, "threshold": 0.05, "time_budget": 0},
+    "fine": {"enabled": True, "limit": 10, "threshold": 0.05, "time_budget": 0},
+    "passage": {"enabled": True, "limit": 10, "threshold": 0.0, "time_budget": 0},
+}
+
+# 倒数排名融合（RRF）的平滑常数，取文献常用值
+RRF_K = 60
+
+
+class StageConfig:
+    """单个阶段的配置"""
+
+    __slots__ = ("name", "enabled", "limit", "threshold", "time_budget")
+
+    def __init__(self, name: str, enabled: bool, limit: int, threshold: float, time_budget: float):
+        self.name = name
+        self.enabled = enabled
+        self.limit = limit
+        self.threshold = threshold
+        self.time_budget = time_budget
+
+    @property
+    def timeout(self) -> Optional[float]:
+        """asyncio 使用的超时时间，未设置预算时为 None"""
+        return self.time_budget if self.time_budget > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "threshold": self.threshold,
+            "time_budget": self.time_budget,
+        }
+
+
+class PipelineConfig:
+    """
+    检索流水线配置：默认值 < 系统设置（SystemSettings.retrieval_pipeline）< 批次设置（Batch.retrieval_pipeline）。
+    每层都是 {阶段名: {参数: 值}} 的部分覆盖，未知阶段或参数会被忽略。
+    """
+
+    def __init__(self, stages: Dict[str, StageConfig]):
+        self.stages = stages
+
+    def __getitem__(self, name: str) -> StageConfig:
+        return self.stages[name]
+
+    @classmethod
+    def from_layers(cls, *layers: Optional[Dict[str, Any]]) -> "PipelineConfig":
+        merged = {name: dict(params) for name, params in DEFAULT_STAGES.items()}
+        for layer in layers:
+            for name, params in cls.normalize(layer).items():
+                merged[name].update(params)
+        return cls({name: StageConfig(name, **params) for name, params in merged.items()})
+
+    @staticmethod
+    def normalize(layer: Any) -> Dict[str, Dict[str, Any]]:
+        """校验并规范化一层覆盖配置，丢弃未知键和非法值"""
+        if not isinstance(layer, dict):
+            return {}
+        normalized = {}
+        for name, params in layer.items():
+            if name not in DEFAULT_STAGES or not isinstance(params, dict):
+                continue
+            stage = {}
+            for key, value in params.items():
+                try:
+                    if key == "enabled":
+                        stage[key] = bool(value)
+                    elif key == "limit":
+                        stage[key] = max(int(value), 1)
+                    elif key == "threshold":
+                        stage[key] = min(max(float(value), 0.0), 1.0)
+                    elif key == "time_budget":
+                        stage[key] = max(float(value), 0.0)
+                except (TypeError, ValueError):
+                    continue
+            if stage:
+                normalized[name] = stage
+        return normalized
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.to_dict() for name, stage in self.stages.items()}
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Tuple]], k: int = RRF_K) -> List[Tuple]:
+    """
+    倒数排名融合：各路候选列表（已按各自得分降序）按 Σ 1/(k + 名次) 合并排序。
+    各路得分量纲不同（余弦 / 指纹相似度），只使用名次；同一文档保留最先出现的候选元组。
+    """
+    fused: Dict[Any, float] = {}
+    first: Dict[Any, Tuple] = {}
+    for ranking in rankings:
+        for rank, candidate in enumerate(ranking, start=1):
+            key = candidate[0]
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            first.setdefault(key, candidate)
+    return [first[key] for key in sorted(fused, key=fused.get, reverse=True)]
+
+
+# 时间预算通过取消实现，只能用于可以安全取消的工作：使用独立只读会话的查询，或交给 compare_pool 的纯计算。
+# 不能用于批次主会话上的查询或 flush（取消进行中的语句会使会话不可用）。
+# 对 compare_pool 任务的取消只会撤销尚在排队的计算，已在工作线程/进程中运行的计算会执行完毕后丢弃结果
+
+
+async def run_stage(stage: StageConfig, awaitable: Awaitable[T], default: T) -> T:
+    """在阶段时间预算内执行；超时返回 default，调用方按已有结果继续"""
+    try:
+        return await asyncio.wait_for(awaitable, stage.timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"检索阶段 {stage.name} 超出时间预算 {stage.time_budget}s，跳过")
+        return default
+
+
+async def wait_within(stage: StageConfig, futures: Iterable[asyncio.Future]) -> Set[asyncio.Future]:
+    """等待一组并行任务至多 time_budget 秒，取消未完成的任务（排队中的计算随之撤销），返回已完成的集合"""
+    futures: List[asyncio.Future] = [f for f in futures if f is not None]
+    if not futures:
+        return set()
+    done, pending = await asyncio.wait(futures, timeout=stage.timeout)
+    for future in pending:
+        future.cancel()
+    if pending:
+        logger.warning(f"检索阶段 {stage.name} 超出时间预算 {stage.time_budget}s，{len(pending)} 个任务按粗筛结果处理")
+    return done
@@ -3,6 +3,7 @@ from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.system_settings import SystemSettings
 from app.core.config import settings as env_settings
+from app.services.retrieval_pipeline import PipelineConfig
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,7 @@ class SettingsService:
                 "max_upload_size_mb": db_settings.max_upload_size_mb or 50,
                 "max_files_per_batch": db_settings.max_files_per_batch or 20,
                 "system_name": db_settings.system_name or "文档查重检测平台",
+                "retrieval_pipeline": PipelineConfig.from_layers(db_settings.retrieval_pipeline).to_dict(),
                 "updated_at": db_settings.updated_at,
             }
         # Fallback to env settings
@@ -38,6 +40,7 @@ class SettingsService:
             "max_upload_size_mb": 50,
             "max_files_per_batch": 20,
             "system_name": "文档查重检测平台",
+            "retrieval_pipeline": PipelineConfig.from_layers().to_dict(),
             "updated_at": None,
         }
 
@@ -57,6 +60,8 @@ class SettingsService:
                 # Skip if empty or if it looks like a masked key (contains asterisks)
                 if not value or "****" in str(value):
                     continue
+            if key == "retrieval_pipeline":
+                value = PipelineConfig.normalize(value) or None
             if hasattr(db_settings, key):
                 setattr(db_settings, key, value)
 
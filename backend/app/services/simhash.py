@@ -0,0 +1,73 @@
+import math
+from typing import List
+
+import numpy as np
+
+from app.services.fingerprint import ChunkFingerprint
+
+
+# 64 位签名切分为 4 个 16 位 band：汉明距离 ≤ 3 的两个签名至少有一个 band 完全相同（鸽巢原理），
+# 因此每个 band 一列并各自建索引，即可用 4 次等值查找代替全表扫描
+BITS = 64
+NUM_BANDS = 4
+BAND_BITS = BITS // NUM_BANDS
+MAX_DISTANCE = NUM_BANDS - 1
+
+_BLOCK_SIZE = 4096
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+# splitmix64 终结函数常数：3-gram 哈希的低位分布不均，先重新混合
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _remix(hashes: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        z = hashes ^ (hashes >> np.uint64(30))
+        z = z * _MIX_1
+        z = (z ^ (z >> np.uint64(27))) * _MIX_2
+        return z ^ (z >> np.uint64(31))
+
+
+class SimHash:
+    """64 位 SimHash 签名与 band 分列（签名与 band 入库，band 列各自建索引）"""
+
+    @staticmethod
+    def from_fingerprint(fp: ChunkFingerprint) -> int:
+        """以 3-gram 出现次数为权重计算 SimHash，返回无符号 64 位整数"""
+        if not fp.trigrams.size:
+            return 0
+        hashes = _remix(fp.trigrams.astype("<u8"))
+        weights = fp.trigram_counts.astype(np.int64)
+
+        # 每一位上为 1 的权重之和，超过总权重一半则该位取 1；分块展开比特矩阵以限制内存
+        ones = np.zeros(BITS, dtype=np.int64)
+        for start in range(0, hashes.size, _BLOCK_SIZE):
+            block = hashes[start:start + _BLOCK_SIZE]
+            bits = np.unpackbits(block.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+            ones += weights[start:start + _BLOCK_SIZE] @ bits.astype(np.int64)
+        set_bits = np.flatnonzero(2 * ones > int(weights.sum()))
+        return sum(1 << int(b) for b in set_bits)
+
+    @staticmethod
+    def bands(signature: int) -> List[int]:
+        """切分为 NUM_BANDS 个 16 位 band（低位在前）"""
+        return [(signature >> (BAND_BITS * i)) & _BAND_MASK for i in range(NUM_BANDS)]
+
+    @staticmethod
+    def hamming(sig_a: int, sig_b: int) -> int:
+        return bin((sig_a ^ sig_b) & ((1 << BITS) - 1)).count("1")
+
+    @staticmethod
+    def estimate_cosine(distance: int) -> float:
+        """由汉明距离估计两个加权 3-gram 向量的余弦相似度（随机超平面性质）"""
+        return math.cos(math.pi * distance / BITS)
+
+    @staticmethod
+    def to_db(signature: int) -> int:
+        """无符号 64 位转为 BIGINT 可存储的有符号值"""
+        return signature - (1 << BITS) if signature >= 1 << (BITS - 1) else signature
+
+    @staticmethod
+    def from_db(value: int) -> int:
+        return value & ((1 << BITS) - 1)
@@ -0,0 +1,62 @@
+import math
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+from app.core.config import settings
+
+
+T = TypeVar("T")
+
+# 分块步长（chunk_size - overlap），用于由文本长度估算 chunk 数
+CHUNK_STRIDE = 450
+# 单个 chunk 的指纹与文本大约占用的内存（2/3-gram 数组、计数与 500 字符文本）
+CHUNK_BYTES = 16 * 1024
+# 打分时同时存在的 n_a × n_b 稠密矩阵个数（得分、候选、共享数等，float64）
+DENSE_MATRICES = 6
+# 等值连接每个展开条目占用的临时内存（若干 int64/float64 数组）
+JOIN_ENTRY_BYTES = 64
+
+
+def memory_limit() -> int:
+    """单次对比的内存上限（字节），0 表示不限制"""
+    return max(settings.COMPARE_MEMORY_LIMIT_MB, 0) * 1024 * 1024
+
+
+def estimate_chunks(length: int) -> int:
+    return max(1, math.ceil(length / CHUNK_STRIDE))
+
+
+def estimate_bytes(length_a: int, length_b: int) -> int:
+    """整体对比（两侧全部分块并一次性打分）的大致峰值内存"""
+    n_a, n_b = estimate_chunks(length_a), estimate_chunks(length_b)
+    return n_a * n_b * 8 * DENSE_MATRICES + (n_a + n_b) * CHUNK_BYTES
+
+
+def needs_streaming(length_a: int, length_b: int) -> bool:
+    """预计整体对比会超出内存上限时改用流式对比（四分之一预算留给等值连接）"""
+    limit = memory_limit()
+    return bool(limit) and estimate_bytes(length_a, length_b) > limit * 3 // 4
+
+
+def join_pairs() -> int:
+    """流式对比时单次等值连接允许展开的条目数"""
+    return max(memory_limit() // 4 // JOIN_ENTRY_BYTES, 10_000)
+
+
+def block_rows(n_index: int) -> int:
+    """流式一侧每块的 chunk 数：索引一侧常驻，其余预算按每行的稠密矩阵与指纹开销均分"""
+    budget = memory_limit() * 3 // 4 - n_index * CHUNK_BYTES
+    per_row = n_index * 8 * DENSE_MATRICES + CHUNK_BYTES
+    return max(1, budget // per_row)
+
+
+def blocks(items: Iterable[T], size: int) -> Iterator[Tuple[int, List[T]]]:
+    """把迭代器切成每块至多 size 个元素，产生 (块起始序号, 块)"""
+    iterator = iter(items)
+    offset = 0
+    while True:
+        block = list(islice(iterator, size))
+        if not block:
+            return
+        yield offset, block
+        offset += len(block)
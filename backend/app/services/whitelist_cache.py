@@ -0,0 +1,93 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.whitelist import WhitelistCollection, WhitelistItem
+from app.services.chunk_store import ChunkStore
+from app.services.fingerprint import ChunkFingerprint
+from app.services.plagiarism import PlagiarismService
+from app.services.whitelist_index import WhitelistIndex
+
+logger = logging.getLogger(__name__)
+
+# 进程内缓存：清单 ID -> (版本号, 指纹列表)；清单组合 -> 白名单索引
+_collection_cache: Dict[object, Tuple[int, List[ChunkFingerprint]]] = {}
+_index_cache: "OrderedDict[Tuple, WhitelistIndex]" = OrderedDict()
+_INDEX_CACHE_SIZE = 16
+
+
+class WhitelistCache:
+    """白名单指纹的持久化与按版本号缓存加载"""
+
+    @staticmethod
+    def fingerprint(content: str) -> bytes:
+        """计算白名单条目的序列化指纹（添加条目时调用）"""
+        return ChunkStore.encode(PlagiarismService._precompute_chunk(content))
+
+    @staticmethod
+    async def bump_version(session: AsyncSession, collection_id) -> None:
+        """清单内容变化后递增版本号，使各 worker 的缓存失效；在数据库中原子递增，并发修改不会丢失版本"""
+        await session.execute(
+            update(WhitelistCollection)
+            .where(WhitelistCollection.id == collection_id)
+            .values(version=func.coalesce(WhitelistCollection.version, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def load_index(cls, session: AsyncSession, collection_ids: List) -> WhitelistIndex:
+        """加载若干清单的白名单索引；版本未变化时直接复用进程内缓存"""
+        if not collection_ids:
+            return WhitelistIndex([])
+
+        result = await session.execute(
+            select(WhitelistCollection.id, WhitelistCollection.version)
+            .where(WhitelistCollection.id.in_(collection_ids))
+        )
+        versions = sorted((row[0], row[1] or 0) for row in result.fetchall())
+        key = tuple(versions)
+
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+        fingerprints: List[ChunkFingerprint] = []
+        for collection_id, version in versions:
+            cached = _collection_cache.get(collection_id)
+            if cached is None or cached[0] != version:
+                cached = (version, await cls._load_collection(session, collection_id))
+                _collection_cache[collection_id] = cached
+            fingerprints.extend(cached[1])
+
+        index = WhitelistIndex(fingerprints)
+        _index_cache[key] = index
+        if len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+        return index
+
+    @classmethod
+    async def _load_collection(cls, session: AsyncSession, collection_id) -> List[ChunkFingerprint]:
+        """读取清单内所有条目的已存储指纹；缺失或格式过旧的条目现场计算并写回（随调用方事务提交）"""
+        result = await session.execute(
+            select(WhitelistItem).where(WhitelistItem.collection_id == collection_id)
+        )
+        fingerprints = []
+        rebuilt = 0
+        for item in result.scalars().all():
+            if not item.content:
+                continue
+            try:
+                fp = ChunkStore.decode(item.fingerprint)
+            except ValueError:
+                item.fingerprint = cls.fingerprint(item.content)
+                fp = ChunkStore.decode(item.fingerprint)
+                rebuilt += 1
+            fingerprints.append(fp)
+
+        if rebuilt:
+            logger.info(f"白名单清单 {collection_id} 补建了 {rebuilt} 个条目指纹")
+            await session.flush()
+        return fingerprints
@@ -0,0 +1,50 @@
+from typing import List, Union
+
+import numpy as np
+
+from app.services.fingerprint import ChunkFingerprint, stack_fingerprints
+
+
+class WhitelistIndex:
+    """
+    白名单倒排索引：2-gram 哈希 → 白名单条目。
+    查询时先按共享 2-gram 数算出 Jaccard，再用得分上界过滤，只对可能命中的条目做精确打分。
+    """
+
+    def __init__(self, fingerprints: List[ChunkFingerprint]):
+        self.fingerprints = [fp for fp in fingerprints if fp]
+        keys, items, _ = stack_fingerprints([fp.bigrams for fp in self.fingerprints])
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._items = items[order]
+        self._sizes = np.array([fp.bigrams.size for fp in self.fingerprints], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def candidates(self, fp: ChunkFingerprint, threshold: float) -> np.ndarray:
+        """返回得分上界不低于阈值的条目下标，按 Jaccard 降序"""
+        left = np.searchsorted(self._keys, fp.bigrams, side="left")
+        counts = np.searchsorted(self._keys, fp.bigrams, side="right") - left
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        hit_items = self._items[np.repeat(left, counts) + offsets]
+        shared = np.bincount(hit_items, minlength=len(self.fingerprints)).astype(np.float64)
+
+        # 得分 = 0.4 × Jaccard + 0.6 × Cosine ≤ 0.4 × Jaccard + 0.6，由此得到 Jaccard 下限
+        jaccard = shared / (fp.bigrams.size + self._sizes - shared)
+        min_jaccard = (threshold - 0.6) / 0.4 - 1e-4
+        candidates = np.flatnonzero((shared > 0) & (jaccard >= min_jaccard))
+        return candidates[np.argsort(-jaccard[candidates], kind="stable")]
+
+    def match(self, fp: Union[ChunkFingerprint, None], threshold: float = 0.75) -> bool:
+        """判断指纹是否与任一白名单条目的相似度达到阈值"""
+        if not fp or not self.fingerprints:
+            return False
+        for idx in self.candidates(fp, threshold).tolist():
+            if fp.similarity(self.fingerprints[idx]) >= threshold:
+                return True
+        return False
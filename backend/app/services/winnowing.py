@@ -0,0 +1,171 @@
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.services.fingerprint import hash_tokens
+
+
+# k-gram 长度与窗口大小：长度 ≥ WINDOW + K - 1 个 token 的共同片段保证被检出
+K = 5
+WINDOW = 4
+# 同一对角线上相邻命中允许的最大 token 间隔（超过则拆分为两个片段）
+MAX_GAP = K + WINDOW
+# 片段至少包含的命中数与 token 数，过滤常见短语造成的零散命中
+MIN_PASSAGE_HITS = 2
+MIN_PASSAGE_TOKENS = 10
+# 在目标文档中出现次数超过该值的哈希视为模板化内容，不参与配对
+MAX_HASH_OCCURRENCES = 50
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def kgram_hashes(token_hashes: np.ndarray, k: int = K) -> np.ndarray:
+    """对 token 哈希序列计算所有 k-gram 的哈希"""
+    n = token_hashes.size - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        h = token_hashes[:n].copy()
+        for j in range(1, k):
+            h = h * _MIX + token_hashes[j:j + n]
+    return h
+
+
+class WinnowFingerprint:
+    """winnowing 指纹：窗口最小 k-gram 哈希及其 token 位置，附带 token 的字符区间"""
+
+    __slots__ = ("hashes", "positions", "spans")
+
+    def __init__(self, hashes: np.ndarray, positions: np.ndarray, spans: np.ndarray):
+        self.hashes = hashes
+        self.positions = positions
+        self.spans = spans
+
+    @classmethod
+    def from_tokens(cls, tokens: List[str], spans: List[Tuple[int, int]]) -> "WinnowFingerprint":
+        span_arr = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        hashes = kgram_hashes(hash_tokens(tokens))
+        if not hashes.size:
+            return cls(hashes, np.empty(0, dtype=np.int64), span_arr)
+
+        if hashes.size <= WINDOW:
+            # 文本太短时整段只有一个窗口
+            rev = hashes[::-1]
+            positions = np.array([hashes.size - 1 - int(np.argmin(rev))], dtype=np.int64)
+        else:
+            # 稳健 winnowing：每个窗口取最右侧的最小值，相邻窗口选中同一位置时只记录一次
+            windows = sliding_window_view(hashes, WINDOW)
+            offsets = WINDOW - 1 - np.argmin(windows[:, ::-1], axis=1)
+            selected = np.arange(windows.shape[0]) + offsets
+            keep = np.ones(selected.size, dtype=bool)
+            keep[1:] = selected[1:] != selected[:-1]
+            positions = selected[keep].astype(np.int64)
+
+        return cls(hashes[positions], positions, span_arr)
+
+    @property
+    def token_count(self) -> int:
+        return int(self.spans.shape[0])
+
+    def char_range(self, start_token: int, end_token: int) -> Tuple[int, int]:
+        """token 区间 [start, end) 对应的字符区间"""
+        return int(self.spans[start_token, 0]), int(self.spans[end_token - 1, 1])
+
+
+def _shared_positions(fp_a: WinnowFingerprint, fp_b: WinnowFingerprint) -> Tuple[np.ndarray, np.ndarray]:
+    """找出两份指纹中哈希相同的 (A 位置, B 位置) 对"""
+    order = np.argsort(fp_b.hashes, kind="stable")
+    hashes_b, positions_b = fp_b.hashes[order], fp_b.positions[order]
+
+    left = np.searchsorted(hashes_b, fp_a.hashes, side="left")
+    counts = np.searchsorted(hashes_b, fp_a.hashes, side="right") - left
+    counts[counts > MAX_HASH_OCCURRENCES] = 0
+
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    a_idx = np.repeat(np.arange(fp_a.hashes.size), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    b_idx = np.repeat(left, counts) + offsets
+    return fp_a.positions[a_idx], positions_b[b_idx]
+
+
+def find_passages(fp_a: WinnowFingerprint, fp_b: WinnowFingerprint) -> List[Dict[str, int]]:
+    """将共享指纹按对角线（B 位置 - A 位置）聚合为连续片段，返回 token 区间"""
+    pos_a, pos_b = _shared_positions(fp_a, fp_b)
+    if not pos_a.size:
+        return []
+
+    diagonal = pos_b - pos_a
+    order = np.lexsort((pos_a, diagonal))
+    pos_a, diagonal = pos_a[order], diagonal[order]
+
+    # 对角线变化或间隔过大处断开
+    breaks = np.flatnonzero((np.diff(diagonal) != 0) | (np.diff(pos_a) > MAX_GAP)) + 1
+    passages = []
+    for group_a, group_d in zip(np.split(pos_a, breaks), np.split(diagonal, breaks)):
+        start, end = int(group_a[0]), int(group_a[-1]) + K
+        if group_a.size < MIN_PASSAGE_HITS or end - start < MIN_PASSAGE_TOKENS:
+            continue
+        shift = int(group_d[0])
+        passages.append({
+            "source_start": start,
+            "source_end": end,
+            "target_start": start + shift,
+            "target_end": end + shift,
+            "hits": int(group_a.size),
+        })
+    return passages
+
+
+def winnowing_compare(
+    fp_a: WinnowFingerprint,
+    fp_b: WinnowFingerprint,
+    text_a: str,
+    text_b: str,
+    is_whitelisted: Callable[[str], bool] = None,
+    chunk_stride: int = 450,
+    passages: List[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    基于 winnowing 指纹的片段对比。
+    得分为 A 中被匹配片段覆盖的 token 比例；返回结构与分块对比一致，并附带字符偏移。
+    passages 为已算好的 find_passages 结果（例如由工作进程返回），不传时现场计算。
+    """
+    if not fp_a.token_count or not fp_b.token_count:
+        return {"score": 0.0, "matches": []}
+
+    covered = np.zeros(fp_a.token_count, dtype=bool)
+    matches = []
+    if passages is None:
+        passages = find_passages(fp_a, fp_b)
+    for passage in sorted(passages, key=lambda p: p["source_start"]):
+        src_start, src_end = fp_a.char_range(passage["source_start"], passage["source_end"])
+        tgt_start, tgt_end = fp_b.char_range(passage["target_start"], passage["target_end"])
+        source_text = text_a[src_start:src_end]
+        if is_whitelisted and (is_whitelisted(source_text) or is_whitelisted(text_b[tgt_start:tgt_end])):
+            continue
+
+        # 片段得分：片段内 A 的指纹被命中的比例
+        in_span = (fp_a.positions >= passage["source_start"]) & (fp_a.positions < passage["source_end"] - K + 1)
+        density = passage["hits"] / max(int(in_span.sum()), 1)
+
+        covered[passage["source_start"]:passage["source_end"]] = True
+        matches.append({
+            "source_chunk": source_text[:200],
+            "target_chunk": text_b[tgt_start:tgt_end][:200],
+            "score": round(min(density, 1.0), 4),
+            "source_index": src_start // chunk_stride,
+            "target_index": tgt_start // chunk_stride,
+            "source_start": src_start,
+            "source_end": src_end,
+            "target_start": tgt_start,
+            "target_end": tgt_end,
+        })
+
+    return {
+        "score": round(float(covered.sum()) / fp_a.token_count, 4),
+        "matches": matches,
+    }
@@ -0,0 +1,55 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services import compare_pool
+from app.services.batch_index import candidate_pairs
+from app.services.plagiarism import PlagiarismService
+
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _grams(rng: np.random.Generator, shared: np.ndarray, own: int) -> np.ndarray:
+    return np.unique(np.concatenate([shared, rng.integers(0, 2 ** 62, own).astype(np.uint64)]))
+
+
+def test_pairs_sharing_enough_grams_are_candidates():
+    rng = np.random.default_rng(0)
+    shared = rng.integers(0, 2 ** 62, 30).astype(np.uint64)
+    grams = [_grams(rng, shared, 200), _grams(rng, shared, 200), _grams(rng, shared[:5], 200)]
+    assert candidate_pairs(grams) == [(0, 1)]
+
+
+def test_passage_copied_by_many_documents_is_still_a_candidate():
+    # 同一段落被 30 篇文档抄袭时，其 3-gram 的文档频率远超常用表达阈值，仍应两两成为候选
+    rng = np.random.default_rng(1)
+    passage = rng.integers(0, 2 ** 62, 1500).astype(np.uint64)
+    grams = [_grams(rng, passage, 2000) for _ in range(30)]
+    assert len(candidate_pairs(grams)) == 30 * 29 // 2
+
+
+def test_common_expressions_alone_do_not_make_candidates():
+    rng = np.random.default_rng(2)
+    common = rng.integers(0, 2 ** 62, 150).astype(np.uint64)
+    grams = [_grams(rng, common, 2000) for _ in range(30)]
+    assert candidate_pairs(grams) == []
+
+
+def test_batch_comparison_reports_a_passage_copied_by_many_documents(monkeypatch):
+    monkeypatch.setattr(compare_pool.settings, "COMPARE_EXECUTOR", "thread")
+    rng = random.Random(3)
+    passage = _random_text(rng, 1500)
+    docs = [
+        SimpleNamespace(id=k, filename=f"{k}.txt", text_content=_random_text(rng, 800) + passage + _random_text(rng, 800))
+        for k in range(12)
+    ]
+    results = asyncio.run(PlagiarismService().find_similar_pairs_in_batch(docs))
+    for doc in docs:
+        assert len(results[doc.id]) == len(docs) - 1
+        assert all(r["similarity"] > 0.1 for r in results[doc.id])
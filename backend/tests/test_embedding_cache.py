@@ -0,0 +1,22 @@
+import asyncio
+
+import numpy as np
+
+from app.services import embedding_cache
+from app.services.embedding_cache import EmbeddingCache
+
+
+def test_memory_only_without_cache_url(monkeypatch):
+    monkeypatch.setattr(embedding_cache.settings, "EMBEDDING_CACHE_URL", "")
+    monkeypatch.setattr(embedding_cache.settings, "EMBEDDING_CACHE_SIZE", 2)
+    EmbeddingCache.clear_memory()
+    assert embedding_cache._client() is None
+
+    vectors = {h: np.full(4, i, dtype=np.float32) for i, h in enumerate(["a", "b", "c"])}
+    asyncio.run(EmbeddingCache.put_many("model", vectors))
+    found = asyncio.run(EmbeddingCache.get_many("model", ["a", "b", "c", "c"]))
+    # LRU 只保留最近的 2 条
+    assert sorted(found) == ["b", "c"]
+    np.testing.assert_array_equal(found["c"], vectors["c"])
+    assert asyncio.run(EmbeddingCache.get_many("other", ["c"])) == {}
+    EmbeddingCache.clear_memory()
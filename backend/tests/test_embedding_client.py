@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from app.services import embedding_client
+from app.services.embedding_client import EmbeddingClient, _retry_delay, estimate_tokens, plan_batches
+
+
+def _status_error(status: int, headers: dict = None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.example.com/v1/embeddings")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    error_class = openai.RateLimitError if status == 429 else openai.APIStatusError
+    return error_class("error", response=response, body=None)
+
+
+class FakeEmbeddings:
+    """按输入文本长度生成向量，并按逆序返回结果（只靠 index 还原顺序）；可预设若干次失败"""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.calls = []
+
+    async def create(self, model, input, **kwargs):
+        self.calls.append(list(input))
+        if self.failures:
+            raise self.failures.pop(0)
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+def _client(embeddings: FakeEmbeddings, max_items: int = 128, max_retries: int = 3) -> EmbeddingClient:
+    client = EmbeddingClient(SimpleNamespace(embeddings=embeddings), "test-model")
+    client.max_items = max_items
+    client.max_retries = max_retries
+    return client
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待而不真正等待"""
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr(embedding_client.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("抄袭检测") == 4
+    assert estimate_tokens("abcdef") == 2
+    assert estimate_tokens("abcd") == 2
+    assert estimate_tokens("") == 0
+
+
+def test_plan_batches_respects_token_and_item_limits():
+    texts = ["字" * 5, "字" * 5, "字" * 5, "字" * 20, "字"]
+    batches = plan_batches(texts, max_tokens=10, max_items=3)
+    assert batches == [[0, 1], [2], [3], [4]]
+
+    batches = plan_batches(["a"] * 7, max_tokens=100, max_items=3)
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_plan_batches_keeps_every_index_in_order():
+    texts = [("段落" * n) for n in range(1, 40)]
+    batches = plan_batches(texts, max_tokens=50, max_items=8)
+    assert [i for batch in batches for i in batch] == list(range(len(texts)))
+
+
+def test_embed_restores_input_order_across_batches():
+    embeddings = FakeEmbeddings()
+    texts = ["a", "bbb", "cc", "dddd", "e"]
+    matrix = asyncio.run(_client(embeddings, max_items=2).embed(texts))
+
+    assert len(embeddings.calls) == 3
+    assert matrix.dtype == np.float32
+    assert matrix[:, 0].tolist() == [1.0, 3.0, 2.0, 4.0, 1.0]
+
+
+def test_embed_empty_input():
+    assert asyncio.run(_client(FakeEmbeddings()).embed([])).shape == (0, 0)
+
+
+def test_retry_after_header_is_honoured(sleeps):
+    embeddings = FakeEmbeddings([_status_error(429, {"retry-after": "3"})])
+    matrix = asyncio.run(_client(embeddings).embed(["ab"]))
+
+    assert sleeps == [3.0]
+    assert len(embeddings.calls) == 2
+    assert matrix[0, 0] == 2.0
+
+
+def test_retries_stop_after_max_retries(sleeps):
+    embeddings = FakeEmbeddings([_status_error(503) for _ in range(5)])
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(_client(embeddings, max_retries=2).embed(["ab"]))
+
+    assert len(embeddings.calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_non_transient_errors_are_not_retried(sleeps):
+    embeddings = FakeEmbeddings([_status_error(400)])
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(_client(embeddings).embed(["ab"]))
+
+    assert len(embeddings.calls) == 1
+    assert sleeps == []
+
+
+def test_retry_delay():
+    assert _retry_delay(_status_error(429, {"retry-after": "2"}), 0) == 2.0
+    # Retry-After 过长时按退避上限截断
+    assert _retry_delay(_status_error(429, {"retry-after": "3600"}), 0) == embedding_client._BACKOFF_MAX
+    # 无法解析的 Retry-After 与没有 Retry-After 一样按指数退避（带抖动）
+    for attempt in range(4):
+        base = min(embedding_client._BACKOFF_BASE * 2 ** attempt, embedding_client._BACKOFF_MAX)
+        delay = _retry_delay(_status_error(500, {"retry-after": "soon"}), attempt)
+        assert base / 2 <= delay <= base
+    assert _retry_delay(_status_error(400), 0) is None
+    assert _retry_delay(ValueError("bad input"), 0) is None
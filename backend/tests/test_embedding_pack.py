@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services.embedding import EmbeddingService
+
+
+def _matrix(rows: int = 5, dims: int = 384) -> np.ndarray:
+    matrix = np.random.default_rng(0).standard_normal((rows, dims)).astype(np.float32)
+    return EmbeddingService.normalize(matrix)
+
+
+def test_float32_round_trip_is_exact():
+    matrix = _matrix()
+    np.testing.assert_array_equal(EmbeddingService.unpack(EmbeddingService.pack(matrix, "float32")), matrix)
+
+
+@pytest.mark.parametrize("precision, atol, ratio", [("float16", 1e-3, 1.9), ("int8", 1e-2, 3.5)])
+def test_reduced_precision_round_trip(precision, atol, ratio):
+    matrix = _matrix()
+    data = EmbeddingService.pack(matrix, precision)
+    restored = EmbeddingService.unpack(data)
+
+    assert restored.dtype == np.float32
+    assert restored.shape == matrix.shape
+    np.testing.assert_allclose(restored, matrix, atol=atol)
+    # 余弦相似度基本不变
+    cosine = np.sum(EmbeddingService.normalize(restored) * matrix, axis=1)
+    assert cosine.min() > 0.999
+    assert len(EmbeddingService.pack(matrix, "float32")) / len(data) >= ratio
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+def test_round_trip_of_edge_cases(precision):
+    empty = np.empty((0, 384), dtype=np.float32)
+    assert EmbeddingService.unpack(EmbeddingService.pack(empty, precision)).shape == (0, 384)
+
+    zeros = np.zeros((2, 8), dtype=np.float32)
+    np.testing.assert_array_equal(EmbeddingService.unpack(EmbeddingService.pack(zeros, precision)), zeros)
+
+
+def test_unknown_precision_falls_back_to_float32():
+    matrix = _matrix(2, 16)
+    np.testing.assert_array_equal(EmbeddingService.unpack(EmbeddingService.pack(matrix, "float64")), matrix)
+
+
+def test_fit_dimension_truncates_and_pads():
+    matrix = _matrix(3, 16)
+    truncated = EmbeddingService.fit_dimension(matrix, 8)
+    assert truncated.shape == (3, 8)
+    np.testing.assert_allclose(np.linalg.norm(truncated, axis=1), 1.0, rtol=1e-5)
+
+    padded = EmbeddingService.fit_dimension(matrix, 20)
+    assert padded.shape == (3, 20)
+    np.testing.assert_array_equal(padded[:, :16], matrix)
+    assert not padded[:, 16:].any()
@@ -0,0 +1,45 @@
+import uuid
+from types import SimpleNamespace
+
+from app.services.plagiarism import PlagiarismService
+
+
+def _doc(text: str, name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=uuid.uuid4(),
+        filename=name,
+        text_content=text,
+        text_hash=PlagiarismService.text_hash(text),
+        content_hash=None,
+    )
+
+
+def test_text_hash_normalizes_width_case_and_whitespace():
+    base = PlagiarismService.text_hash("Hello 世界，ABC 123")
+    assert PlagiarismService.text_hash("ｈｅｌｌｏ世界,abc\n\t１２３") == base
+    assert PlagiarismService.text_hash("hello 世界，abd 123") != base
+    assert PlagiarismService.text_hash("  \n ") is None
+
+
+def test_exact_in_batch_groups_duplicates():
+    a, b, c = _doc("相同的内容", "a"), _doc("相同 的内容 ", "b"), _doc("不同的内容", "c")
+    results = PlagiarismService().find_exact_in_batch([a, b, c])
+    assert [r["document_id"] for r in results[a.id]] == [str(b.id)]
+    assert [r["document_id"] for r in results[b.id]] == [str(a.id)]
+    assert results[c.id] == []
+
+
+def test_duplicates_share_primary_results():
+    primary, copy, other = _doc("甲", "primary"), _doc("甲", "copy"), _doc("乙", "other")
+    results = {
+        primary.id: [{"document_id": str(other.id), "filename": "other", "similarity": 0.8}],
+        other.id: [{"document_id": str(primary.id), "filename": "primary", "similarity": 0.8}],
+    }
+    shared = PlagiarismService.share_with_duplicates(results, {primary.id: [copy]})
+
+    assert [r["document_id"] for r in shared[copy.id]] == [str(other.id)]
+    assert sorted(r["document_id"] for r in shared[other.id]) == sorted([str(primary.id), str(copy.id)])
+    copied = next(r for r in shared[other.id] if r["document_id"] == str(copy.id))
+    assert copied["filename"] == "copy" and copied["similarity"] == 0.8
+    # 不修改原结果
+    assert len(results[other.id]) == 1
@@ -0,0 +1,41 @@
+from app.services import filtered_ann
+from app.services.filtered_ann import MAX_FETCH, initial_fetch, next_fetch
+
+
+def test_initial_fetch_uses_index_when_all_libraries_are_selected():
+    assert initial_fetch(10, 100_000, 100_000) == 10
+
+
+def test_initial_fetch_overfetches_by_selectivity():
+    # 选中 10%：10 / 0.1 × 余量 2
+    assert initial_fetch(10, 10_000, 100_000) == 200
+
+
+def test_initial_fetch_falls_back_to_exact_scan():
+    # 没有可检索文档
+    assert initial_fetch(10, 0, 100_000) is None
+    assert initial_fetch(10, 10, 0) is None
+    # 选中文档很少，精确扫描更便宜
+    assert initial_fetch(10, 4_000, 100_000) is None
+    assert initial_fetch(10, 4_000, 100_000, exact_docs=1_000) == 500
+    # 选中占比过低
+    assert initial_fetch(10, 6_000, 1_000_000) is None
+    # 所需取回量超过 hnsw 上限
+    assert initial_fetch(100, 10_000, 100_000) is None
+
+
+def test_next_fetch_grows_until_the_cap():
+    fetches, fetch = [], 50
+    while fetch is not None:
+        fetches.append(fetch)
+        fetch = next_fetch(fetch)
+    assert fetches == [50, 200, 800, MAX_FETCH]
+
+
+def test_rerank_fetch_and_ef_search():
+    assert filtered_ann.rerank_fetch(100, "full") == 100
+    assert filtered_ann.rerank_fetch(100, "half") == 200
+    assert filtered_ann.rerank_fetch(200, "bit") == MAX_FETCH
+    assert filtered_ann.ef_search(10) == 40
+    assert filtered_ann.ef_search(5_000) == MAX_FETCH
+    assert filtered_ann.index_precision("unknown") == "full"
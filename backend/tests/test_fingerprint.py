@@ -0,0 +1,116 @@
+import math
+import random
+from collections import Counter
+
+import numpy as np
+
+from app.services.fingerprint import ChunkFingerprint, pairwise_scores, pruned_scores, sparse_product
+from app.services.plagiarism import PlagiarismService
+
+# 字表较小，n-gram 重复多，3-gram 计数常大于 1
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 40)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _edited(rng: random.Random, text: str, edits: int) -> str:
+    chars = list(text)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice(_CHARS)
+    return "".join(chars)
+
+
+def _reference_fingerprint(text: str):
+    """字符串 n-gram + Counter 的原始实现"""
+    tokens = PlagiarismService.tokenize(text)
+    bigrams = frozenset(PlagiarismService.ngrams(tokens, 2))
+    trigrams = Counter(PlagiarismService.ngrams(tokens, 3))
+    return bigrams, trigrams, math.sqrt(sum(v * v for v in trigrams.values()))
+
+
+def _reference_similarity(text_a: str, text_b: str) -> float:
+    bigrams_a, counter_a, norm_a = _reference_fingerprint(text_a)
+    bigrams_b, counter_b, norm_b = _reference_fingerprint(text_b)
+    if not bigrams_a or not bigrams_b:
+        return 0.0
+    jaccard = len(bigrams_a & bigrams_b) / len(bigrams_a | bigrams_b)
+    if norm_a == 0 or norm_b == 0:
+        return round(0.4 * jaccard, 4)
+    dot = sum(count * counter_b[gram] for gram, count in counter_a.items())
+    return round(0.4 * jaccard + 0.6 * dot / (norm_a * norm_b), 4)
+
+
+def _fingerprint(text: str) -> ChunkFingerprint:
+    return ChunkFingerprint.from_tokens(PlagiarismService.tokenize(text))
+
+
+def test_hashed_fingerprint_matches_string_ngrams():
+    rng = random.Random(0)
+    for _ in range(200):
+        a = _random_text(rng, rng.randint(1, 300))
+        b = _edited(rng, a, rng.randint(0, 60)) if rng.random() < 0.7 else _random_text(rng, rng.randint(1, 300))
+        assert _fingerprint(a).similarity(_fingerprint(b)) == _reference_similarity(a, b)
+
+
+def test_fingerprint_bytes_round_trip():
+    fp = _fingerprint(_random_text(random.Random(1), 500))
+    restored = ChunkFingerprint.from_bytes(fp.to_bytes())
+    assert restored.similarity(fp) == fp.similarity(fp)
+    assert restored.trigram_norm == fp.trigram_norm
+
+
+def _chunk_fingerprints(rng: random.Random, n: int, source: str):
+    """一半 chunk 改写自 source 的片段，其余随机生成"""
+    texts = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            start = rng.randrange(len(source) - 120)
+            texts.append(_edited(rng, source[start:start + rng.randint(20, 120)], rng.randint(0, 30)))
+        else:
+            texts.append(_random_text(rng, rng.randint(1, 120)))
+    return texts, [_fingerprint(t) for t in texts]
+
+
+def test_pairwise_scores_match_per_pair_similarity():
+    rng = random.Random(2)
+    source = _random_text(rng, 1000)
+    texts_a, fps_a = _chunk_fingerprints(rng, 25, source)
+    texts_b, fps_b = _chunk_fingerprints(rng, 30, source)
+    scores = pairwise_scores(fps_a, fps_b, min_shared=3)
+    for i, a in enumerate(texts_a):
+        for j, b in enumerate(texts_b):
+            shared = len(_reference_fingerprint(a)[0] & _reference_fingerprint(b)[0])
+            expected = _reference_similarity(a, b) if shared >= 3 else 0.0
+            # np.round 与内置 round 在 .5 边界上可能相差一个舍入单位
+            assert abs(scores[i, j] - expected) <= 1e-4 + 1e-9
+    # 分块展开（每块条目上限很小）不影响结果
+    np.testing.assert_array_equal(
+        sparse_product([fp.bigrams for fp in fps_a], [fp.bigrams for fp in fps_b], max_pairs=7),
+        sparse_product([fp.bigrams for fp in fps_a], [fp.bigrams for fp in fps_b]),
+    )
+
+
+def _assert_same_best(pruned: np.ndarray, full: np.ndarray, threshold: float, axis: int):
+    best_full, best_pruned = full.max(axis=axis), pruned.max(axis=axis)
+    above = best_full > threshold
+    np.testing.assert_array_equal(best_pruned[above], best_full[above])
+    np.testing.assert_array_equal(pruned.argmax(axis=axis)[above], full.argmax(axis=axis)[above])
+    # 剪枝只会把得分记为 0，不会改变被计算的得分
+    scored = pruned > 0
+    np.testing.assert_array_equal(pruned[scored], full[scored])
+
+
+def test_pruned_scores_keep_every_best_match():
+    for seed in range(6):
+        rng = random.Random(seed)
+        source = _random_text(rng, 1000)
+        _, fps_a = _chunk_fingerprints(rng, 40, source)
+        _, fps_b = _chunk_fingerprints(rng, 35, source)
+        full = pairwise_scores(fps_a, fps_b)
+        for threshold in (0.1, 0.3, 0.6):
+            _assert_same_best(pruned_scores(fps_a, fps_b, threshold), full, threshold, axis=1)
+            both = pruned_scores(fps_a, fps_b, threshold, both=True, max_pairs=50)
+            _assert_same_best(both, full, threshold, axis=1)
+            _assert_same_best(both, full, threshold, axis=0)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from app.services import local_embedding
+from app.services.local_embedding import DIM, LocalEmbedder
+
+
+def test_embeddings_are_normalized_float32():
+    vectors = LocalEmbedder().embed(["论文查重系统", "plagiarism detection", ""])
+    assert vectors.shape == (3, DIM)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:2], axis=1), 1.0, rtol=1e-5)
+    # 空文本为零向量
+    assert not vectors[2].any()
+
+
+def test_embeddings_are_deterministic(monkeypatch):
+    texts = ["同一段文本在任何进程中得到相同向量", "another chunk"]
+    first = LocalEmbedder().embed(texts)
+    # 重新生成投影矩阵（相当于新进程）结果不变
+    monkeypatch.setattr(local_embedding, "_projection", None)
+    second = LocalEmbedder().embed(texts)
+    np.testing.assert_array_equal(first, second)
+
+
+def test_formatting_differences_do_not_change_the_vector():
+    a, b = LocalEmbedder().embed(["ＡＢＣ  文本\n查重", "abc 文本 查重"])
+    np.testing.assert_array_equal(a, b)
+
+
+def test_similar_texts_are_closer_than_unrelated_texts():
+    base, near, far = LocalEmbedder().embed([
+        "深度学习在自然语言处理中的应用研究",
+        "深度学习在自然语言处理领域的应用研究",
+        "今天天气晴朗适合去公园散步",
+    ])
+    assert base @ near > base @ far
@@ -0,0 +1,35 @@
+import numpy as np
+
+from app.services.minhash import NUM_BANDS, NUM_PERM, MinHashLSH
+from app.services.plagiarism import PlagiarismService
+
+TEXT = "随着深度学习的发展，自然语言处理技术在文本相似度计算、机器翻译和问答系统等领域取得了显著进展。" * 3
+EDITED = TEXT.replace("显著进展", "长足进步")
+OTHER = "本文讨论城市交通规划中的公共自行车系统布局问题，并给出基于需求预测的站点选址方法。" * 3
+
+
+def _shared_bands(a, b) -> int:
+    return len(set(a) & set(b))
+
+
+def test_minhash_signature_and_band_keys():
+    signature = PlagiarismService.minhash_signature(TEXT)
+    assert signature.dtype == np.uint32
+    assert signature.size == NUM_PERM
+
+    keys = MinHashLSH.band_keys(signature)
+    assert [band for band, _ in keys] == list(range(NUM_BANDS))
+    assert keys == MinHashLSH.band_keys(PlagiarismService.minhash_signature(TEXT))
+
+
+def test_minhash_near_duplicates_share_more_buckets():
+    base = MinHashLSH.band_keys(PlagiarismService.minhash_signature(TEXT))
+    edited = MinHashLSH.band_keys(PlagiarismService.minhash_signature(EDITED))
+    other = MinHashLSH.band_keys(PlagiarismService.minhash_signature(OTHER))
+    assert _shared_bands(base, edited) > _shared_bands(base, other)
+    assert _shared_bands(base, edited) > 0
+
+
+def test_minhash_bytes_round_trip():
+    signature = PlagiarismService.minhash_signature(TEXT)
+    np.testing.assert_array_equal(MinHashLSH.from_bytes(MinHashLSH.to_bytes(signature)), signature)
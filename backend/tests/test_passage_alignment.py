@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+
+from app.services.passage_alignment import MIN_PASSAGE_TOKENS, _adjacent_lcp, _suffix_array, find_common_passages
+from app.services.plagiarism import PlagiarismService
+
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _brute_force_passages(a: list, b: list, min_length: int) -> set:
+    """逐对起点比较的极大公共片段（左右都不能再扩展）"""
+    found = set()
+    for i in range(len(a)):
+        for j in range(len(b)):
+            if i and j and a[i - 1] == b[j - 1]:
+                continue
+            length = 0
+            while i + length < len(a) and j + length < len(b) and a[i + length] == b[j + length]:
+                length += 1
+            if length >= min_length:
+                found.add((i, j, length))
+    return found
+
+
+def test_suffix_array_and_lcp_match_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        seq = rng.integers(0, rng.integers(1, 5), size=int(rng.integers(1, 80))).astype(np.int64)
+        values = seq.tolist()
+        sa = _suffix_array(seq)
+        assert sa.tolist() == sorted(range(len(values)), key=lambda i: values[i:])
+        lcp = _adjacent_lcp(seq, sa).tolist()
+        for r, (x, y) in enumerate(zip(sa[:-1].tolist(), sa[1:].tolist())):
+            h = 0
+            while x + h < len(values) and y + h < len(values) and values[x + h] == values[y + h]:
+                h += 1
+            assert lcp[r] == h
+
+
+def test_common_passages_match_brute_force():
+    rng = np.random.default_rng(1)
+    for _ in range(30):
+        a = rng.integers(0, 10_000, size=200)
+        b = rng.integers(0, 10_000, size=180)
+        # 植入若干互不重叠的公共片段（长度跨过最小长度）
+        for k, length in enumerate(rng.integers(10, 40, size=3).tolist()):
+            start_a, start_b = 60 * k, 55 * k + int(rng.integers(0, 10))
+            b[start_b:start_b + length] = a[start_a:start_a + length]
+        expected = _brute_force_passages(a.tolist(), b.tolist(), MIN_PASSAGE_TOKENS)
+        assert set(find_common_passages(a, b)) == expected
+
+
+def test_min_length_boundary():
+    rng = np.random.default_rng(2)
+    a, b = rng.integers(0, 10_000, size=100), rng.integers(10_000, 20_000, size=100)
+    b[30:30 + MIN_PASSAGE_TOKENS - 1] = a[50:50 + MIN_PASSAGE_TOKENS - 1]
+    assert find_common_passages(a, b) == []
+    b[30:30 + MIN_PASSAGE_TOKENS] = a[50:50 + MIN_PASSAGE_TOKENS]
+    assert find_common_passages(a, b) == [(50, 30, MIN_PASSAGE_TOKENS)]
+    assert find_common_passages(a[:MIN_PASSAGE_TOKENS - 1], b) == []
+
+
+def test_aligned_passages_report_character_offsets():
+    rng = random.Random(3)
+    passage = "Deep learning 模型" + _random_text(rng, 40)
+    text_a = _random_text(rng, 100) + " " + passage + "，" + _random_text(rng, 30)
+    text_b = "前言：" + _random_text(rng, 60) + "\n" + passage + "。" + _random_text(rng, 80)
+    passages = PlagiarismService().align_passages(text_a, text_b)
+    assert len(passages) == 1
+    found = passages[0]
+    assert text_a[found["source_start"]:found["source_end"]] == passage
+    assert text_b[found["target_start"]:found["target_end"]] == passage
+    assert found["length"] == len(PlagiarismService.tokenize(passage))
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.services.fingerprint import ChunkFingerprint
+from app.services.plagiarism import PlagiarismService
+from app.services.simhash import BITS, MAX_DISTANCE, NUM_BANDS, SimHash
+
+TEXT = "随着深度学习的发展，自然语言处理技术在文本相似度计算、机器翻译和问答系统等领域取得了显著进展。" * 3
+EDITED = TEXT.replace("显著进展", "长足进步")
+OTHER = "本文讨论城市交通规划中的公共自行车系统布局问题，并给出基于需求预测的站点选址方法。" * 3
+
+
+def test_simhash_bands_reassemble_the_signature():
+    signature = SimHash.from_fingerprint(ChunkFingerprint.from_tokens(PlagiarismService.tokenize(TEXT)))
+    bands = SimHash.bands(signature)
+    assert len(bands) == NUM_BANDS
+    assert all(0 <= band < 1 << (BITS // NUM_BANDS) for band in bands)
+    assert sum(band << (16 * i) for i, band in enumerate(bands)) == signature
+
+
+def test_simhash_close_signatures_share_a_band():
+    # 汉明距离不超过 MAX_DISTANCE 的两个签名至少有一个 band 相同
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        signature = int(rng.integers(0, 1 << 63)) << 1 | int(rng.integers(0, 2))
+        flipped = signature
+        for bit in rng.choice(BITS, size=MAX_DISTANCE, replace=False):
+            flipped ^= 1 << int(bit)
+        assert SimHash.hamming(signature, flipped) == MAX_DISTANCE
+        assert any(a == b for a, b in zip(SimHash.bands(signature), SimHash.bands(flipped)))
+
+
+def test_simhash_near_duplicates_are_close():
+    def simhash(text):
+        return SimHash.from_fingerprint(ChunkFingerprint.from_tokens(PlagiarismService.tokenize(text)))
+
+    base = simhash(TEXT)
+    assert SimHash.hamming(base, simhash(EDITED)) < SimHash.hamming(base, simhash(OTHER))
+
+
+def test_simhash_db_round_trip():
+    for signature in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        stored = SimHash.to_db(signature)
+        assert -(1 << 63) <= stored < 1 << 63
+        assert SimHash.from_db(stored) == signature
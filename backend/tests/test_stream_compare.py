@@ -0,0 +1,48 @@
+import random
+
+from app.services import stream_compare
+from app.services.plagiarism import PlagiarismService
+
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _documents(rng: random.Random):
+    """B 中混入 A 的若干段落（部分改写），其余为随机内容"""
+    text_a = _random_text(rng, 30_000)
+    parts = []
+    for _ in range(12):
+        start = rng.randrange(len(text_a) - 1500)
+        copied = list(text_a[start:start + rng.randint(300, 1500)])
+        for _ in range(rng.randint(0, 30)):
+            copied[rng.randrange(len(copied))] = rng.choice(_CHARS)
+        parts.extend(["".join(copied), _random_text(rng, rng.randint(200, 2000))])
+    return text_a, "".join(parts)
+
+
+def test_streaming_matches_whole_document_compare(monkeypatch):
+    rng = random.Random(0)
+    text_a, text_b = _documents(rng)
+    service = PlagiarismService()
+
+    monkeypatch.setattr(stream_compare.settings, "COMPARE_MEMORY_LIMIT_MB", 0)
+    assert not stream_compare.needs_streaming(len(text_a), len(text_b))
+    whole = service.text_chunk_compare(text_a, text_b)
+    assert whole["matches"]
+
+    monkeypatch.setattr(stream_compare.settings, "COMPARE_MEMORY_LIMIT_MB", 1)
+    assert stream_compare.needs_streaming(len(text_a), len(text_b))
+    n_index = len(service.split_chunks(text_b))
+    assert stream_compare.block_rows(n_index) < len(service.split_chunks(text_a))
+    assert service.text_chunk_compare(text_a, text_b) == whole
+
+
+def test_blocks_keep_order_and_offsets():
+    items = list(range(10))
+    blocks = list(stream_compare.blocks(iter(items), 3))
+    assert [offset for offset, _ in blocks] == [0, 3, 6, 9]
+    assert [x for _, block in blocks for x in block] == items
+    assert list(stream_compare.blocks(iter([]), 3)) == []
@@ -0,0 +1,83 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.plagiarism import CHUNK_HITS_PER_QUERY, VECTOR_QUERY_CHUNKS, PlagiarismService
+from app.services.retrieval_pipeline import PipelineConfig
+
+LIBRARY_ID = uuid.uuid4()
+SOURCE_ID = uuid.uuid4()
+
+
+class FakeSession:
+    """模拟 chunk 级近邻 SQL：每个查询 chunk 的近邻由 neighbours(序号) 给出，再按文档聚合"""
+
+    def __init__(self, neighbours):
+        self.neighbours = neighbours
+        self.query_sizes = []
+        self.offset = 0
+
+    async def execute(self, statement, params):
+        vectors = params["vectors"]
+        self.query_sizes.append(len(vectors))
+        best, covered = {}, {}
+        for ordinal in range(self.offset, self.offset + len(vectors)):
+            for doc_id, cosine in self.neighbours(ordinal)[:params["per_chunk"]]:
+                best[doc_id] = max(best.get(doc_id, 0.0), cosine)
+                covered[doc_id] = covered.get(doc_id, 0) + 1
+        self.offset += len(vectors)
+        rows = [(d, LIBRARY_ID, f"{d}.txt", "lib", best[d], covered[d]) for d in best]
+        rows.sort(key=lambda r: r[4] * r[5], reverse=True)
+        return SimpleNamespace(fetchall=lambda: rows[:params["top_k"]])
+
+
+def _service() -> PlagiarismService:
+    service = PlagiarismService()
+
+    async def exact_scan(session, lib_id_list, per_query, top_k, exact_docs, count_query, run):
+        return await run(None)
+
+    service._filtered_ann = exact_scan
+    return service
+
+
+def test_short_source_inside_long_submission_passes_the_vector_threshold():
+    # 长文档（300 个 chunk）中只有 3 个 chunk 抄自文档库中的一篇短文档，其余 chunk 命中各不相同的无关文档
+    n_chunks = 300
+    copied = {120, 121, 122}
+
+    def neighbours(ordinal):
+        if ordinal in copied:
+            return [(SOURCE_ID, 0.95)]
+        return [(f"noise-{ordinal}", 0.3)]
+
+    session = FakeSession(neighbours)
+    embeddings = np.ones((n_chunks, 8), dtype=np.float32)
+    found = asyncio.run(_service()._chunk_vector_search(session, embeddings, [LIBRARY_ID], top_k=20))
+
+    # 所有 chunk 都参与查询（分批），不抽样跳过
+    assert sum(session.query_sizes) == n_chunks
+    assert max(session.query_sizes) <= VECTOR_QUERY_CHUNKS
+    # 抄袭来源排在最前，得分为最相似 chunk 的余弦，不被查询 chunk 总数稀释
+    assert found[0][0] == SOURCE_ID
+    assert found[0][5] == 0.95
+    assert found[0][5] >= PipelineConfig.from_layers()["vector"].threshold
+
+
+def test_chunk_hits_are_merged_across_query_batches():
+    # 来源文档在每一批查询中都有命中，合并后覆盖数累加，最相似余弦取最大
+    n_chunks = VECTOR_QUERY_CHUNKS * 2 + 10
+
+    def neighbours(ordinal):
+        return [(SOURCE_ID, 0.5 + ordinal / (2 * n_chunks)), ("other", 0.9 if ordinal == 0 else 0.1)]
+
+    session = FakeSession(neighbours)
+    found = asyncio.run(_service()._chunk_vector_search(
+        session, np.ones((n_chunks, 8), dtype=np.float32), [LIBRARY_ID], top_k=5
+    ))
+    assert len(session.query_sizes) == 3
+    assert [c[0] for c in found] == [SOURCE_ID, "other"]
+    assert found[0][5] == 0.5 + (n_chunks - 1) / (2 * n_chunks)
+    assert CHUNK_HITS_PER_QUERY >= 2
@@ -0,0 +1,49 @@
+import random
+
+from app.services.fingerprint import ChunkFingerprint
+from app.services.plagiarism import PlagiarismService
+from app.services.whitelist_index import WhitelistIndex
+
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 200)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _edited(rng: random.Random, text: str, edits: int) -> str:
+    chars = list(text)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice(_CHARS)
+    return "".join(chars)
+
+
+def _fingerprint(text: str) -> ChunkFingerprint:
+    return ChunkFingerprint.from_tokens(PlagiarismService.tokenize(text))
+
+
+def test_index_matches_linear_scan():
+    rng = random.Random(0)
+    entries = [_random_text(rng, rng.randint(5, 200)) for _ in range(60)]
+    fingerprints = [_fingerprint(e) for e in entries] + [ChunkFingerprint.empty()]
+    index = WhitelistIndex(fingerprints)
+    assert len(index) == len(entries)
+
+    for _ in range(200):
+        if rng.random() < 0.6:
+            query = _edited(rng, rng.choice(entries), rng.randint(0, 40))
+        else:
+            query = _random_text(rng, rng.randint(1, 200))
+        fp = _fingerprint(query)
+        for threshold in (0.3, 0.6, 0.75, 0.9):
+            expected = any(fp.similarity(w) >= threshold for w in fingerprints)
+            assert index.match(fp, threshold) == expected
+
+
+def test_service_whitelist_check():
+    rng = random.Random(1)
+    template = _random_text(rng, 300)
+    service = PlagiarismService(whitelist_fingerprints=[_fingerprint(template)])
+    assert service._is_whitelisted(_edited(rng, template, 5))
+    assert not service._is_whitelisted(_random_text(rng, 300))
+    assert not PlagiarismService()._is_whitelisted(template)
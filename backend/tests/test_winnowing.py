@@ -0,0 +1,65 @@
+import random
+
+import numpy as np
+
+from app.services.fingerprint import hash_tokens
+from app.services.plagiarism import PlagiarismService
+from app.services.winnowing import K, WINDOW, kgram_hashes
+
+_CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+def _reference_winnow(hashes: list) -> list:
+    """逐窗口的稳健 winnowing：取最右侧的最小值，与上一次选中位置相同则不重复记录"""
+    if len(hashes) <= WINDOW:
+        return [max(i for i, h in enumerate(hashes) if h == min(hashes))] if hashes else []
+    selected = []
+    for start in range(len(hashes) - WINDOW + 1):
+        window = hashes[start:start + WINDOW]
+        pos = start + max(i for i, h in enumerate(window) if h == min(window))
+        if not selected or selected[-1] != pos:
+            selected.append(pos)
+    return selected
+
+
+def test_selected_positions_match_reference():
+    rng = random.Random(0)
+    # 小字表制造重复哈希，检验并列时取最右侧
+    small = _CHARS[:3]
+    for _ in range(200):
+        text = "".join(rng.choice(small) for _ in range(rng.randint(1, 60)))
+        tokens, spans = PlagiarismService.tokenize_with_spans(text)
+        fp = PlagiarismService.winnow(text)
+        hashes = kgram_hashes(hash_tokens(tokens)).tolist()
+        expected = _reference_winnow(hashes)
+        assert fp.positions.tolist() == expected
+        assert fp.hashes.tolist() == [hashes[p] for p in expected]
+
+
+def test_copied_passage_found_with_offsets():
+    rng = random.Random(1)
+    service = PlagiarismService()
+    for length in (WINDOW + K - 1 + 10, 60, 300):
+        passage = _random_text(rng, length)
+        text_a = _random_text(rng, 400) + passage + _random_text(rng, 200)
+        text_b = _random_text(rng, 150) + passage + _random_text(rng, 500)
+        result = service.winnowing_compare(text_a, text_b)
+        assert result["matches"]
+        for match in result["matches"]:
+            source = text_a[match["source_start"]:match["source_end"]]
+            assert source == text_b[match["target_start"]:match["target_end"]]
+            assert source in passage
+        covered = sum(m["source_end"] - m["source_start"] for m in result["matches"])
+        assert covered >= length - 2 * (K + WINDOW)
+
+
+def test_unrelated_texts_have_no_passages():
+    rng = random.Random(2)
+    service = PlagiarismService()
+    result = service.winnowing_compare(_random_text(rng, 2000), _random_text(rng, 2000))
+    assert result == {"score": 0.0, "matches": []}
+    np.testing.assert_array_equal(service.winnow("").positions, np.empty(0, dtype=np.int64))
@@ -22,6 +22,7 @@ const UploadForm = () => {
     const [analysisType, setAnalysisType] = useState('plagiarism');
     const [aiThreshold, setAiThreshold] = useState(0.5);
     const [compareMode, setCompareMode] = useState('library');
+    const [compareStrategy, setCompareStrategy] = useState('chunk');
     const [libraries, setLibraries] = useState<Library[]>([]);
     const [selectedLibraryIds, setSelectedLibraryIds] = useState<string[]>([]);
     const [whitelists, setWhitelists] = useState<WhitelistCollection[]>([]);
@@ -101,6 +102,7 @@ const UploadForm = () => {
         formData.append('library_ids', JSON.stringify(selectedLibraryIds));
         formData.append('whitelist_ids', JSON.stringify(selectedWhitelistIds));
         formData.append('compare_mode', compareMode);
+        formData.append('compare_strategy', compareStrategy);
 
         try {
             const token = localStorage.getItem('token');
@@ -209,6 +211,41 @@ const UploadForm = () => {
                         </div>
                     )}
 
+                    {/* Compare Strategy */}
+                    {(analysisType === 'plagiarism' || analysisType === 'both') && (
+                        <div>
+                            <label style={{ display: 'block', marginBottom: '20px', fontSize: '16px', fontWeight: 700, color: 'white', letterSpacing: '0.05em', textTransform: 'uppercase' }}>
+                                比对算法
+                            </label>
+                            <div style={{ display: 'grid', gridTemplateColumns: 'repeat(2, 1fr)', gap: '20px' }}>
+                                {[
+                                    { id: 'chunk', label: '分块相似度', desc: '固定分块 n-gram 相似度对比' },
+                                    { id: 'winnowing', label: '指纹片段匹配', desc: 'Winnowing 指纹，定位跨分块的复制片段' },
+                                ].map(strategy => (
+                                    <label key={strategy.id} style={{ cursor: 'pointer' }}>
+                                        <input
+                                            type="radio"
+                                            name="compareStrategy"
+                                            value={strategy.id}
+                                            checked={compareStrategy === strategy.id}
+                                            onChange={(e) => setCompareStrategy(e.target.value)}
+                                            style={{ display: 'none' }}
+                                        />
+                                        <div className={`glass card-hover ${compareStrategy === strategy.id ? 'active-card' : ''}`} style={{
+                                            textAlign: 'center',
+                                            padding: '20px 16px',
+                                            borderRadius: '16px',
+                                            transition: 'var(--transition)'
+                                        }}>
+                                            <span style={{ fontSize: '14px', fontWeight: 700 }}>{strategy.label}</span>
+                                            <p style={{ fontSize: '12px', color: 'var(--text-muted)', marginTop: '6px' }}>{strategy.desc}</p>
+                                        </div>
+                                    </label>
+                                ))}
+                            </div>
+                        </div>
+                    )}
+
                     {/* Library Selector */}
                     {(analysisType === 'plagiarism' || analysisType === 'both') && compareMode !== 'internal' && (
                         <div>
@@ -70,6 +70,8 @@ SYNC_DATABASE_URL=postgresql+psycopg2://user:password@db:5432/plagiarism_db
 REDIS_URL=redis://redis:6379/0
 CELERY_BROKER_URL=redis://redis:6379/0
 CELERY_RESULT_BACKEND=redis://redis:6379/0
+# chunk 向量缓存（独立的 LRU Redis，留空则只用进程内缓存）
+EMBEDDING_CACHE_URL=redis://embedding-cache:6379/0
 
 # ===== MinIO / S3 =====
 S3_ENDPOINT_URL=http://minio:9000